@@ -5,6 +5,7 @@ import {
   AutocompletionData,
   BranchInfo,
   ClearTaskData,
+  CommitDiff,
   ContextInfoData,
   CloudflareTunnelStatus,
   CommandOutputData,
@@ -134,6 +135,7 @@ export interface ApplicationAPI {
   getAllFiles: (baseDir: string, taskId: string, useGit?: boolean) => Promise<string[]>;
   refreshContextFiles: (baseDir: string, taskId: string) => Promise<void>;
   getUpdatedFiles: (baseDir: string, taskId: string) => Promise<UpdatedFile[]>;
+  requestCommitDiff: (baseDir: string, taskId: string, commitHash: string, path?: string) => Promise<CommitDiff>;
   addFileToGit: (baseDir: string, taskId: string, filePath: string) => Promise<void>;
   restoreFile: (baseDir: string, taskId: string, filePath: string) => Promise<void>;
   readFile: (baseDir: string, taskId: string, filePath: string) => Promise<string>;
@@ -18,7 +18,7 @@ import {
 } from '@common/agent';
 import { z } from 'zod';
 
-import { ContextFile, ContextMemoryMode, ContextMessage, PromptContext, UsageReportData } from './context';
+import { CommitDiffFile, ContextFile, ContextMemoryMode, ContextMessage, PromptContext, UsageReportData } from './context';
 
 // Worktree schema definition
 export const WorktreeSchema = z.object({
@@ -115,6 +115,8 @@ export const DEFAULT_AUTONOMY_MODE = AutonomyMode.Guided;
 export interface AiderRunOptions {
   autoApprove?: boolean;
   denyCommands?: boolean;
+  /** Seconds to wait for an answer to an Aider confirmation question before declining it */
+  questionTimeout?: number;
 }
 
 export type EditFormat = 'diff' | 'diff-fenced' | 'whole' | 'udiff' | 'udiff-simple' | 'patch';
@@ -241,6 +243,7 @@ export interface ResponseCompletedData {
   commitHash?: string;
   commitMessage?: string;
   diff?: string;
+  diffFiles?: CommitDiffFile[];
   usageReport?: UsageReportData;
   sequenceNumber?: number;
   promptContext?: PromptContext;
@@ -348,6 +351,7 @@ export interface Answer {
 export interface QuestionData {
   baseDir: string;
   taskId: string;
+  questionId?: string;
   text: string;
   subject?: string;
   isGroupQuestion?: boolean;
@@ -153,6 +153,18 @@ export interface ContextUserMessage extends BaseContextMessage {
   content: UserContent;
 }
 
+export interface CommitDiffFile {
+  path: string;
+  // null for binary files
+  added: number | null;
+  removed: number | null;
+}
+
+export interface CommitDiff {
+  diff: string;
+  truncated: boolean;
+}
+
 // Assistant message with full response metadata
 export interface ContextAssistantMessage extends BaseContextMessage {
   role: 'assistant';
@@ -162,6 +174,7 @@ export interface ContextAssistantMessage extends BaseContextMessage {
   commitHash?: string;
   commitMessage?: string;
   diff?: string;
+  diffFiles?: CommitDiffFile[];
 }
 
 // Tool message with usage report
@@ -1,5 +1,5 @@
 import { TaskData, TokensInfoData } from './common';
-import { PromptContext, UsageReportData, Group } from './context';
+import { CommitDiffFile, PromptContext, UsageReportData, Group } from './context';
 
 export interface Message {
   id: string;
@@ -20,6 +20,11 @@ export interface ResponseMessage extends Message {
   reasoning?: string;
   usageReport?: UsageReportData;
   finished?: boolean;
+  commitHash?: string;
+  commitMessage?: string;
+  // only set when the commit diff was small enough to be sent with the response
+  diff?: string;
+  diffFiles?: CommitDiffFile[];
 }
 
 export interface ReflectedMessage extends Message {
@@ -0,0 +1,117 @@
+"""Micro-benchmark of `clone_coder`, with and without the coder template pool.
+
+Builds a throw-away git repository, creates a base coder in it the way the connector
+does, then clones it the way a prompt and an architect->editor handoff do and reports
+the clone time per iteration.
+
+  python benchmarks/bench_clone_coder.py --iterations 50 --files 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from aider import models  # noqa: E402
+from aider.coders import Coder  # noqa: E402
+from aider.io import InputOutput  # noqa: E402
+from aider.repo import GitRepo  # noqa: E402
+
+from connector import Connector, CoderTemplatePool, PromptContext, TrackedFileIndex, clone_coder, create_io  # noqa: E402
+from sample_repo import create_sample_repo  # noqa: E402
+
+
+class BenchConnector:
+  """The parts of Connector that clone_coder uses, without the Socket.IO client."""
+
+  confirm_before_edit = False
+  tags_cache = None
+  monkey_patch_coder_functions = Connector.monkey_patch_coder_functions
+  monkey_patch_repo_functions = Connector.monkey_patch_repo_functions
+
+  def __init__(self, coder, task_dir, pool):
+    self.coder = coder
+    self.task_dir = task_dir
+    self.coder_pool = pool
+    self.file_index = TrackedFileIndex()
+
+  def post_log_message(self, level, message, finished=False, prompt_context=None):
+    pass
+
+
+def create_connector(root, model_name, pool):
+  io = InputOutput(pretty=False, yes=True, fancy_input=False)
+  main_model = models.Model(model_name)
+  repo = GitRepo(io, [], root, models=main_model.commit_message_models())
+  coder = Coder.create(main_model=main_model, io=io, repo=repo, map_tokens=1024, stream=True, auto_commits=False)
+  connector = BenchConnector(coder, root, pool)
+  create_io(connector, coder)
+  return connector
+
+
+def measure(connector, iterations, files, editor):
+  messages = [
+    {"role": "user", "content": "Rename helper0 to build_model0"},
+    {"role": "assistant", "content": "Done."},
+  ]
+  timings = []
+  for _ in range(iterations):
+    prompt_context = PromptContext(str(uuid.uuid4()))
+    started = time.perf_counter()
+    coder = clone_coder(connector, connector.coder, prompt_context, messages, files)
+    if editor:
+      clone_coder(
+        connector,
+        coder,
+        PromptContext(str(uuid.uuid4())),
+        main_model=coder.main_model,
+        edit_format=coder.edit_format,
+        suggest_shell_commands=False,
+        map_tokens=0,
+        total_cost=coder.total_cost,
+        cache_prompts=False,
+        num_cache_warming_pings=0,
+      )
+    timings.append((time.perf_counter() - started) * 1000)
+  return timings
+
+
+def report(name, timings):
+  timings = sorted(timings)
+  p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+  print(f"{name:<24} mean {statistics.mean(timings):8.2f} ms   median {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--iterations", type=int, default=30)
+  parser.add_argument("--files", type=int, default=100, help="files in the sample repository")
+  parser.add_argument("--context-files", type=int, default=5, help="files added to each prompt")
+  parser.add_argument("--model", default="gpt-4o-mini")
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as root:
+    create_sample_repo(root, args.files)
+    files = [{"path": f"pkg{index % 10}/module{index}.py", "readOnly": index % 2 == 1} for index in range(args.context_files)]
+
+    for editor in (False, True):
+      scenario = "prompt + editor" if editor else "prompt"
+      without_pool = measure(create_connector(root, args.model, None), args.iterations, files, editor)
+      pool = CoderTemplatePool()
+      with_pool = measure(create_connector(root, args.model, pool), args.iterations, files, editor)
+
+      print(f"{scenario} ({args.iterations} iterations, {args.files} repo files)")
+      report("  Coder.create", without_pool)
+      report("  template pool", with_pool)
+      report("  template pool, warm", with_pool[1:] if len(with_pool) > 1 else with_pool)
+      print(f"  pool hits {pool.hits}, misses {pool.misses}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,354 @@
+"""Offline end-to-end benchmark of the connector.
+
+Runs, in this process, a python-socketio server standing in for AiderDesk and an OpenAI
+compatible chat completions endpoint that streams canned tokens at a configurable rate.
+The connector is started as a subprocess the way AiderDesk starts it, pointed at both
+through CONNECTOR_SERVER_URL and OPENAI_API_BASE, so nothing leaves localhost.
+
+Reported per scenario:
+  - time to first response chunk and end-to-end latency of sequential prompts
+  - response chunks/sec as emitted by the connector (after coalescing)
+  - latency of request-context-info until the token numbers and the repo map arrive
+  - per-prompt latency and wall time of N prompts sent at once
+
+  python benchmarks/bench_connector_e2e.py --prompts 10 --concurrency 4 --tokens 400 --token-rate 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import socketio
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sample_repo import create_sample_repo  # noqa: E402
+
+CONNECTOR_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+
+def bind_local_socket():
+  sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  sock.bind(("127.0.0.1", 0))
+  return sock
+
+
+class FakeLLM:
+  """OpenAI compatible /v1/chat/completions endpoint streaming canned tokens."""
+
+  def __init__(self, tokens, token_rate, first_token_delay):
+    self.tokens = [f"word{index % 50} " for index in range(tokens)]
+    self.token_interval = 1 / token_rate if token_rate > 0 else 0
+    self.first_token_delay = first_token_delay
+    self.requests = 0
+
+  def create_app(self):
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", self.handle_completions)
+    app.router.add_post("/chat/completions", self.handle_completions)
+    return app
+
+  def chunk(self, completion_id, model, delta, finish_reason=None):
+    return {
+      "id": completion_id,
+      "object": "chat.completion.chunk",
+      "created": int(time.time()),
+      "model": model,
+      "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+  def usage(self, body):
+    prompt_tokens = sum(len(str(message.get("content", ""))) // 4 for message in body.get("messages", []))
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(self.tokens), "total_tokens": prompt_tokens + len(self.tokens)}
+
+  async def handle_completions(self, request):
+    body = await request.json()
+    self.requests += 1
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get("model", "fake")
+
+    if not body.get("stream"):
+      await asyncio.sleep(self.first_token_delay + self.token_interval * len(self.tokens))
+      return web.json_response({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(self.tokens)}, "finish_reason": "stop"}],
+        "usage": self.usage(body),
+      })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    async def send(data):
+      await response.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    await asyncio.sleep(self.first_token_delay)
+    await send(self.chunk(completion_id, model, {"role": "assistant", "content": ""}))
+    for token in self.tokens:
+      await send(self.chunk(completion_id, model, {"content": token}))
+      if self.token_interval:
+        await asyncio.sleep(self.token_interval)
+    final = self.chunk(completion_id, model, {}, "stop")
+    final["usage"] = self.usage(body)
+    await send(final)
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+class PromptStats:
+  def __init__(self, prompt_id):
+    self.prompt_id = prompt_id
+    self.sent_at = time.perf_counter()
+    self.first_chunk_at = None
+    self.last_chunk_at = None
+    self.chunks = 0
+    self.finished = asyncio.get_running_loop().create_future()
+
+  @property
+  def time_to_first_chunk(self):
+    return (self.first_chunk_at - self.sent_at) * 1000 if self.first_chunk_at else None
+
+  @property
+  def chunks_per_second(self):
+    if self.chunks < 2 or self.last_chunk_at == self.first_chunk_at:
+      return None
+    return (self.chunks - 1) / (self.last_chunk_at - self.first_chunk_at)
+
+
+class FakeAiderDesk:
+  """Socket.IO server playing the AiderDesk side of the connector protocol."""
+
+  def __init__(self):
+    self.sio = socketio.AsyncServer(async_mode="aiohttp")
+    self.sid = None
+    self.connected = asyncio.Event()
+    self.prompts = {}
+    self.context_waiters = []
+    self.messages = 0
+    self.logs = 0
+
+    self.sio.on("message", self.on_message)
+    self.sio.on("log", self.on_log)
+
+  def create_app(self):
+    app = web.Application()
+    self.sio.attach(app)
+    return app
+
+  async def on_log(self, sid, data):
+    self.logs += 1
+
+  async def on_message(self, sid, data):
+    now = time.perf_counter()
+    self.messages += 1
+    action = data.get("action")
+
+    if action == "init":
+      self.sid = sid
+      self.connected.set()
+
+    elif action == "response":
+      stats = self.prompts.get((data.get("promptContext") or {}).get("id"))
+      if stats and not data.get("finished") and (data.get("content") or data.get("reasoning")):
+        stats.chunks += 1
+        stats.first_chunk_at = stats.first_chunk_at or now
+        stats.last_chunk_at = now
+
+    elif action == "prompt-finished":
+      stats = self.prompts.get(data.get("promptId"))
+      if stats and not stats.finished.done():
+        stats.finished.set_result(now)
+
+    elif action == "tokens-info":
+      info = data.get("info") or {}
+      for waiter in self.context_waiters:
+        waiter(info, now)
+
+    elif action == "ask-question":
+      await self.emit({"action": "answer-question", "questionId": data.get("questionId"), "answer": "y"})
+
+  async def emit(self, message):
+    await self.sio.emit("message", message, to=self.sid)
+
+  async def send_prompt(self, prompt, mode):
+    prompt_id = str(uuid.uuid4())
+    stats = PromptStats(prompt_id)
+    self.prompts[prompt_id] = stats
+    await self.emit({
+      "action": "prompt",
+      "prompt": prompt,
+      "mode": mode,
+      "architectModel": None,
+      "promptContext": {"id": prompt_id},
+      "messages": [],
+      "files": [],
+      "options": {"autoApprove": True},
+    })
+    return stats
+
+  async def request_context_info(self, files, timeout):
+    """Returns (token numbers latency, repo map latency) in ms of one request-context-info."""
+    loop = asyncio.get_running_loop()
+    tokens_future = loop.create_future()
+    repo_map_future = loop.create_future()
+
+    def waiter(info, now):
+      if "files" in info and not tokens_future.done():
+        tokens_future.set_result(now)
+      if "repoMap" in info and not repo_map_future.done():
+        repo_map_future.set_result(now)
+
+    self.context_waiters.append(waiter)
+    try:
+      started = time.perf_counter()
+      await self.emit({"action": "request-context-info", "messages": [], "files": files})
+      tokens_at, repo_map_at = await asyncio.wait_for(asyncio.gather(tokens_future, repo_map_future), timeout)
+      return (tokens_at - started) * 1000, (repo_map_at - started) * 1000
+    finally:
+      self.context_waiters.remove(waiter)
+
+
+async def start_site(app):
+  runner = web.AppRunner(app)
+  await runner.setup()
+  sock = bind_local_socket()
+  site = web.SockSite(runner, sock)
+  await site.start()
+  return runner, sock.getsockname()[1]
+
+
+def connector_env(root, desk_port, llm_port, args):
+  env = {
+    **os.environ,
+    "PYTHONPATH": CONNECTOR_DIR,
+    "PYTHONUTF8": "1",
+    "BASE_DIR": root,
+    "TASK_ID": "bench",
+    "TASK_DIR": root,
+    "CONNECTOR_SERVER_URL": f"http://127.0.0.1:{desk_port}",
+    "OPENAI_API_BASE": f"http://127.0.0.1:{llm_port}/v1",
+    "OPENAI_API_KEY": "bench",
+    "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    "CONNECTOR_TOKEN_CACHE_PERSIST": "0",
+  }
+  env.pop("AIDER_DESK_CONNECTOR_TOKEN", None)
+  if args.refresh_debounce_ms is not None:
+    env["CONNECTOR_REFRESH_DEBOUNCE_MS"] = str(args.refresh_debounce_ms)
+  return env
+
+
+def connector_args(args):
+  """Connector arguments the way AiderManager passes them, without `python -m connector`."""
+  return [
+    "--no-check-update", "--no-show-model-warnings", "--analytics-disable",
+    "--model", args.model,
+    "--edit-format", "diff",
+    "--no-auto-commits", "--no-watch-files", "--no-cache-prompts",
+    "--map-tokens", str(args.map_tokens),
+  ]
+
+
+async def start_connector(root, desk_port, llm_port, args):
+  command = [sys.executable, "-m", "connector", *connector_args(args)]
+  output = None if args.verbose else asyncio.subprocess.DEVNULL
+  return await asyncio.create_subprocess_exec(*command, cwd=root, env=connector_env(root, desk_port, llm_port, args), stdout=output, stderr=output)
+
+
+async def run_prompt(desk, mode, timeout):
+  stats = await desk.send_prompt("Explain what module0 does.", mode)
+  finished_at = await asyncio.wait_for(stats.finished, timeout)
+  return stats, (finished_at - stats.sent_at) * 1000
+
+
+def report(name, values, unit="ms"):
+  values = sorted(value for value in values if value is not None)
+  if not values:
+    print(f"{name:<28} no samples")
+    return
+  p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+  print(f"{name:<28} mean {statistics.mean(values):9.2f} {unit}   median {statistics.median(values):9.2f} {unit}   p95 {p95:9.2f} {unit}")
+
+
+async def run(args):
+  llm = FakeLLM(args.tokens, args.token_rate, args.first_token_delay / 1000)
+  desk = FakeAiderDesk()
+  llm_runner, llm_port = await start_site(llm.create_app())
+  desk_runner, desk_port = await start_site(desk.create_app())
+
+  with tempfile.TemporaryDirectory() as root:
+    create_sample_repo(root, args.files)
+    started = time.perf_counter()
+    process = await start_connector(root, desk_port, llm_port, args)
+    try:
+      await asyncio.wait_for(desk.connected.wait(), args.timeout)
+      print(f"connector startup            {(time.perf_counter() - started) * 1000:9.2f} ms")
+
+      # the first prompt pays for imports and model setup
+      await run_prompt(desk, args.mode, args.timeout)
+
+      sequential = [await run_prompt(desk, args.mode, args.timeout) for _ in range(args.prompts)]
+      print(f"sequential prompts ({args.prompts}, {args.tokens} tokens at {args.token_rate}/s)")
+      report("  time to first chunk", [stats.time_to_first_chunk for stats, _ in sequential])
+      report("  end-to-end latency", [latency for _, latency in sequential])
+      report("  chunks/sec", [stats.chunks_per_second for stats, _ in sequential], unit="/s")
+
+      files = [{"path": f"pkg{index % 10}/module{index}.py", "readOnly": False} for index in range(args.context_files)]
+      context = [await desk.request_context_info(files, args.timeout) for _ in range(args.context_requests)]
+      print(f"request-context-info ({args.context_requests} requests, {args.context_files} files)")
+      report("  token numbers", [tokens for tokens, _ in context])
+      report("  repo map", [repo_map for _, repo_map in context])
+
+      started = time.perf_counter()
+      concurrent = await asyncio.gather(*[run_prompt(desk, args.mode, args.timeout) for _ in range(args.concurrency)])
+      wall_time = (time.perf_counter() - started) * 1000
+      print(f"concurrent prompts ({args.concurrency})")
+      report("  time to first chunk", [stats.time_to_first_chunk for stats, _ in concurrent])
+      report("  end-to-end latency", [latency for _, latency in concurrent])
+      print(f"  wall time                  {wall_time:9.2f} ms")
+
+      print(f"LLM requests {llm.requests}, messages received {desk.messages}, log events {desk.logs}")
+    finally:
+      if process.returncode is None:
+        process.terminate()
+        try:
+          await asyncio.wait_for(process.wait(), 10)
+        except asyncio.TimeoutError:
+          process.kill()
+      await desk_runner.cleanup()
+      await llm_runner.cleanup()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--prompts", type=int, default=10, help="sequential prompts to measure")
+  parser.add_argument("--concurrency", type=int, default=4, help="prompts sent at once in the concurrent scenario")
+  parser.add_argument("--tokens", type=int, default=300, help="tokens streamed by the fake LLM per response")
+  parser.add_argument("--token-rate", type=float, default=200, help="tokens per second streamed by the fake LLM, 0 for no delay")
+  parser.add_argument("--first-token-delay", type=float, default=50, help="fake LLM delay before the first token, in ms")
+  parser.add_argument("--context-requests", type=int, default=10)
+  parser.add_argument("--context-files", type=int, default=5, help="files sent with each request-context-info")
+  parser.add_argument("--files", type=int, default=100, help="files in the sample repository")
+  parser.add_argument("--map-tokens", type=int, default=1024)
+  parser.add_argument("--refresh-debounce-ms", type=int, default=None, help="override CONNECTOR_REFRESH_DEBOUNCE_MS")
+  parser.add_argument("--model", default="openai/gpt-4o-mini", help="model name, always routed to the fake LLM")
+  parser.add_argument("--mode", default="ask", help="prompt mode (edit format) of the measured prompts")
+  parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for any single step")
+  parser.add_argument("--verbose", action="store_true", help="show the connector output")
+  args = parser.parse_args()
+
+  asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+  main()
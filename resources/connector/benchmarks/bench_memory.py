@@ -0,0 +1,174 @@
+"""Memory of N tasks as N connector processes vs. as N sessions of one connector hub.
+
+Starts the connectors against a python-socketio server standing in for AiderDesk, the
+way AiderDesk starts them: once as one `python -m connector` process per task, once as
+a single `python -m connector --hub` process with a session per task. All tasks work
+on the same sample repository. With --context, every task builds its repo map before
+the measurement. Memory is PSS where /proc provides it (shared pages are split between
+the processes sharing them), RSS otherwise.
+
+  python benchmarks/bench_memory.py --tasks 10 --context
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_connector_e2e import FakeAiderDesk, FakeLLM, connector_args, connector_env, start_site  # noqa: E402
+from sample_repo import create_sample_repo  # noqa: E402
+
+
+def memory_kb(pid):
+  try:
+    with open(f"/proc/{pid}/smaps_rollup", "r") as file:
+      for line in file:
+        if line.startswith("Pss:"):
+          return int(line.split()[1])
+  except OSError:
+    pass
+  output = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True).stdout.strip()
+  return int(output) if output else 0
+
+
+class MultiTaskDesk(FakeAiderDesk):
+  """FakeAiderDesk that tells the connectors of many tasks apart, in own processes or in a hub."""
+
+  def __init__(self):
+    super().__init__()
+    self.hub_sid = None
+    self.hub_connected = asyncio.Event()
+    self.task_sids = {}
+    self.sid_tasks = {}
+    self.repo_map_waiters = {}
+
+  async def on_message(self, sid, data):
+    action = data.get("action")
+    if action == "init-hub":
+      self.hub_sid = sid
+      self.hub_connected.set()
+    elif action == "init":
+      self.task_sids[data.get("taskId")] = sid
+      self.sid_tasks[sid] = data.get("taskId")
+    elif action == "tokens-info" and "repoMap" in (data.get("info") or {}):
+      waiter = self.repo_map_waiters.pop(data.get("taskId") or self.sid_tasks.get(sid), None)
+      if waiter and not waiter.done():
+        waiter.set_result(None)
+    await super().on_message(sid, data)
+
+  async def wait_for_tasks(self, count, timeout):
+    deadline = time.monotonic() + timeout
+    while len(self.task_sids) < count:
+      if time.monotonic() > deadline:
+        raise TimeoutError(f"{len(self.task_sids)} of {count} connectors connected")
+      await asyncio.sleep(0.05)
+
+  async def emit_to_task(self, task_id, message):
+    await self.sio.emit("message", {**message, "taskId": task_id}, to=self.task_sids[task_id])
+
+  async def build_repo_maps(self, timeout):
+    loop = asyncio.get_running_loop()
+    waiters = []
+    for task_id in self.task_sids:
+      waiters.append(self.repo_map_waiters.setdefault(task_id, loop.create_future()))
+      await self.emit_to_task(task_id, {"action": "request-context-info", "messages": [], "files": []})
+    await asyncio.wait_for(asyncio.gather(*waiters), timeout)
+
+
+async def stop_process(process):
+  if process.returncode is None:
+    process.terminate()
+    try:
+      await asyncio.wait_for(process.wait(), 10)
+    except asyncio.TimeoutError:
+      process.kill()
+
+
+async def measure_processes(root, desk, env, args):
+  output = None if args.verbose else asyncio.subprocess.DEVNULL
+  processes = []
+  try:
+    for index in range(args.tasks):
+      processes.append(await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "connector", *connector_args(args), cwd=root, env={**env, "TASK_ID": f"task{index}"}, stdout=output, stderr=output,
+      ))
+    await desk.wait_for_tasks(args.tasks, args.timeout)
+    if args.context:
+      await desk.build_repo_maps(args.timeout)
+    await asyncio.sleep(args.settle)
+    return sum(memory_kb(process.pid) for process in processes)
+  finally:
+    for process in processes:
+      await stop_process(process)
+
+
+async def measure_hub(root, desk, env, args):
+  output = None if args.verbose else asyncio.subprocess.DEVNULL
+  process = await asyncio.create_subprocess_exec(sys.executable, "-m", "connector", "--hub", "bench", cwd=root, env=env, stdout=output, stderr=output)
+  try:
+    await asyncio.wait_for(desk.hub_connected.wait(), args.timeout)
+    for index in range(args.tasks):
+      await desk.sio.emit("message", {
+        "action": "open-session",
+        "taskId": f"task{index}",
+        "baseDir": root,
+        "taskDir": root,
+        "args": connector_args(args),
+        "confirmBeforeEdit": False,
+      }, to=desk.hub_sid)
+    await desk.wait_for_tasks(args.tasks, args.timeout)
+    if args.context:
+      await desk.build_repo_maps(args.timeout)
+    await asyncio.sleep(args.settle)
+    return memory_kb(process.pid)
+  finally:
+    await stop_process(process)
+
+
+async def run(args):
+  llm = FakeLLM(10, 0, 0)
+  llm_runner, llm_port = await start_site(llm.create_app())
+
+  with tempfile.TemporaryDirectory() as root:
+    create_sample_repo(root, args.files)
+
+    results = {}
+    for name, measure in (("processes", measure_processes), ("hub", measure_hub)):
+      desk = MultiTaskDesk()
+      desk_runner, desk_port = await start_site(desk.create_app())
+      try:
+        results[name] = await measure(root, desk, connector_env(root, desk_port, llm_port, args), args)
+      finally:
+        await desk_runner.cleanup()
+
+  await llm_runner.cleanup()
+
+  print(f"memory of {args.tasks} tasks ({args.files} repo files{', repo maps built' if args.context else ''})")
+  print(f"  {args.tasks} connector processes   {results['processes'] / 1024:9.1f} MB   {results['processes'] / 1024 / args.tasks:8.1f} MB per task")
+  print(f"  1 connector hub            {results['hub'] / 1024:9.1f} MB   {results['hub'] / 1024 / args.tasks:8.1f} MB per task")
+  print(f"  saved                      {(results['processes'] - results['hub']) / 1024:9.1f} MB")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--tasks", type=int, default=5)
+  parser.add_argument("--files", type=int, default=100, help="files in the sample repository")
+  parser.add_argument("--map-tokens", type=int, default=1024)
+  parser.add_argument("--refresh-debounce-ms", type=int, default=None, help="override CONNECTOR_REFRESH_DEBOUNCE_MS")
+  parser.add_argument("--model", default="openai/gpt-4o-mini")
+  parser.add_argument("--context", action="store_true", help="build every task's repo map before measuring")
+  parser.add_argument("--settle", type=float, default=2, help="seconds to wait before measuring")
+  parser.add_argument("--timeout", type=float, default=180, help="seconds to wait for any single step")
+  parser.add_argument("--verbose", action="store_true", help="show the connector output")
+  args = parser.parse_args()
+
+  asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,137 @@
+"""Startup time of a connector, spawned as a fresh interpreter vs. forked from the fork server.
+
+Measures the time from the start request until the connector's `init` message reaches a
+python-socketio server standing in for AiderDesk, which is when AiderDesk can use it.
+The fork server itself is started once and its startup is reported separately.
+
+  python benchmarks/bench_startup.py --iterations 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_connector_e2e import CONNECTOR_DIR, FakeAiderDesk, FakeLLM, connector_args, connector_env, report, start_connector, start_site  # noqa: E402
+from sample_repo import create_sample_repo  # noqa: E402
+
+
+async def drain(reader):
+  while await reader.read(65536):
+    pass
+
+
+async def wait_for_init(desk, started, timeout):
+  await asyncio.wait_for(desk.connected.wait(), timeout)
+  return (time.perf_counter() - started) * 1000
+
+
+async def start_fork_server(socket_path, env, args):
+  started = time.perf_counter()
+  command = [sys.executable, "-m", "connector", "--fork-server", socket_path, "--preload-model", args.model]
+  process = await asyncio.create_subprocess_exec(
+    *command, cwd=CONNECTOR_DIR, env=env, stdout=asyncio.subprocess.PIPE, stderr=None if args.verbose else asyncio.subprocess.DEVNULL,
+  )
+  line = await asyncio.wait_for(process.stdout.readline(), args.timeout)
+  if not json.loads(line).get("ready"):
+    raise RuntimeError(f"Unexpected fork server output: {line!r}")
+  return process, (time.perf_counter() - started) * 1000
+
+
+async def fork_connector(socket_path, connector_arguments, env, cwd):
+  """Client side of the fork server protocol; returns the connector's pid and its two connections.
+
+  The connections are the connector's stdout and stderr, it gets EPIPE once they close.
+  """
+  request_id = str(uuid.uuid4())
+  stdout_reader, stdout_writer = await asyncio.open_unix_connection(socket_path)
+  stdout_writer.write((json.dumps({"action": "spawn", "id": request_id, "args": connector_arguments, "env": env, "cwd": cwd}) + "\n").encode("utf-8"))
+  await stdout_writer.drain()
+  stderr_reader, stderr_writer = await asyncio.open_unix_connection(socket_path)
+  stderr_writer.write((json.dumps({"action": "attach", "id": request_id}) + "\n").encode("utf-8"))
+  await stderr_writer.drain()
+
+  header = json.loads(await stdout_reader.readline())
+  # the connector blocks once its output buffers are full
+  drains = [asyncio.create_task(drain(stdout_reader)), asyncio.create_task(drain(stderr_reader))]
+  return header["pid"], (stdout_writer, stderr_writer, drains)
+
+
+async def run(args):
+  llm = FakeLLM(10, 0, 0)
+  desk = FakeAiderDesk()
+  llm_runner, llm_port = await start_site(llm.create_app())
+  desk_runner, desk_port = await start_site(desk.create_app())
+
+  with tempfile.TemporaryDirectory() as root:
+    create_sample_repo(root, args.files)
+    env = connector_env(root, desk_port, llm_port, args)
+
+    spawned = []
+    for _ in range(args.iterations):
+      desk.connected.clear()
+      started = time.perf_counter()
+      process = await start_connector(root, desk_port, llm_port, args)
+      try:
+        spawned.append(await wait_for_init(desk, started, args.timeout))
+      finally:
+        process.kill()
+        await process.wait()
+
+    socket_path = os.path.join(tempfile.gettempdir(), f"bench-connector-{os.getpid()}.sock")
+    server, server_startup = await start_fork_server(socket_path, env, args)
+    forked = []
+    try:
+      for _ in range(args.iterations):
+        desk.connected.clear()
+        started = time.perf_counter()
+        pid, connections = await fork_connector(socket_path, connector_args(args), env, root)
+        try:
+          forked.append(await wait_for_init(desk, started, args.timeout))
+        finally:
+          os.kill(pid, signal.SIGKILL)
+          stdout_writer, stderr_writer, drains = connections
+          stdout_writer.close()
+          stderr_writer.close()
+          await asyncio.gather(*drains, return_exceptions=True)
+    finally:
+      server.terminate()
+      await server.wait()
+
+    print(f"connector startup until init ({args.iterations} iterations)")
+    report("  spawned", spawned)
+    report("  forked", forked)
+    print(f"  fork server startup        {server_startup:9.2f} ms")
+    print(f"  speedup (median)           {statistics.median(spawned) / statistics.median(forked):9.2f}x")
+
+  await desk_runner.cleanup()
+  await llm_runner.cleanup()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--iterations", type=int, default=5)
+  parser.add_argument("--files", type=int, default=100, help="files in the sample repository")
+  parser.add_argument("--map-tokens", type=int, default=1024)
+  parser.add_argument("--refresh-debounce-ms", type=int, default=None, help="override CONNECTOR_REFRESH_DEBOUNCE_MS")
+  parser.add_argument("--model", default="openai/gpt-4o-mini")
+  parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for a connector to connect")
+  parser.add_argument("--verbose", action="store_true", help="show the connector output")
+  args = parser.parse_args()
+
+  if sys.platform == "win32":
+    parser.error("the fork server needs os.fork, which Windows does not have")
+
+  asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,72 @@
+"""Token counting of a large file set: exact one by one, exact in parallel, and estimated.
+
+Generates source-like files of about --file-size bytes from slices of connector.py and
+counts them the way the context panel counts context files: once with
+`main_model.token_count` per file, once as one batch on TokenCountEngine's threads, and
+once as byte-length estimates calibrated from a sample of exact counts. Reports the time
+of each and the error of the estimates against the exact counts.
+
+  python benchmarks/bench_token_count.py --files 2000 --file-size 8000 --workers 8
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aider import models  # noqa: E402
+
+from connector import TokenCountEngine  # noqa: E402
+
+
+def create_texts(count, size):
+  with open(os.path.join(os.path.dirname(__file__), "..", "connector.py"), "r", encoding="utf-8") as file:
+    source = file.read()
+  step = max(1, (len(source) - size) // max(1, count))
+  return [source[(index * step) % max(1, len(source) - size):][:size] for index in range(count)]
+
+
+def timed(function):
+  started = time.perf_counter()
+  result = function()
+  return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--files", type=int, default=1000)
+  parser.add_argument("--file-size", type=int, default=8000, help="bytes per file")
+  parser.add_argument("--workers", type=int, default=0, help="token counting threads, 0 for CONNECTOR_TOKEN_COUNT_WORKERS or the CPU count")
+  parser.add_argument("--calibration-files", type=int, default=20, help="files counted exactly before estimating")
+  parser.add_argument("--model", default="gpt-4o-mini")
+  args = parser.parse_args()
+
+  model = models.Model(args.model)
+  texts = create_texts(args.files, args.file_size)
+  # loads the tokenizer
+  model.token_count("warm-up")
+
+  exact, serial_ms = timed(lambda: [model.token_count(text) for text in texts])
+
+  engine = TokenCountEngine(**({"workers": args.workers} if args.workers else {}))
+  parallel, parallel_ms = timed(lambda: engine.count_batch(model, texts))
+  assert parallel == exact
+
+  calibration = TokenCountEngine(workers=1)
+  calibration.count_batch(model, texts[:args.calibration_files])
+  estimated, estimate_ms = timed(lambda: [calibration.estimate(model.name, len(text.encode("utf-8"))) for text in texts])
+  errors = [abs(estimate - tokens) / tokens * 100 for estimate, tokens in zip(estimated, exact) if tokens]
+
+  total_mb = sum(len(text.encode("utf-8")) for text in texts) / 1024 / 1024
+  print(f"token counting of {args.files} files, {total_mb:.1f} MB, {sum(exact)} tokens ({args.model})")
+  print(f"  {'exact, one by one':<24} {serial_ms:10.2f} ms")
+  print(f"  {f'exact, {engine.workers} threads':<24} {parallel_ms:10.2f} ms   {serial_ms / parallel_ms:6.2f}x")
+  print(f"  {'estimated':<24} {estimate_ms:10.2f} ms   {serial_ms / max(estimate_ms, 0.001):6.0f}x")
+  print(f"  {'estimate error':<24} mean {statistics.mean(errors):5.1f} %   max {max(errors):5.1f} %   total {(sum(estimated) - sum(exact)) / sum(exact) * 100:+5.1f} %")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,15 @@
+"""Throw-away git repository shared by the benchmarks."""
+
+import os
+import subprocess
+
+
+def create_sample_repo(root, file_count):
+  subprocess.run(["git", "init", "-q", root], check=True)
+  for index in range(file_count):
+    package = os.path.join(root, f"pkg{index % 10}")
+    os.makedirs(package, exist_ok=True)
+    with open(os.path.join(package, f"module{index}.py"), "w") as file:
+      file.write(f"class Model{index}:\n  def run(self, value):\n    return value * {index}\n\n\ndef helper{index}():\n  return Model{index}()\n")
+  subprocess.run(["git", "-C", root, "add", "-A"], check=True)
+  subprocess.run(["git", "-C", root, "-c", "user.name=bench", "-c", "user.email=bench@example.com", "commit", "-q", "-m", "init"], check=True)
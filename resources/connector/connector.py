@@ -1,10 +1,20 @@
 #!/usr/bin/env python
 
 import argparse
+import collections
+import contextlib
+import contextvars
+import copy
+import difflib
+import hashlib
+import heapq
 import os
+import signal
+import socket
 import sys
 import asyncio
 import json
+import multiprocessing
 import socketio
 import tempfile
 import threading
@@ -12,16 +22,21 @@ import uuid
 from pathlib import Path
 from typing import Dict, Optional, Any, Coroutine
 import time
+
+# the environment the imports below saw, see fork_connector
+IMPORT_ENV = dict(os.environ)
+
 from aider import models, utils
 from aider.models import ModelSettings
 from aider.coders import Coder
 from aider.commands import Commands
 from aider.io import InputOutput, AutoCompleter
+from aider.repomap import RepoMap, Tag
 from aider.watch import FileWatcher
 from aider.main import main as cli_main
 from aider.utils import is_image_file
-from concurrent.futures import ThreadPoolExecutor, Future
 import nest_asyncio
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
 def apply_tls_overrides():
   """Apply AiderDesk TLS settings before litellm/httpx create their SSL contexts.
@@ -63,20 +78,1560 @@ import litellm
 import types
 import portalocker
 import re
+from grep_ast import filename_to_lang
 
 THINKING_MARKER = re.compile(r'[-]{3,}\s*\n\s*►\s*\*\*THINKING\*\*\s*\n', re.IGNORECASE)
 ANSWER_MARKER = re.compile(r'[-]{3,}\s*\n\s*►\s*\*\*ANSWER\*\*\s*\n', re.IGNORECASE)
 
+def _marker_prefix_pattern(word):
+  """Matches text that may still grow into a full marker for `word`.
+
+  This is a deliberate over-approximation of the marker regex: a false positive only
+  delays a few characters until the next chunk rules the marker out.
+  """
+  tail = r"\s*"
+  for part in reversed([r"\*", r"\*"] + [re.escape(char) for char in word] + [r"\*", r"\*"]):
+    tail = f"{part}(?:{tail})?"
+  return re.compile(rf"-+(?:\s*(?:►(?:\s*(?:{tail})?)?)?)?\Z", re.IGNORECASE)
+
+THINKING_MARKER_PREFIX = _marker_prefix_pattern("THINKING")
+ANSWER_MARKER_PREFIX = _marker_prefix_pattern("ANSWER")
+DASH_RUN = re.compile(r'-+')
+
+class ReasoningStreamParser:
+  """Incrementally splits streamed model output on the THINKING/ANSWER markers.
+
+  Between chunks only a short tail that may hold the start of a split marker is kept,
+  and all output is collected in lists, so the total cost is linear in the output size.
+  `feed()` and `finish()` return the `(kind, text)` deltas to stream, where kind is
+  "content" or "reasoning"; `reasoning` and `answer` give the final split.
+  """
+
+  CONTENT = "content"
+  REASONING = "reasoning"
+  ANSWER = "answer"
+
+  MAX_TAIL_SIZE = 256
+
+  def __init__(self):
+    self.state = self.CONTENT
+    self._tail = ""
+    self._raw_parts = []
+    self._parts = {self.CONTENT: [], self.REASONING: [], self.ANSWER: []}
+    self._finished = False
+
+  def feed(self, chunk):
+    if not chunk:
+      return []
+    self._raw_parts.append(chunk)
+    return self._parse(self._tail + chunk, final=False)
+
+  def finish(self):
+    if self._finished:
+      return []
+    self._finished = True
+    return self._parse(self._tail, final=True)
+
+  @property
+  def content(self):
+    """The raw streamed text, markers included."""
+    return "".join(self._raw_parts)
+
+  @property
+  def reasoning(self):
+    return "".join(self._parts[self.REASONING]).strip()
+
+  @property
+  def answer(self):
+    if self.state == self.CONTENT:
+      # no THINKING marker, the whole output is the answer
+      return self.content
+    return "".join(self._parts[self.ANSWER]).strip()
+
+  def _parse(self, text, final):
+    self._tail = ""
+    deltas = []
+
+    while text:
+      if self.state == self.CONTENT:
+        marker, marker_prefix, next_state = THINKING_MARKER, THINKING_MARKER_PREFIX, self.REASONING
+      elif self.state == self.REASONING:
+        marker, marker_prefix, next_state = ANSWER_MARKER, ANSWER_MARKER_PREFIX, self.ANSWER
+      else:
+        self._emit(deltas, text)
+        break
+
+      match = marker.search(text)
+      # a marker ending right at the end of the text may still consume more whitespace
+      if match and (final or match.end() < len(text)):
+        self._emit(deltas, text[:match.start()])
+        self.state = next_state
+        text = text[match.end():]
+        continue
+
+      hold_from = len(text) if final else self._find_marker_start(text, match, marker_prefix)
+      self._emit(deltas, text[:hold_from])
+      self._tail = text[hold_from:]
+      break
+
+    return deltas
+
+  def _find_marker_start(self, text, match, marker_prefix):
+    if match:
+      return match.start()
+
+    window_start = max(0, len(text) - self.MAX_TAIL_SIZE)
+    for dash_run in DASH_RUN.finditer(text, window_start):
+      if marker_prefix.match(text, dash_run.start()):
+        return dash_run.start()
+    return len(text)
+
+  def _emit(self, deltas, text):
+    if not text:
+      return
+    self._parts[self.state].append(text)
+    kind = self.REASONING if self.state == self.REASONING else self.CONTENT
+    if deltas and deltas[-1][0] == kind:
+      deltas[-1] = (kind, deltas[-1][1] + text)
+    else:
+      deltas.append((kind, text))
+
+STREAM_FLUSH_INTERVAL = int(os.getenv("CONNECTOR_STREAM_FLUSH_INTERVAL_MS", "25")) / 1000
+STREAM_FLUSH_SIZE = int(os.getenv("CONNECTOR_STREAM_FLUSH_SIZE", "8192"))
+STREAM_CHANNEL_CAPACITY = int(os.getenv("CONNECTOR_STREAM_CHANNEL_CAPACITY", "1024"))
+LOG_BUFFER_CAPACITY = int(os.getenv("CONNECTOR_LOG_BUFFER_CAPACITY", "256"))
+# 0 sizes the prompt scheduler from the CPU count and the provider's rate limit
+MAX_CONCURRENT_PROMPTS = int(os.getenv("CONNECTOR_MAX_CONCURRENT_PROMPTS", "0"))
+
+CODER_POOL_ENABLED = os.getenv("CONNECTOR_CODER_POOL", "1") != "0"
+TOKEN_CACHE_CAPACITY = int(os.getenv("CONNECTOR_TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_PERSIST = os.getenv("CONNECTOR_TOKEN_CACHE_PERSIST", "1") != "0"
+TOKEN_CACHE_SAVE_DELAY = 2.0
+MESSAGE_TOKEN_CACHE_CAPACITY = int(os.getenv("CONNECTOR_MESSAGE_TOKEN_CACHE_SIZE", "8192"))
+TOKEN_COUNT_WORKERS = int(os.getenv("CONNECTOR_TOKEN_COUNT_WORKERS", "0"))
+TOKEN_ESTIMATES = os.getenv("CONNECTOR_TOKEN_ESTIMATES", "1") != "0"
+REFRESH_DEBOUNCE = int(os.getenv("CONNECTOR_REFRESH_DEBOUNCE_MS", "150")) / 1000
+REPO_MAP_TIMEOUT = float(os.getenv("CONNECTOR_REPO_MAP_TIMEOUT", "60"))
+WORD_INDEX_CAPACITY = int(os.getenv("CONNECTOR_WORD_INDEX_SIZE", "2048"))
+COMMIT_DIFF_INLINE_LINES = int(os.getenv("CONNECTOR_COMMIT_DIFF_INLINE_LINES", "2000"))
+COMMIT_DIFF_MAX_SIZE = int(os.getenv("CONNECTOR_COMMIT_DIFF_MAX_SIZE", str(8 * 1024 * 1024)))
+COMMIT_DIFF_CHUNK_SIZE = int(os.getenv("CONNECTOR_COMMIT_DIFF_CHUNK_SIZE", "65536"))
+FORK_SERVER_ATTACH_TIMEOUT = 10.0
+# read by a connector when it starts rather than on import, so a forked one may get other values
+FORK_PER_TASK_ENV = {
+  "BASE_DIR", "TASK_ID", "TASK_DIR", "CONNECTOR_SERVER_URL", "CONNECTOR_CONFIRM_BEFORE_EDIT", "AIDER_DESK_CONNECTOR_TOKEN",
+  "LANGFUSE_PUBLIC_KEY", "LANGFUSE_SECRET_KEY", "LANGFUSE_HOST", "POSTHOG_API_KEY",
+}
+TAGS_CACHE_SHARED = os.getenv("CONNECTOR_SHARED_TAGS_CACHE", "1") != "0"
+TAGS_CACHE_SAVE_BATCH = 500
+PARALLEL_SCAN_MIN_FILES = int(os.getenv("CONNECTOR_PARALLEL_SCAN_MIN_FILES", "1000"))
+PARALLEL_SCAN_WORKERS = int(os.getenv("CONNECTOR_PARALLEL_SCAN_WORKERS", "0"))
+PARALLEL_SCAN_BATCH_SIZE = 32
+WARM_UP_ENABLED = os.getenv("CONNECTOR_WARM_UP", "1") != "0"
+WARM_UP_DELAY = int(os.getenv("CONNECTOR_WARM_UP_DELAY_MS", "250")) / 1000
+WARM_UP_POLL_INTERVAL = 0.1
+# "console" or "otlp" also exports prompt metrics as OpenTelemetry spans
+OTEL_EXPORTER = os.getenv("CONNECTOR_OTEL_EXPORTER", "").lower()
+
+# lower value runs first
+PROMPT_PRIORITY_INTERACTIVE = 0
+PROMPT_PRIORITY_EDITOR = 1
+PROMPT_PRIORITY_FILE_WATCHER = 2
+
+class PromptMetrics:
+  """Timing spans of one prompt, sent to AiderDesk with the `prompt-metrics` action.
+
+  Spans can be recorded from the prompt's worker thread (lint, commit message), so they
+  are guarded by a lock. Durations of spans with the same name add up.
+  """
+
+  SPANS = ("queueWait", "clone", "stream", "lint", "commitMessage", "diff", "outboundWait")
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.started = time.monotonic()
+    self.started_ns = time.time_ns()
+    self.durations = collections.defaultdict(float)
+    # (name, start_ns, end_ns) of every recorded span, for the OpenTelemetry export
+    self.spans = []
+    self.time_to_first_token = None
+    self.stream_chunks = 0
+    self.stream_active = 0.0
+    self.reflections = 0
+
+  @contextlib.contextmanager
+  def span(self, name):
+    start = time.monotonic()
+    start_ns = time.time_ns()
+    try:
+      yield
+    finally:
+      self.add_span(name, start, start_ns)
+
+  def add_span(self, name, start, start_ns):
+    """Adds a span that started at `start` (monotonic) / `start_ns` (wall clock) and ends now."""
+    duration = time.monotonic() - start
+    with self.lock:
+      self.durations[name] += duration
+      self.spans.append((name, start_ns, start_ns + int(duration * 1e9)))
+
+  def add_duration(self, name, seconds):
+    with self.lock:
+      self.durations[name] += seconds
+
+  def record_stream(self, started, first_chunk_at, last_chunk_at, chunks):
+    """Records one LLM stream; the first token is timed from the start of the first stream."""
+    with self.lock:
+      if first_chunk_at is None:
+        return
+      if self.time_to_first_token is None:
+        self.time_to_first_token = first_chunk_at - started
+      self.stream_chunks += chunks
+      self.stream_active += last_chunk_at - first_chunk_at
+
+  def to_dict(self):
+    with self.lock:
+      metrics = {f"{name}Ms": round(self.durations[name] * 1000, 2) for name in self.SPANS}
+      metrics.update({
+        "totalMs": round((time.monotonic() - self.started) * 1000, 2),
+        "timeToFirstTokenMs": round(self.time_to_first_token * 1000, 2) if self.time_to_first_token is not None else None,
+        # streamed chunks are roughly one token each for the providers supported by litellm
+        "streamedChunks": self.stream_chunks,
+        "tokensPerSecond": round(self.stream_chunks / self.stream_active, 2) if self.stream_active > 0 else None,
+        "reflections": self.reflections,
+      })
+      return metrics
+
 class PromptContext:
-  def __init__(self, id: str, group=None, auto_approve=False, deny_commands=False):
+  def __init__(self, id: str, group=None, auto_approve=False, deny_commands=False, question_timeout=None, priority=PROMPT_PRIORITY_INTERACTIVE):
     self.id = id
     self.group = group
     self.auto_approve = auto_approve
     self.deny_commands = deny_commands
+    # seconds to wait for an answer to a confirmation question, None waits forever
+    self.question_timeout = question_timeout
+    self.priority = priority
+    self.metrics = PromptMetrics()
+
+def prompt_span(prompt_context, name):
+  """Span `name` of the prompt's metrics, a no-op outside of a prompt."""
+  return prompt_context.metrics.span(name) if prompt_context else contextlib.nullcontext()
+
+class ChannelClosed(Exception):
+  """Raised to the producer of a ThreadChannel whose consumer has gone away."""
+
+class ThreadChannel:
+  """Bounded channel handing items from a worker thread to the asyncio loop in batches.
+
+  The producer wakes the loop only when the channel goes from empty to non-empty, so a
+  burst of items costs a single loop wakeup. It blocks only when the channel is full,
+  which is when the consumer has fallen behind.
+  """
+
+  def __init__(self, loop, capacity=STREAM_CHANNEL_CAPACITY):
+    self.loop = loop
+    self.capacity = capacity
+    self._items = collections.deque()
+    self._condition = threading.Condition()
+    self._ready = asyncio.Event()
+    self._wakeup_pending = False
+    self._closed = False
+    self._cancelled = False
+
+  def put(self, item):
+    """Called from the producer thread."""
+    with self._condition:
+      while len(self._items) >= self.capacity and not self._cancelled:
+        self._condition.wait()
+      if self._cancelled:
+        raise ChannelClosed()
+      self._items.append(item)
+      wake = not self._wakeup_pending
+      self._wakeup_pending = True
+
+    if wake:
+      self.loop.call_soon_threadsafe(self._ready.set)
+
+  def close(self):
+    """Called from the producer thread once there are no more items."""
+    with self._condition:
+      self._closed = True
+      wake = not self._wakeup_pending
+      self._wakeup_pending = True
+
+    if wake:
+      self.loop.call_soon_threadsafe(self._ready.set)
+
+  def cancel(self):
+    """Called from the loop when the consumer stops; the producer gets ChannelClosed."""
+    with self._condition:
+      self._cancelled = True
+      self._items.clear()
+      self._condition.notify_all()
+
+  async def get_batch(self, timeout=None):
+    """Returns all buffered items, or None once the channel is closed and drained.
+
+    Raises asyncio.TimeoutError if nothing arrives within `timeout` seconds.
+    """
+    while True:
+      with self._condition:
+        if self._items:
+          batch = list(self._items)
+          self._items.clear()
+          self._condition.notify_all()
+          return batch
+        if self._closed:
+          return None
+        self._wakeup_pending = False
+        self._ready.clear()
+
+      if timeout is None:
+        await self._ready.wait()
+      else:
+        await asyncio.wait_for(self._ready.wait(), timeout)
+
+class ResponseCoalescer:
+  """Merges streamed content/reasoning deltas into as few `response` frames as possible.
+
+  Deltas are buffered until the flush window elapses or the size budget is reached.
+  The very first delta is sent right away to keep time-to-first-token low, and switching
+  between content and reasoning flushes the pending frame so their order is preserved.
+  """
+
+  def __init__(self, connector, base_payload, flush_interval=STREAM_FLUSH_INTERVAL, flush_size=STREAM_FLUSH_SIZE, on_sent=None):
+    self.connector = connector
+    self.base_payload = base_payload
+    self.on_sent = on_sent
+    self.flush_interval = flush_interval
+    self.flush_size = flush_size
+    self.kind = None
+    self.parts = []
+    self.size = 0
+    self.pending_since = None
+    self.frames_sent = 0
+
+  async def add(self, content="", reasoning=""):
+    if reasoning:
+      await self._add("reasoning", reasoning)
+    if content:
+      await self._add("content", content)
+
+  async def _add(self, kind, text):
+    if self.kind is not None and self.kind != kind:
+      await self.flush()
+
+    self.kind = kind
+    self.parts.append(text)
+    self.size += len(text)
+    if self.pending_since is None:
+      self.pending_since = time.monotonic()
+
+    if self.frames_sent == 0 or self.size >= self.flush_size or self.time_until_flush() == 0:
+      await self.flush()
+
+  def time_until_flush(self):
+    """Seconds left until the pending frame is due, or None if nothing is pending."""
+    if self.pending_since is None:
+      return None
+    return max(0.0, self.pending_since + self.flush_interval - time.monotonic())
+
+  async def flush(self):
+    if not self.parts:
+      return
+
+    text = "".join(self.parts)
+    payload = dict(self.base_payload)
+    payload["content"] = text if self.kind == "content" else ""
+    payload["reasoning"] = text if self.kind == "reasoning" else ""
+
+    self.parts = []
+    self.size = 0
+    self.pending_since = None
+    self.frames_sent += 1
+
+    await self.connector.send_action(payload, on_sent=self.on_sent)
 
 nest_asyncio.apply()
 
-confirmation_result = None
+class QuestionRegistry:
+  """Pending `ask-question` requests keyed by question ID.
+
+  Each question waits on its own future that `answer-question` resolves directly, so
+  concurrent prompts never see each other's answers and no polling is needed.
+  """
+
+  def __init__(self, loop):
+    self.loop = loop
+    self.pending: Dict[str, asyncio.Future] = {}
+
+  def register(self, question_id: str) -> asyncio.Future:
+    future = self.loop.create_future()
+    self.pending[question_id] = future
+    return future
+
+  def resolve(self, question_id: Optional[str], answer) -> bool:
+    if question_id is None:
+      # answers without an ID (older AiderDesk versions) go to the oldest open question
+      question_id = next(iter(self.pending), None)
+
+    future = self.pending.pop(question_id, None)
+    if future is None or future.done():
+      return False
+    future.set_result(answer)
+    return True
+
+  def discard(self, question_id: str):
+    future = self.pending.pop(question_id, None)
+    if future is not None and not future.done():
+      future.cancel()
+
+  def cancel_all(self):
+    for question_id in list(self.pending):
+      self.discard(question_id)
+
+class OutboundQueue:
+  """Single writer emitting Socket.IO messages strictly in the order they were queued.
+
+  Every outgoing `message` and `log` event goes through one queue drained by one writer
+  task, so ordering holds by construction and no artificial delay between emits is needed.
+  Queue depth and queue-to-emit latency are tracked for diagnostics.
+  """
+
+  def __init__(self, sio, loop):
+    self.sio = sio
+    self.loop = loop
+    self.queue = asyncio.Queue()
+    self.sequence = 0
+    self.writer_task = None
+    self.sent = 0
+    self.max_depth = 0
+    self.total_latency = 0.0
+    self.max_latency = 0.0
+
+  def put(self, event, data, on_sent=None):
+    """Queues a message for sending; must be called on the event loop thread.
+
+    `on_sent` is called with the queue-to-emit latency in seconds once the message is out.
+    """
+    self.sequence += 1
+    self.queue.put_nowait((self.sequence, event, data, time.monotonic(), on_sent))
+    self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    if self.writer_task is None or self.writer_task.done():
+      self.writer_task = self.loop.create_task(self._write())
+    return self.sequence
+
+  async def drain(self):
+    """Waits until everything queued so far has been emitted."""
+    await self.queue.join()
+
+  async def _write(self):
+    while True:
+      sequence, event, data, queued_at, on_sent = await self.queue.get()
+      try:
+        await self.sio.emit(event, data)
+      except Exception as e:
+        sys.stderr.write(f"Error sending {event} #{sequence}: {str(e)}\n")
+      finally:
+        latency = time.monotonic() - queued_at
+        self.sent += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.queue.task_done()
+        if on_sent:
+          on_sent(latency)
+
+  def get_metrics(self):
+    return {
+      "depth": self.queue.qsize(),
+      "maxDepth": self.max_depth,
+      "sent": self.sent,
+      "averageLatencyMs": (self.total_latency / self.sent) * 1000 if self.sent else 0.0,
+      "maxLatencyMs": self.max_latency * 1000,
+    }
+
+class SessionOutbound:
+  """Outbound queue of one task session of a ConnectorHub.
+
+  Messages go into the hub's single queue, so they stay ordered across sessions, tagged
+  with the session's task id for AiderDesk to route them.
+  """
+
+  def __init__(self, outbound, task_id):
+    self.outbound = outbound
+    self.task_id = task_id
+
+  def put(self, event, data, on_sent=None):
+    return self.outbound.put(event, {**data, "taskId": self.task_id}, on_sent)
+
+  async def drain(self):
+    await self.outbound.drain()
+
+  def get_metrics(self):
+    return self.outbound.get_metrics()
+
+# task id of the ConnectorHub session whose code is running, inherited by its tasks and to_thread
+# workers; other threads of a session have to be started in a copy of the context
+CURRENT_SESSION = contextvars.ContextVar("connector_session", default=None)
+
+@contextlib.contextmanager
+def session_context(task_id):
+  token = CURRENT_SESSION.set(task_id)
+  try:
+    yield
+  finally:
+    CURRENT_SESSION.reset(token)
+
+class SessionOutputStream:
+  """Replaces stdout or stderr of a ConnectorHub process.
+
+  Text written by a session's code is forwarded to AiderDesk as that session's output,
+  the way the output of a connector process of its own would be; anything else goes to
+  the real stream.
+  """
+
+  def __init__(self, hub, stream, name):
+    self.hub = hub
+    self.stream = stream
+    self.name = name
+
+  def write(self, text):
+    task_id = CURRENT_SESSION.get()
+    if task_id is None:
+      return self.stream.write(text)
+    self.hub.post_output(task_id, self.name, text)
+    return len(text)
+
+  def flush(self):
+    self.stream.flush()
+
+  def __getattr__(self, name):
+    return getattr(self.stream, name)
+
+class LogBuffer:
+  """Bounded buffer for log messages posted from aider worker threads.
+
+  Posting never blocks the worker: entries are drained into the outbound queue by the
+  event loop, one drain per burst. When the buffer is full, a message is merged into the
+  previous one if both have the same level and prompt, otherwise the oldest non-loading
+  entry is dropped. Loading entries are never dropped so spinners always get finished.
+  """
+
+  def __init__(self, connector, capacity=LOG_BUFFER_CAPACITY):
+    self.connector = connector
+    self.capacity = capacity
+    self.entries = collections.deque()
+    self.lock = threading.Lock()
+    self.drain_scheduled = False
+    self.dropped = 0
+    self.merged = 0
+
+  def post(self, level, message, finished=False, prompt_context=None):
+    if self._on_loop_thread():
+      # keep the order with messages the loop sends right after this one
+      self.drain()
+      self.connector.queue_log_message(level, message, finished, prompt_context)
+      return
+
+    with self.lock:
+      if len(self.entries) >= self.capacity:
+        self._make_room(level, message, finished, prompt_context)
+      else:
+        self.entries.append([level, message, finished, prompt_context])
+      schedule_drain = not self.drain_scheduled
+      self.drain_scheduled = True
+
+    if schedule_drain:
+      self.connector.loop.call_soon_threadsafe(self.drain)
+
+  def _make_room(self, level, message, finished, prompt_context):
+    last = self.entries[-1]
+    if level != "loading" and last[0] == level and last[2] == finished and last[3] is prompt_context:
+      last[1] = f"{last[1]}\n{message}"
+      self.merged += 1
+      return
+
+    for index, entry in enumerate(self.entries):
+      if entry[0] != "loading":
+        del self.entries[index]
+        self.dropped += 1
+        break
+    self.entries.append([level, message, finished, prompt_context])
+
+  def drain(self):
+    with self.lock:
+      entries = list(self.entries)
+      self.entries.clear()
+      dropped = self.dropped
+      self.dropped = 0
+      self.drain_scheduled = False
+
+    if dropped:
+      self.connector.queue_log_message("warning", f"{dropped} log messages were dropped because the connector could not keep up.")
+    for level, message, finished, prompt_context in entries:
+      self.connector.queue_log_message(level, message, finished, prompt_context)
+
+  def _on_loop_thread(self):
+    try:
+      return asyncio.get_running_loop() is self.connector.loop
+    except RuntimeError:
+      return False
+
+class PromptScheduler:
+  """Admission control for prompts.
+
+  At most `limit` prompts run at once, the rest wait in a priority queue (FIFO within the
+  same priority), so a burst of prompts does not turn into a burst of threads competing
+  for the GIL and the provider's rate limit. Queued prompts are reported to the UI with
+  a loading message that is finished once the prompt is admitted.
+  """
+
+  def __init__(self, connector, limit):
+    self.connector = connector
+    self.limit = limit
+    self.running = set()
+    self.waiting = []
+    self.sequence = 0
+
+  @staticmethod
+  def auto_limit(model=None):
+    if MAX_CONCURRENT_PROMPTS > 0:
+      return MAX_CONCURRENT_PROMPTS
+
+    # prompts mostly wait for the provider, but parsing, linting and git work hold the GIL
+    limit = min(max(2, (os.cpu_count() or 1) * 2), 16)
+
+    # a prompt needs at least one request, more prompts than requests per minute only queue up at the provider
+    rpm = (getattr(model, "info", None) or {}).get("rpm")
+    if rpm:
+      limit = min(limit, max(1, int(rpm)))
+    return limit
+
+  def set_limit(self, limit):
+    self.limit = max(1, limit)
+    self._admit()
+
+  async def acquire(self, prompt_context):
+    """Waits until the prompt may run. Raises CancelledError when cancelled while queued."""
+    future = self.connector.loop.create_future()
+    self.sequence += 1
+    heapq.heappush(self.waiting, (prompt_context.priority, self.sequence, prompt_context, future))
+    self._admit()
+    if future.done():
+      return
+
+    state = self.get_state()
+    self.connector.post_log_message(
+      "loading",
+      f"Waiting for a free prompt slot ({state['running']} running, {state['queued']} queued)...",
+      False,
+      prompt_context,
+    )
+
+    try:
+      await future
+    except asyncio.CancelledError:
+      if future.done() and not future.cancelled():
+        # admitted right when the prompt got cancelled, give the slot back
+        self.release(prompt_context.id)
+      self.connector.post_log_message("loading", "", True, prompt_context)
+      raise
+
+    # back to the default loading message while the prompt runs
+    self.connector.post_log_message("loading", "", False, prompt_context)
+
+  def release(self, prompt_id):
+    """Frees the prompt's slot and drops it from the queue if it is still waiting there."""
+    self.running.discard(prompt_id)
+    for _, _, prompt_context, future in self.waiting:
+      if prompt_context.id == prompt_id and not future.done():
+        future.cancel()
+    self._admit()
+
+  def _admit(self):
+    while self.waiting and len(self.running) < self.limit:
+      _, _, prompt_context, future = heapq.heappop(self.waiting)
+      if future.done():
+        # cancelled while queued
+        continue
+      self.running.add(prompt_context.id)
+      future.set_result(None)
+
+  def get_state(self):
+    return {
+      "limit": self.limit,
+      "running": len(self.running),
+      "queued": sum(1 for entry in self.waiting if not entry[3].done()),
+    }
+
+class TokenCountCache:
+  """LRU cache of file token counts keyed by path, mtime, size, model and kind ("text" or "image").
+
+  A changed file gets a new key, so entries never need invalidation and stale ones age
+  out of the LRU. When a path is given, the cache is loaded from it on start and saved
+  back shortly after it changes, so a restarted connector starts warm. Saving merges with
+  what other connectors of the same project wrote, under a file lock with an atomic replace.
+  """
+
+  VERSION = 1
+
+  def __init__(self, capacity=TOKEN_CACHE_CAPACITY, path=None):
+    self.capacity = capacity
+    self.path = path
+    self.entries = collections.OrderedDict()
+    self.lock = threading.Lock()
+    self.dirty = False
+    self.save_handle = None
+    self.hits = 0
+    self.misses = 0
+
+  @staticmethod
+  def make_key(abs_path, model_name, kind):
+    """Returns the cache key for the file's current state, or None if it cannot be stat'ed."""
+    try:
+      stat = os.stat(abs_path)
+    except OSError:
+      return None
+    return (abs_path, stat.st_mtime_ns, stat.st_size, model_name, kind)
+
+  def count(self, abs_path, model_name, kind, compute):
+    """Returns the cached count for the file, calling `compute()` on a miss."""
+    key = self.make_key(abs_path, model_name, kind)
+    if key is None:
+      return compute()
+
+    tokens = self.get(key)
+    if tokens is None:
+      tokens = compute()
+      self.put(key, tokens)
+    return tokens
+
+  def get(self, key):
+    with self.lock:
+      tokens = self.entries.get(key)
+      if tokens is not None:
+        self.entries.move_to_end(key)
+        self.hits += 1
+      return tokens
+
+  def put(self, key, tokens):
+    with self.lock:
+      self.misses += 1
+      self.entries[key] = tokens
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.capacity:
+        self.entries.popitem(last=False)
+      self.dirty = True
+
+  def load(self):
+    if not self.path:
+      return
+    try:
+      with open(self.path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    except (OSError, ValueError):
+      return
+    if data.get("version") != self.VERSION:
+      return
+
+    with self.lock:
+      for entry in data.get("entries", [])[-self.capacity:]:
+        *key, tokens = entry
+        self.entries[tuple(key)] = tokens
+
+  def schedule_save(self, loop):
+    """Saves in a worker thread a moment after the last change, once per burst of changes."""
+    if not self.path or not self.dirty or self.save_handle is not None:
+      return
+
+    def _save():
+      self.save_handle = None
+      loop.run_in_executor(None, self.save)
+
+    self.save_handle = loop.call_later(TOKEN_CACHE_SAVE_DELAY, _save)
+
+  def save(self):
+    if not self.path:
+      return
+    with self.lock:
+      if not self.dirty:
+        return
+      entries = [[*key, tokens] for key, tokens in self.entries.items()]
+      self.dirty = False
+
+    try:
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      with portalocker.Lock(self.path + ".lock", timeout=5):
+        merged = collections.OrderedDict()
+        try:
+          with open(self.path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+          if data.get("version") == self.VERSION:
+            for entry in data.get("entries", []):
+              merged[tuple(entry[:-1])] = entry[-1]
+        except (OSError, ValueError):
+          pass
+        for entry in entries:
+          key = tuple(entry[:-1])
+          merged.pop(key, None)
+          merged[key] = entry[-1]
+
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+          json.dump({"version": self.VERSION, "entries": [[*key, tokens] for key, tokens in merged.items()][-self.capacity:]}, file)
+        os.replace(temp_path, self.path)
+    except (OSError, portalocker.LockException) as e:
+      sys.stderr.write(f"Could not save token count cache: {str(e)}\n")
+
+class TokenCountEngine:
+  """Counts batches of texts on a thread pool, and estimates counts from their size."""
+
+  DEFAULT_TOKENS_PER_BYTE = 0.25
+  # weight of the default ratio, in bytes, before the exact counts take over
+  PRIOR_BYTES = 4096
+  MIN_CALIBRATION_BYTES = 64
+
+  def __init__(self, workers=TOKEN_COUNT_WORKERS):
+    self.workers = workers or min(8, os.cpu_count() or 1)
+    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="token-count")
+    self.lock = threading.Lock()
+    # model name -> [tokens, bytes] of the exact counts
+    self.calibration = {}
+
+  def count(self, model, text):
+    tokens = model.token_count(text)
+    self.calibrate(model.name, len(text.encode("utf-8")), tokens)
+    return tokens
+
+  def count_batch(self, model, texts):
+    """Returns the exact token counts of `texts`, in order."""
+    if len(texts) < 2 or self.workers < 2:
+      return [self.count(model, text) for text in texts]
+    return list(self.executor.map(lambda text: self.count(model, text), texts))
+
+  def calibrate(self, model_name, byte_count, tokens):
+    if byte_count < self.MIN_CALIBRATION_BYTES:
+      return
+    with self.lock:
+      totals = self.calibration.setdefault(model_name, [0, 0])
+      totals[0] += tokens
+      totals[1] += byte_count
+
+  def tokens_per_byte(self, model_name):
+    with self.lock:
+      tokens, byte_count = self.calibration.get(model_name, (0, 0))
+    return (tokens + self.DEFAULT_TOKENS_PER_BYTE * self.PRIOR_BYTES) / (byte_count + self.PRIOR_BYTES)
+
+  def estimate(self, model_name, byte_count):
+    if byte_count <= 0:
+      return 0
+    return max(1, round(byte_count * self.tokens_per_byte(model_name)))
+
+  def shutdown(self):
+    self.executor.shutdown(wait=False)
+
+class ProjectTagsCache:
+  """Repo map tags of a project's files, keyed by git blob hash and language and shared by all its tasks."""
+
+  VERSION = 1
+
+  def __init__(self, path):
+    self.path = path
+    self.shards = {}
+    # new entries by shard, not saved yet
+    self.pending = {}
+    self.pending_count = 0
+    self.lock = threading.Lock()
+    self.save_lock = threading.Lock()
+    self.save_handle = None
+    self.hits = 0
+    self.misses = 0
+
+  @staticmethod
+  def blob_hash(data):
+    """The hash git gives the file content as a blob."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+  def install(self, repo_map):
+    if not repo_map or getattr(repo_map, "connector_tags_cache", None) is self:
+      return
+
+    original_get_tags_raw = repo_map.get_tags_raw
+
+    def _cached_get_tags_raw(fname, rel_fname):
+      return self.get_tags(fname, rel_fname, original_get_tags_raw)
+
+    repo_map.get_tags_raw = _cached_get_tags_raw
+    repo_map.connector_tags_cache = self
+
+  @classmethod
+  def file_key(cls, fname):
+    """Returns the key of the file's current content and its stat, (None, None) for files without a tags language."""
+    lang = filename_to_lang(fname)
+    if not lang:
+      return None, None
+    try:
+      stat = os.stat(fname)
+      with open(fname, "rb") as file:
+        data = file.read()
+    except OSError:
+      return None, None
+    return f"{cls.blob_hash(data)}:{lang}", stat
+
+  @staticmethod
+  def to_tags(entry, fname, rel_fname):
+    return [Tag(rel_fname=rel_fname, fname=fname, line=line, name=name, kind=kind) for line, name, kind in entry]
+
+  def get(self, key):
+    shard = self._shard(key[:2])
+    with self.lock:
+      entry = shard.get(key)
+      if entry is not None:
+        self.hits += 1
+    return entry
+
+  def put(self, key, entry):
+    shard = self._shard(key[:2])
+    with self.lock:
+      self.misses += 1
+      shard[key] = entry
+      self.pending.setdefault(key[:2], {})[key] = entry
+      self.pending_count += 1
+      save = self.pending_count >= TAGS_CACHE_SAVE_BATCH
+    if save:
+      self.save()
+
+  def get_tags(self, fname, rel_fname, get_tags_raw):
+    key, stat = self.file_key(fname)
+    if key is None:
+      return list(get_tags_raw(fname, rel_fname))
+
+    entry = self.get(key)
+    if entry is not None:
+      return self.to_tags(entry, fname, rel_fname)
+
+    tags = list(get_tags_raw(fname, rel_fname))
+    try:
+      # a file changed while it was parsed must not be stored under the old content's hash
+      if os.stat(fname).st_mtime_ns != stat.st_mtime_ns:
+        return tags
+    except OSError:
+      return tags
+
+    self.put(key, [[tag.line, tag.name, tag.kind] for tag in tags])
+    return tags
+
+  def _shard_path(self, prefix):
+    return os.path.join(self.path, f"{prefix}.json")
+
+  def _read_shard(self, prefix):
+    try:
+      with open(self._shard_path(prefix), "r", encoding="utf-8") as file:
+        data = json.load(file)
+    except (OSError, ValueError):
+      return {}
+    return data.get("entries", {}) if data.get("version") == self.VERSION else {}
+
+  def _shard(self, prefix):
+    with self.lock:
+      shard = self.shards.get(prefix)
+    if shard is None:
+      entries = self._read_shard(prefix)
+      with self.lock:
+        shard = self.shards.setdefault(prefix, entries)
+    return shard
+
+  def schedule_save(self, loop):
+    """Saves in a worker thread a moment after the last change, once per burst of changes."""
+    if not self.pending_count or self.save_handle is not None:
+      return
+
+    def _save():
+      self.save_handle = None
+      loop.run_in_executor(None, self.save)
+
+    self.save_handle = loop.call_later(TOKEN_CACHE_SAVE_DELAY, _save)
+
+  def save(self):
+    with self.lock:
+      pending = self.pending
+      self.pending = {}
+      self.pending_count = 0
+    if not pending:
+      return
+
+    with self.save_lock:
+      try:
+        os.makedirs(self.path, exist_ok=True)
+        for prefix, entries in pending.items():
+          shard_path = self._shard_path(prefix)
+          with portalocker.Lock(shard_path + ".lock", timeout=5):
+            merged = self._read_shard(prefix)
+            merged.update(entries)
+            # entries other connectors saved meanwhile become visible here too
+            shard = self._shard(prefix)
+            with self.lock:
+              shard.update(merged)
+            temp_path = f"{shard_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+              json.dump({"version": self.VERSION, "entries": merged}, file)
+            os.replace(temp_path, shard_path)
+      except (OSError, portalocker.LockException) as e:
+        sys.stderr.write(f"Could not save repo map tags cache: {str(e)}\n")
+
+class ChatTokenCounter:
+  """Incremental token accounting for system prompts and chat history.
+
+  litellm counts a message list as a fixed priming overhead plus a sum over its messages,
+  so every message is counted on its own once, memoized by model, role and content hash,
+  and the overhead is calibrated once per model. Only new messages of a growing chat get
+  tokenized. System prompt counts are memoized by model and the hash of the formatted
+  prompt, and the fence is chosen again only when the coder's chat files change.
+  """
+
+  CALIBRATION_MESSAGE = {"role": "user", "content": "calibration"}
+
+  def __init__(self, capacity=MESSAGE_TOKEN_CACHE_CAPACITY):
+    self.capacity = capacity
+    self.messages = collections.OrderedDict()
+    self.priming = {}
+    self.system = {}
+    self.fence_key = None
+
+  @staticmethod
+  def content_hash(content):
+    if not isinstance(content, str):
+      content = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha1(content.encode("utf-8", "surrogatepass")).hexdigest()
+
+  def _priming(self, model):
+    priming = self.priming.get(model.name)
+    if priming is None:
+      one = model.token_count([self.CALIBRATION_MESSAGE])
+      two = model.token_count([self.CALIBRATION_MESSAGE, self.CALIBRATION_MESSAGE])
+      priming = self.priming[model.name] = 2 * one - two
+    return priming
+
+  def _count_message(self, model, message):
+    key = (model.name, message["role"], self.content_hash(message["content"]))
+    tokens = self.messages.get(key)
+    if tokens is None:
+      tokens = model.token_count([dict(role=message["role"], content=message["content"])])
+      self.messages[key] = tokens
+      while len(self.messages) > self.capacity:
+        self.messages.popitem(last=False)
+    else:
+      self.messages.move_to_end(key)
+    return tokens
+
+  def count_messages(self, model, messages):
+    if not messages:
+      return 0
+    priming = self._priming(model)
+    return priming + sum(self._count_message(model, message) - priming for message in messages)
+
+  def _choose_fence(self, coder):
+    fnames = sorted(coder.abs_fnames | coder.abs_read_only_fnames)
+    fence_key = (id(coder), tuple((fname, os.path.getmtime(fname) if os.path.exists(fname) else None) for fname in fnames))
+    if fence_key != self.fence_key:
+      coder.choose_fence()
+      self.fence_key = fence_key
+
+  def system_tokens(self, coder):
+    self._choose_fence(coder)
+
+    # formatting is cheap next to tokenizing, and the formatted prompt covers everything it
+    # depends on (fence, platform and date, lint and test commands, language, coder prompts)
+    prompts = coder.gpt_prompts
+    system_reminder = coder.fmt_system_prompt(prompts.system_reminder)
+    main_sys = coder.fmt_system_prompt(prompts.main_system) + "\n" + system_reminder
+    key = (coder.main_model.name, self.content_hash(main_sys + "\0" + system_reminder))
+    tokens = self.system.get(key)
+    if tokens is None:
+      tokens = self.system[key] = coder.main_model.token_count([
+        dict(role="system", content=main_sys),
+        dict(role="system", content=system_reminder),
+      ])
+    return tokens
+
+class LatestWinsScheduler:
+  """Runs idempotent refresh work so that only the latest request per key matters.
+
+  A request waits for a short debounce window before it starts. A newer request for the
+  same key replaces a waiting one and cancels a running one, so a burst of requests ends
+  in a single run with the newest arguments. Counters record how much work was skipped.
+  """
+
+  def __init__(self, loop, debounce=REFRESH_DEBOUNCE):
+    self.loop = loop
+    self.debounce = debounce
+    self.tasks: Dict[str, asyncio.Task] = {}
+    self.started = set()
+    self.counters = collections.Counter()
+
+  def submit(self, key, coroutine_factory):
+    """Schedules `coroutine_factory()` for `key`, superseding earlier work for the same key."""
+    previous = self.tasks.get(key)
+    if previous is not None and not previous.done():
+      self.counters["cancelled" if previous in self.started else "debounced"] += 1
+      previous.cancel()
+
+    self.counters["requested"] += 1
+    task = self.loop.create_task(self._run(key, coroutine_factory))
+    self.tasks[key] = task
+    return task
+
+  async def _run(self, key, coroutine_factory):
+    task = asyncio.current_task()
+    try:
+      if self.debounce > 0:
+        await asyncio.sleep(self.debounce)
+      self.started.add(task)
+      await coroutine_factory()
+      self.counters["completed"] += 1
+    except asyncio.CancelledError:
+      pass # superseded by a newer request
+    finally:
+      self.started.discard(task)
+      if self.tasks.get(key) is task:
+        del self.tasks[key]
+
+  def cancel_all(self):
+    for task in list(self.tasks.values()):
+      task.cancel()
+
+  def get_metrics(self):
+    return dict(self.counters)
+
+class WarmUp:
+  """Runs the warm-up steps of a connector one after another, at low priority.
+
+  Steps are `(name, async callable)` pairs. Nothing starts before a short delay, and a
+  step only starts while `is_busy()` is false, so requests from AiderDesk always go
+  first. `report(step, done, total, finished, cancelled)` is called after every step and
+  once when cancelled. A failed step only leaves its part cold; cancelling stops the
+  running step where it can be stopped, and whatever was primed until then stays warm.
+  """
+
+  def __init__(self, loop, steps, report, is_busy=lambda: False, delay=WARM_UP_DELAY, poll_interval=WARM_UP_POLL_INTERVAL):
+    self.loop = loop
+    self.steps = steps
+    self.report = report
+    self.is_busy = is_busy
+    self.delay = delay
+    self.poll_interval = poll_interval
+    self.task = None
+    self.completed = []
+    self.errors = {}
+
+  def start(self):
+    self.task = self.loop.create_task(self._run())
+    return self.task
+
+  def cancel(self):
+    if self.task is not None and not self.task.done():
+      self.task.cancel()
+
+  async def _run(self):
+    total = len(self.steps)
+    try:
+      await asyncio.sleep(self.delay)
+      for name, step in self.steps:
+        while self.is_busy():
+          await asyncio.sleep(self.poll_interval)
+        try:
+          await step()
+        except asyncio.CancelledError:
+          raise
+        except Exception as e:
+          self.errors[name] = str(e)
+        self.completed.append(name)
+        self.report(name, len(self.completed), total, len(self.completed) == total, False)
+    except asyncio.CancelledError:
+      self.report(None, len(self.completed), total, True, True)
+
+class RepoMapCancelled(Exception):
+  pass
+
+class RepoMapWorker:
+  """Builds repo maps on a single worker thread, with cancellation and a timeout."""
+
+  def __init__(self, loop, timeout=REPO_MAP_TIMEOUT, scanner=None):
+    self.loop = loop
+    self.timeout = timeout
+    self.scanner = scanner
+    self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="repo-map")
+    self.local = threading.local()
+
+  async def build(self, repo_map, chat_files, other_files):
+    """Returns the repo map, raises asyncio.TimeoutError after `timeout` seconds."""
+    cancel_event = threading.Event()
+    # run_in_executor, unlike to_thread, does not carry the context (the hub session) over
+    future = self.loop.run_in_executor(self.executor, contextvars.copy_context().run, self._build, repo_map, chat_files, other_files, cancel_event)
+    try:
+      return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+      cancel_event.set()
+      # the abandoned build ends with RepoMapCancelled, nobody waits for it
+      future.add_done_callback(lambda f: f.cancelled() or f.exception())
+      raise
+
+  def _build(self, repo_map, chat_files, other_files, cancel_event):
+    if cancel_event.is_set():
+      raise RepoMapCancelled()
+    self._make_cancellable(repo_map)
+    if self.scanner:
+      self.scanner.scan(repo_map, set(chat_files) | set(other_files), cancel_event)
+
+    self.local.cancel_event = cancel_event
+    try:
+      return repo_map.get_repo_map(chat_files, other_files)
+    finally:
+      self.local.cancel_event = None
+
+  def _make_cancellable(self, repo_map):
+    if getattr(repo_map, "connector_cancellable", False):
+      return
+
+    original_get_tags = repo_map.get_tags
+    local = self.local
+
+    def _cancellable_get_tags(fname, rel_fname):
+      cancel_event = getattr(local, "cancel_event", None)
+      if cancel_event is not None and cancel_event.is_set():
+        raise RepoMapCancelled()
+      return original_get_tags(fname, rel_fname)
+
+    repo_map.get_tags = _cancellable_get_tags
+    repo_map.connector_cancellable = True
+
+_scan_io = None
+
+def extract_tags(files, encoding):
+  """ParallelTagScanner worker: returns (fname, mtime, project cache key, [[line, name, kind], ...]) per parsed file."""
+  global _scan_io
+  if _scan_io is None:
+    _scan_io = InputOutput(pretty=False, yes=True, fancy_input=False, encoding=encoding)
+  # get_tags_raw reads the file through `io` and calls the _run_captures method, it uses no
+  # other attribute, so the caches and map settings of __init__ are skipped
+  parser = RepoMap.__new__(RepoMap)
+  parser.io = _scan_io
+
+  results = []
+  for fname, rel_fname in files:
+    key, stat = ProjectTagsCache.file_key(fname)
+    if stat is None:
+      try:
+        stat = os.stat(fname)
+      except OSError:
+        continue
+    try:
+      tags = list(RepoMap.get_tags_raw(parser, fname, rel_fname))
+    except Exception:
+      # left to the repo map, which reports the error
+      continue
+    results.append((fname, stat.st_mtime, key, [[tag.line, tag.name, tag.kind] for tag in tags]))
+  return results
+
+class ParallelTagScanner:
+  """Parses the files missing from the tags caches on a process pool before the first build of a repo map."""
+
+  def __init__(self, progress=None, min_files=PARALLEL_SCAN_MIN_FILES, workers=PARALLEL_SCAN_WORKERS):
+    self.progress = progress
+    self.min_files = min_files
+    self.workers = workers or max(1, (os.cpu_count() or 1) - 1)
+    self.scans = 0
+    self.scanned_files = 0
+
+  @staticmethod
+  def is_cached(repo_map, fname):
+    try:
+      value = repo_map.TAGS_CACHE.get(fname)
+    except Exception:
+      return False
+    return value is not None and value.get("mtime") == repo_map.get_mtime(fname)
+
+  def scan(self, repo_map, fnames, cancel_event=None):
+    """Fills the tags caches for `fnames`; returns the number of files parsed in parallel."""
+    # checking the caches costs a lookup and a stat per file, only worth it while they are cold
+    if self.workers < 2 or getattr(repo_map, "connector_tags_scanned", False):
+      return 0
+
+    missing = [fname for fname in fnames if not self.is_cached(repo_map, fname)]
+    if len(missing) < self.min_files:
+      repo_map.connector_tags_scanned = True
+      return 0
+
+    tags_cache = getattr(repo_map, "connector_tags_cache", None)
+    if tags_cache:
+      # filled from the project cache by the build, without parsing
+      missing = [fname for fname in missing if (key := tags_cache.file_key(fname)[0]) is None or tags_cache.get(key) is None]
+      if len(missing) < self.min_files:
+        repo_map.connector_tags_scanned = True
+        return 0
+
+    rel_fnames = {fname: repo_map.get_rel_fname(fname) for fname in missing}
+    batches = [
+      [(fname, rel_fnames[fname]) for fname in missing[index:index + PARALLEL_SCAN_BATCH_SIZE]]
+      for index in range(0, len(missing), PARALLEL_SCAN_BATCH_SIZE)
+    ]
+    encoding = getattr(repo_map.io, "encoding", "utf-8")
+
+    done = 0
+    self._report(done, len(missing))
+    # spawned, forking a process that runs threads is not safe
+    executor = ProcessPoolExecutor(max_workers=min(self.workers, len(batches)), mp_context=multiprocessing.get_context("spawn"))
+    try:
+      pending = {executor.submit(extract_tags, batch, encoding): len(batch) for batch in batches}
+      while pending:
+        if cancel_event is not None and cancel_event.is_set():
+          raise RepoMapCancelled()
+        completed, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+        for future in completed:
+          done += pending.pop(future)
+          self._store(repo_map, tags_cache, rel_fnames, future.result())
+        if completed:
+          self._report(done, len(missing))
+    finally:
+      executor.shutdown(wait=False, cancel_futures=True)
+      self._report(done, len(missing), finished=True)
+
+    repo_map.connector_tags_scanned = True
+    self.scans += 1
+    self.scanned_files += len(missing)
+    return len(missing)
+
+  def _store(self, repo_map, tags_cache, rel_fnames, results):
+    for fname, mtime, key, entry in results:
+      try:
+        # the entry aider's get_tags would have written
+        repo_map.TAGS_CACHE[fname] = {"mtime": mtime, "data": ProjectTagsCache.to_tags(entry, fname, rel_fnames[fname])}
+      except Exception:
+        pass
+      if tags_cache and key:
+        tags_cache.put(key, entry)
+
+  def _report(self, done, total, finished=False):
+    if self.progress:
+      self.progress(done, total, finished)
+
+class TrackedFiles:
+  """One listing of the tracked files: sorted relative and absolute paths with set and lookup views."""
+
+  def __init__(self, rel_files, abs_files):
+    self.rel_files = rel_files
+    self.abs_files = abs_files
+    self.abs_set = frozenset(abs_files)
+    self.rel_by_abs = dict(zip(abs_files, rel_files))
+
+  def other_files(self, chat_files):
+    """The tracked files that are not in `chat_files`, as the repo map takes them."""
+    return self.abs_set.difference(chat_files)
+
+  def get_rel_fname(self, abs_fname):
+    return self.rel_by_abs.get(abs_fname)
+
+class TrackedFileIndex:
+  """Tracked files of the repo, listed once per version of the git index.
+
+  Listing the tracked files walks the HEAD tree and the git index, and every path is then
+  resolved to an absolute one; on large repos this adds up on every context refresh. A
+  listing is reused until the git index file, the HEAD commit or the .aiderignore file
+  changes, or the file watcher reports a file added or deleted (`invalidate`). Coders
+  without a repo list their chat files instead, which are not cached.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.tracked_files = None
+    self.signature = None
+    self.generation = 0
+    self.listings = 0
+    self.reused = 0
+
+  def invalidate(self):
+    with self.lock:
+      self.generation += 1
+
+  @staticmethod
+  def _mtime(path):
+    try:
+      return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+      return None
+
+  def _signature(self, coder):
+    repo = coder.repo
+    try:
+      head = repo.repo.head.commit.hexsha
+    except Exception:
+      # no commit yet
+      head = None
+    return (
+      coder.root,
+      self._mtime(os.path.join(repo.repo.git_dir, "index")),
+      head,
+      self._mtime(repo.aider_ignore_file),
+      self.generation,
+    )
+
+  def get(self, coder):
+    """Returns the TrackedFiles of `coder`, listing them only when the repo changed."""
+    if not coder.repo:
+      return self._list(coder)
+
+    with self.lock:
+      signature = self._signature(coder)
+      if self.tracked_files is not None and signature == self.signature:
+        self.reused += 1
+        return self.tracked_files
+
+      self.tracked_files = self._list(coder)
+      self.signature = signature
+      self.listings += 1
+      return self.tracked_files
+
+  @staticmethod
+  def _list(coder):
+    # the unpatched listing, see install
+    rel_files = type(coder).get_all_relative_files(coder)
+    return TrackedFiles(rel_files, [coder.abs_root_path(path) for path in rel_files])
+
+  def install(self, coder):
+    """Makes the coder's file listing, also the one aider uses for its repo map, come from the index."""
+    index = self
+
+    def _get_all_relative_files(coder_instance):
+      return list(index.get(coder_instance).rel_files)
+
+    def _get_all_abs_files(coder_instance):
+      return list(index.get(coder_instance).abs_files)
+
+    coder.get_all_relative_files = types.MethodType(_get_all_relative_files, coder)
+    coder.get_all_abs_files = types.MethodType(_get_all_abs_files, coder)
+
+class WordIndex:
+  """Autocompletion words per file, keyed by path, mtime and size.
+
+  Only files that changed since they were last lexed are tokenized again, with the same
+  AutoCompleter lexing as before but one file at a time. The file watcher drops entries
+  of changed files eagerly through `invalidate`; the mtime check covers files it ignores.
+  """
+
+  def __init__(self, capacity=WORD_INDEX_CAPACITY):
+    self.capacity = capacity
+    self.entries = collections.OrderedDict()
+    self.lock = threading.Lock()
+    self.lexed = 0
+    self.reused = 0
+
+  def invalidate(self, abs_path):
+    with self.lock:
+      self.entries.pop(os.path.abspath(abs_path), None)
+
+  def get_words(self, root, rel_fnames, encoding, abs_read_only_fnames=()):
+    """Returns the words of all given files, like one AutoCompleter over all of them would."""
+    words = set()
+    for rel_fname in rel_fnames:
+      words.update(self._file_words(root, rel_fname, encoding))
+    for abs_fname in abs_read_only_fnames or ():
+      words.update(self._file_words(root, os.path.relpath(abs_fname, root), encoding))
+    return words
+
+  def _file_words(self, root, rel_fname, encoding):
+    abs_path = os.path.abspath(os.path.join(root, rel_fname))
+    try:
+      stat = os.stat(abs_path)
+      signature = (stat.st_mtime_ns, stat.st_size, rel_fname, encoding)
+    except OSError:
+      signature = None
+
+    with self.lock:
+      entry = self.entries.get(abs_path)
+      if entry is not None and signature is not None and entry[0] == signature:
+        self.entries.move_to_end(abs_path)
+        self.reused += 1
+        return entry[1]
+
+    auto_completer = AutoCompleter(
+      root=root,
+      rel_fnames=[rel_fname],
+      addable_rel_fnames=[],
+      commands=None,
+      encoding=encoding,
+    )
+    auto_completer.tokenize()
+    words = frozenset(word[0] if isinstance(word, tuple) else word for word in auto_completer.words)
+
+    with self.lock:
+      self.lexed += 1
+      if signature is not None:
+        self.entries[abs_path] = (signature, words)
+        self.entries.move_to_end(abs_path)
+        while len(self.entries) > self.capacity:
+          self.entries.popitem(last=False)
+    return words
+
+def repo_map_hash(repo_map):
+  return hashlib.sha1(repo_map.encode("utf-8", "surrogatepass")).hexdigest()
+
+def repo_map_delta(old, new):
+  """Line-level delta turning `old` into `new`.
+
+  Returns `[start, end, lines]` operations in ascending order, each replacing old lines
+  `start:end` with `lines`. Lines are split on "\n" and joined back with "\n".
+  """
+  old_lines = old.split("\n")
+  new_lines = new.split("\n")
+  matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+  return [
+    [old_start, old_end, new_lines[new_start:new_end]]
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes()
+    if tag != "equal"
+  ]
+
+# what a root commit is diffed against
+EMPTY_TREE_HASH = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+def commit_parent(repo, commit_hash):
+  return f"{commit_hash}~1" if repo.repo.commit(commit_hash).parents else EMPTY_TREE_HASH
+
+def commit_diff_summary(repo, commit_hash):
+  """Files changed by `commit_hash` against its parent, as `{path, added, removed}` entries.
+
+  Counts are None for binary files. Blocking, call it off the event loop.
+  """
+  # -z keeps paths unquoted, a rename is an empty path followed by the old and the new one
+  fields = iter(repo.repo.git.diff("--numstat", "-z", commit_parent(repo, commit_hash), commit_hash).split("\0"))
+  files = []
+  for field in fields:
+    if not field:
+      continue
+    added, removed, path = field.split("\t", 2)
+    if not path:
+      next(fields)
+      path = next(fields)
+    files.append({
+      "path": path,
+      "added": int(added) if added != "-" else None,
+      "removed": int(removed) if removed != "-" else None,
+    })
+  return files
+
+def commit_diff(repo, commit_hash, path=None, limit=COMMIT_DIFF_MAX_SIZE):
+  """Diff of `commit_hash` against its parent, optionally limited to `path`.
+
+  Returns `(diff, truncated)`, the diff being cut at `limit` characters. Blocking, call it
+  off the event loop.
+  """
+  args = [commit_parent(repo, commit_hash), commit_hash]
+  if path:
+    args += ["--", path]
+  diff = repo.repo.git.diff(*args)
+  if limit and len(diff) > limit:
+    return diff[:limit], True
+  return diff, False
 
 def update_model_params(models_info, model):
   model_id = model.name
@@ -152,14 +1707,7 @@ class PromptExecutor:
     self.connector = connector
     self.active_prompts: Dict[str, asyncio.Task] = {}
     self.active_coders: Dict[str, Coder] = {}
-    self.active_futures: Dict[str, Future] = {}
-    self.executor = None
-
-  def get_executor(self):
-    if self.executor is None:
-      # create a new executor with 100 workers for 100 concurrent prompts
-      self.executor = ThreadPoolExecutor(max_workers=100)
-    return self.executor
+    self.scheduler = PromptScheduler(connector, PromptScheduler.auto_limit(connector.coder.main_model))
 
   async def run_prompt(self, prompt: str, prompt_context: PromptContext, mode=None, architect_model=None, messages=None, files=None, coder=None):
     prompt_coro = self._run_prompt_task(prompt, prompt_context, mode, architect_model, messages, files, coder)
@@ -178,6 +1726,8 @@ class PromptExecutor:
   # This new method contains the logic that used to be in _run_prompt_sync and _run_prompt_async
   async def _run_prompt_task(self, prompt: str, prompt_context: PromptContext, mode=None, architect_model=None, messages=None, files=None, coder=None):
     """The actual prompt execution logic, designed to be run as a task."""
+    with prompt_context.metrics.span("queueWait"):
+      await self.scheduler.acquire(prompt_context)
     try:
       # The core async logic from your old `_run_prompt_async`
       # Now you can directly await async functions without any special handling.
@@ -191,148 +1741,132 @@ class PromptExecutor:
     except Exception as e:
       self.connector.coder.io.tool_error(f"Error in prompt logic {prompt_context.id}: {str(e)}")
       raise
+    finally:
+      self.scheduler.release(prompt_context.id)
 
   async def _stream_and_send_responses(self, coder, prompt_context, prompt_to_run, log_context, extra_response_data=None):
     if extra_response_data is None:
       extra_response_data = {}
 
-    whole_content = ""
-    whole_reasoning = ""
     response_id = str(uuid.uuid4())
+    parser = ReasoningStreamParser()
 
-    # Track parsing state across chunks
-    reasoning_started = False
-    answer_started = False
-    buffer = ""
-
-    queue = asyncio.Queue()
-    executor = self.get_executor()
+    channel = ThreadChannel(self.connector.loop)
+    metrics = prompt_context.metrics
+    stream_started = time.monotonic()
+    stream_started_ns = time.time_ns()
 
     def _sync_worker():
+      first_chunk_at = last_chunk_at = None
+      chunks = 0
       try:
         for chunk in coder.run_stream(prompt_to_run):
+          last_chunk_at = time.monotonic()
+          first_chunk_at = first_chunk_at or last_chunk_at
+          chunks += 1
           if self.is_prompt_interrupted(prompt_context.id):
             break
-          # Put chunk into queue, handling potential queue full
-          fut = asyncio.run_coroutine_threadsafe(queue.put(chunk), self.connector.loop)
-          fut.result() # Wait for it to be put in queue
-        asyncio.run_coroutine_threadsafe(queue.put(None), self.connector.loop).result() # Sentinel for end
+          # Blocks only when the consumer falls behind by a full channel
+          channel.put(chunk)
+      except ChannelClosed:
+        # the consumer is gone (prompt cancelled), stop streaming
+        pass
       except Exception as e:
         self.connector.coder.io.tool_error(f"Error in run_stream for {log_context}: {str(e)}")
+      finally:
+        metrics.record_stream(stream_started, first_chunk_at, last_chunk_at, chunks)
+        channel.close()
 
-    future = self.connector.loop.run_in_executor(executor, _sync_worker)
-    self.active_futures[prompt_context.id] = future
+    # Admission is limited by the scheduler, so every admitted prompt gets its own thread.
+    # A pool could deadlock when architect prompts block their threads waiting for editors.
+    # The thread runs in a copy of the current context to keep the hub session of its output.
+    threading.Thread(target=contextvars.copy_context().run, args=(_sync_worker,), name=f"prompt-{prompt_context.id}", daemon=True).start()
 
-    while True:
-      chunk = await queue.get()
-      if chunk is None:
-        break
-      whole_content += chunk
-      buffer += chunk
-
-      # Parse reasoning/content from buffer
-      reasoning_chunk = ""
-      content_chunk = ""
-      should_send = True
-
-      # Check for THINKING marker
-      thinking_match = THINKING_MARKER.search(buffer)
-      if thinking_match and not reasoning_started and not answer_started:
-        before = buffer[:thinking_match.start()]
-        reasoning_started = True
-        buffer = buffer[thinking_match.end():]
-        if before.strip():
-          content_chunk = before
-        elif buffer:
-          reasoning_chunk = buffer
-          buffer = ""
-        else:
-          should_send = False
-      else:
-        # Check for ANSWER marker
-        answer_match = ANSWER_MARKER.search(buffer)
-        if answer_match and reasoning_started and not answer_started:
-          # Send reasoning before the marker as a separate chunk
-          reasoning_before_marker = buffer[:answer_match.start()]
-          if reasoning_before_marker.strip():
-            reasoning_payload = {
-              "id": response_id,
-              "action": "response",
-              "finished": False,
-              "content": "",
-              "reasoning": reasoning_before_marker,
-              "promptContext": {"id": prompt_context.id, "group": prompt_context.group if hasattr(prompt_context, 'group') else None},
-            }
-            if extra_response_data:
-              reasoning_payload.update(extra_response_data)
-            await self.connector.send_action(reasoning_payload, False)
-          whole_reasoning += reasoning_before_marker
-          answer_started = True
-          buffer = buffer[answer_match.end():]
-          if buffer:
-            content_chunk = buffer
-            buffer = ""
-          else:
-            should_send = False
+    base_payload = {
+      "id": response_id,
+      "action": "response",
+      "finished": False,
+      "content": "",
+      "reasoning": "",
+      "promptContext": {"id": prompt_context.id, "group": prompt_context.group if hasattr(prompt_context, 'group') else None},
+    }
+    if extra_response_data:
+      base_payload.update(extra_response_data)
+    coalescer = ResponseCoalescer(self.connector, base_payload, on_sent=lambda latency: metrics.add_duration("outboundWait", latency))
+
+    async def send_deltas(deltas, state_before):
+      for kind, text in deltas:
+        if kind == ReasoningStreamParser.REASONING:
+          await coalescer.add(reasoning=text)
         else:
-          # No marker found, stream the appropriate field
-          if answer_started:
-            content_chunk = buffer
-            buffer = ""
-          elif reasoning_started:
-            reasoning_chunk = buffer
-            buffer = ""
-          else:
-            content_chunk = buffer
-            buffer = ""
+          await coalescer.add(content=text)
+      if parser.state != state_before:
+        # marker transition, send everything collected so far
+        await coalescer.flush()
 
-      if not should_send:
-        continue
+    try:
+      while True:
+        try:
+          batch = await channel.get_batch(coalescer.time_until_flush())
+        except asyncio.TimeoutError:
+          # flush window elapsed without new chunks
+          await coalescer.flush()
+          continue
 
-      whole_reasoning += reasoning_chunk
+        if batch is None:
+          break
 
-      response_payload = {
-        "id": response_id,
-        "action": "response",
-        "finished": False,
-        "content": content_chunk,
-        "reasoning": reasoning_chunk,
-        "promptContext": {"id": prompt_context.id, "group": prompt_context.group if hasattr(prompt_context, 'group') else None},
-      }
-      if extra_response_data:
-        response_payload.update(extra_response_data)
+        for chunk in batch:
+          state_before = parser.state
+          await send_deltas(parser.feed(chunk), state_before)
+    finally:
+      # unblocks the worker thread if we stopped consuming early
+      channel.cancel()
 
-      await self.connector.send_action(response_payload, False)
+    # Handle any remaining buffered content (e.g., a tail that turned out not to be a marker)
+    state_before = parser.state
+    await send_deltas(parser.finish(), state_before)
 
-    # Handle any remaining buffered content (e.g., reasoning without an answer marker)
-    if buffer.strip():
-      if reasoning_started and not answer_started:
-        whole_reasoning += buffer
-        response_payload = {
-          "id": response_id,
-          "action": "response",
-          "finished": False,
-          "content": "",
-          "reasoning": buffer,
-          "promptContext": {"id": prompt_context.id, "group": prompt_context.group if hasattr(prompt_context, 'group') else None},
-        }
-        if extra_response_data:
-          response_payload.update(extra_response_data)
-        await self.connector.send_action(response_payload, False)
-      elif not answer_started:
-        response_payload = {
-          "id": response_id,
-          "action": "response",
-          "finished": False,
-          "content": buffer,
-          "reasoning": "",
-          "promptContext": {"id": prompt_context.id, "group": prompt_context.group if hasattr(prompt_context, 'group') else None},
-        }
-        if extra_response_data:
-          response_payload.update(extra_response_data)
-        await self.connector.send_action(response_payload, False)
+    # the final response frame must not overtake pending deltas
+    await coalescer.flush()
+    metrics.add_span("stream", stream_started, stream_started_ns)
+
+    return parser, response_id
+
+  async def _send_final_response(self, response_data, prompt_context):
+    """Queues a final response frame; returns a future resolved once it was emitted."""
+    sent = self.connector.loop.create_future()
+
+    def on_sent(latency):
+      prompt_context.metrics.add_duration("outboundWait", latency)
+      if not sent.done():
+        sent.set_result(None)
 
-    return whole_content, response_id, whole_reasoning
+    await self.connector.send_action(response_data, on_sent)
+    return sent
+
+  async def _get_commit_diff_data(self, coder):
+    """Per-file summary of the last aider commit, plus its full diff when it is small.
+
+    Both run in a worker thread. Diffs over COMMIT_DIFF_INLINE_LINES changed lines or one
+    COMMIT_DIFF_CHUNK_SIZE chunk are left out of the response and fetched by AiderDesk on
+    demand with a `request-commit-diff` message.
+    """
+    commit_hash = coder.last_aider_commit_hash
+
+    def compute():
+      files = commit_diff_summary(coder.repo, commit_hash)
+      changed_lines = sum((file["added"] or 0) + (file["removed"] or 0) for file in files)
+      if changed_lines > COMMIT_DIFF_INLINE_LINES:
+        return {"diffFiles": files}
+      diff, truncated = commit_diff(coder.repo, commit_hash, limit=COMMIT_DIFF_CHUNK_SIZE)
+      return {"diffFiles": files} if truncated else {"diffFiles": files, "diff": diff}
+
+    try:
+      return await asyncio.to_thread(compute)
+    except Exception as e:
+      coder.io.tool_warning(f"Unable to get diff of commit {commit_hash}: {str(e)}")
+      return {}
 
   async def _run_prompt_async(self, prompt: str, prompt_context: PromptContext, mode=None, architect_model=None, messages=None, files=None, coder=None):
     coder_provided = coder is not None
@@ -351,15 +1885,16 @@ class PromptExecutor:
 
         sequence_number = -1
 
-      coder = clone_coder(
-        self.connector,
-        self.connector.coder,
-        prompt_context,
-        messages,
-        files,
-        edit_format=mode,
-        main_model=running_model,
-      )
+      with prompt_context.metrics.span("clone"):
+        coder = clone_coder(
+          self.connector,
+          self.connector.coder,
+          prompt_context,
+          messages,
+          files,
+          edit_format=mode,
+          main_model=running_model,
+        )
 
     # we are sending all the additional messages after the prompt finishes
     coder.io.add_command_to_context = False
@@ -372,25 +1907,17 @@ class PromptExecutor:
     # setting usage report to None to avoid no attribute error
     coder.usage_report = None
 
-    whole_content, response_id, whole_reasoning = await self._stream_and_send_responses(coder, prompt_context, prompt, prompt_context.id)
+    parser, response_id = await self._stream_and_send_responses(coder, prompt_context, prompt, prompt_context.id)
 
-    if not whole_content and not self.is_prompt_interrupted(prompt_context.id):
+    if not parser.content and not self.is_prompt_interrupted(prompt_context.id) and coder.partial_response_content:
       # if there was no content, use the partial_response_content value (case for non streaming models)
-      whole_content = coder.partial_response_content
-
-    # Parse reasoning/answer from raw content (handles both streaming and non-streaming)
-    whole_reasoning = whole_reasoning or ""
-    whole_answer = whole_content
-    if whole_content:
-      thinking_match = THINKING_MARKER.search(whole_content)
-      if thinking_match:
-        answer_match = ANSWER_MARKER.search(whole_content)
-        if answer_match:
-          whole_reasoning = whole_reasoning or whole_content[thinking_match.end():answer_match.start()].strip()
-          whole_answer = whole_content[answer_match.end():].strip()
-        else:
-          whole_reasoning = whole_reasoning or whole_content[thinking_match.end():].strip()
-          whole_answer = ""
+      parser = ReasoningStreamParser()
+      parser.feed(coder.partial_response_content)
+      parser.finish()
+
+    whole_content = parser.content
+    whole_reasoning = parser.reasoning
+    whole_answer = parser.answer
 
     def get_usage_report():
       return (coder.usage_report + f" Total cost: ${coder.total_cost:.10f} session") if coder.usage_report else None
@@ -414,18 +1941,13 @@ class PromptExecutor:
         "commitHash": coder.last_aider_commit_hash,
         "commitMessage": coder.last_aider_commit_message,
       })
-      # Add diff if there was a commit
-      commits = f"{coder.last_aider_commit_hash}~1"
       if coder.repo:
-        diff = coder.repo.diff_commits(
-          coder.pretty,
-          commits,
-          coder.last_aider_commit_hash,
-        )
-        response_data["diff"] = diff
+        with prompt_context.metrics.span("diff"):
+          response_data.update(await self._get_commit_diff_data(coder))
 
+    response_sent = None
     if whole_content or not self.is_prompt_interrupted(prompt_context.id):
-      await self.connector.send_action(response_data)
+      response_sent = await self._send_final_response(response_data, prompt_context)
 
     # Check for reflections
     if coder.reflected_message:
@@ -441,11 +1963,13 @@ class PromptExecutor:
         reflection_prompt = coder.reflected_message
         await self.connector.send_log_message("loading", "Reflecting message...", False, prompt_context)
 
-        whole_content, response_id, whole_reasoning = await self._stream_and_send_responses(
+        parser, response_id = await self._stream_and_send_responses(
           coder, prompt_context, reflection_prompt,
           f"reflection in {prompt_context.id}",
           {"reflectedMessage": reflection_prompt}
         )
+        whole_content = parser.content
+        whole_reasoning = parser.reasoning
 
         sequence_number += 1
         response_data = {
@@ -462,15 +1986,27 @@ class PromptExecutor:
         }
 
         if whole_content or not self.is_prompt_interrupted(prompt_context.id):
-          await self.connector.send_action(response_data)
+          response_sent = await self._send_final_response(response_data, prompt_context)
 
         # await self.connector.send_update_context_files()
         current_reflection += 1
+        prompt_context.metrics.reflections = current_reflection
 
     if not coder_provided:
       self.connector.coder.total_cost = coder.total_cost
       self.connector.coder.aider_commit_hashes = coder.aider_commit_hashes
 
+    # the queue wait of the last response frame is part of the metrics
+    if response_sent:
+      await response_sent
+    metrics = prompt_context.metrics.to_dict()
+    await self.connector.send_action({
+      "action": "prompt-metrics",
+      "promptId": prompt_context.id,
+      "metrics": metrics,
+    })
+    export_prompt_metrics(prompt_context, metrics)
+
     # Send prompt-finished message
     await self.connector.send_action({
       "action": "prompt-finished",
@@ -479,9 +2015,11 @@ class PromptExecutor:
 
     # Send command outputs as context messages
     if hasattr(coder, 'command_outputs') and coder.command_outputs:
+      messages = []
       for output in coder.command_outputs:
-        await self.connector.send_add_context_message("user", output)
-        await self.connector.send_add_context_message("assistant", "Ok.")
+        messages.append({"role": "user", "content": output})
+        messages.append({"role": "assistant", "content": "Ok."})
+      await self.connector.send_add_context_messages(messages)
 
   async def _execute_prompt_wrapper(self, prompt_context: PromptContext, prompt_coro: Coroutine[Any, Any, Any]):
     """
@@ -508,7 +2046,6 @@ class PromptExecutor:
     """Clean up completed or cancelled prompt."""
     self.active_prompts.pop(prompt_id, None)
     self.active_coders.pop(prompt_id, None)
-    self.active_futures.pop(prompt_id, None)
 
   def get_coder(self, prompt_id: str) -> Optional[Coder]:
     """Retrieve the coder instance for a given prompt ID."""
@@ -517,11 +2054,6 @@ class PromptExecutor:
   async def cancel_prompt(self, prompt_id: str) -> bool:
     """Cancel a specific prompt task."""
 
-    # Cancel the executor future if it exists
-    if prompt_id in self.active_futures:
-      future = self.active_futures[prompt_id]
-      future.cancel()
-
     # Set the coder's IO to cancelled if it exists
     if prompt_id in self.active_coders:
       coder = self.active_coders[prompt_id]
@@ -568,37 +2100,50 @@ async def run_editor_coder_stream(architect_coder, connector, prompt_context):
   # Use the editor_model from the main_model if it exists, otherwise use the main_model itself
   editor_model = architect_coder.main_model.editor_model or architect_coder.main_model
   # Generate a prompt info for the editor coder
-  editor_prompt_context = PromptContext(str(uuid.uuid4()), prompt_context.group)
-
-  editor_coder = clone_coder(
-    connector,
-    architect_coder,
-    editor_prompt_context,
-    main_model=editor_model,
-    edit_format=connector.coder.edit_format,
-    suggest_shell_commands=False,
-    map_tokens=0,
-    total_cost=architect_coder.total_cost,
-    cache_prompts=False,
-    num_cache_warming_pings=0,
-  )
+  editor_prompt_context = PromptContext(str(uuid.uuid4()), prompt_context.group, priority=PROMPT_PRIORITY_EDITOR)
+
+  with editor_prompt_context.metrics.span("clone"):
+    editor_coder = clone_coder(
+      connector,
+      architect_coder,
+      editor_prompt_context,
+      main_model=editor_model,
+      edit_format=connector.coder.edit_format,
+      suggest_shell_commands=False,
+      map_tokens=0,
+      total_cost=architect_coder.total_cost,
+      cache_prompts=False,
+      num_cache_warming_pings=0,
+    )
   editor_coder.cur_messages = []
   editor_coder.done_messages = []
 
-  # Start the prompt execution (non-blocking)
+  # The architect prompt only waits for its editor, lend its slot to the editor meanwhile
+  scheduler = connector.prompt_executor.scheduler
+  scheduler.release(prompt_context.id)
 
-  await connector.prompt_executor.run_prompt(architect_coder.partial_response_content, editor_prompt_context, "code", coder=editor_coder)
+  try:
+    # Start the prompt execution (non-blocking)
 
-  # Wait for completion by awaiting the task
-  if editor_prompt_context.id in connector.prompt_executor.active_prompts:
-    task = connector.prompt_executor.active_prompts[editor_prompt_context.id]
-    try:
-      await task
-      architect_coder.aider_edited_files = editor_coder.aider_edited_files
-      architect_coder.total_cost = editor_coder.total_cost
-      architect_coder.aider_commit_hashes = editor_coder.aider_commit_hashes
-    except asyncio.CancelledError:
-      pass # The task was cancelled, which is an expected way for it to end.
+    await connector.prompt_executor.run_prompt(architect_coder.partial_response_content, editor_prompt_context, "code", coder=editor_coder)
+
+    # Wait for completion by awaiting the task
+    if editor_prompt_context.id in connector.prompt_executor.active_prompts:
+      task = connector.prompt_executor.active_prompts[editor_prompt_context.id]
+      try:
+        await task
+        architect_coder.aider_edited_files = editor_coder.aider_edited_files
+        architect_coder.total_cost = editor_coder.total_cost
+        architect_coder.aider_commit_hashes = editor_coder.aider_commit_hashes
+      except asyncio.CancelledError:
+        pass # The task was cancelled, which is an expected way for it to end.
+  finally:
+    if prompt_context.id in connector.prompt_executor.active_prompts:
+      try:
+        with prompt_context.metrics.span("queueWait"):
+          await scheduler.acquire(prompt_context)
+      except asyncio.CancelledError:
+        pass # The architect prompt was cancelled while waiting for its slot back.
 
 class ConnectorInputOutput(InputOutput):
   def __init__(self, connector=None, prompt_context=None, **kwargs):
@@ -614,6 +2159,18 @@ class ConnectorInputOutput(InputOutput):
     self.cancelled = False
     super().__init__(**kwargs)
 
+  def fork(self, prompt_context=None):
+    """Copy with the same settings for another coder, without running InputOutput's initialization again."""
+    io = copy.copy(self)
+    copy_containers(io)
+    io.prompt_context = prompt_context
+    io.running_shell_command = False
+    io.processing_loading_message = False
+    io.current_command = None
+    io.add_command_to_context = True
+    io.cancelled = False
+    return io
+
   def add_to_input_history(self, input_text):
     # handled by AiderDesk
     pass
@@ -637,7 +2194,7 @@ class ConnectorInputOutput(InputOutput):
     else:
       for message in messages:
         if message.startswith("Commit ") or message.startswith("Retrying in "):
-          wait_for_async(self.connector, self.connector.send_log_message("info", message, True, self.prompt_context))
+          self.connector.post_log_message("info", message, True, self.prompt_context)
 
   def is_warning_ignored(self, message):
     if message == "Warning: it's best to only add files that need changes to the chat.":
@@ -653,7 +2210,7 @@ class ConnectorInputOutput(InputOutput):
       return
     super().tool_warning(message, strip)
     if self.connector and not self.is_warning_ignored(message):
-      wait_for_async(self.connector, self.connector.send_log_message("warning", message, self.processing_loading_message, self.prompt_context))
+      self.connector.post_log_message("warning", message, self.processing_loading_message, self.prompt_context)
 
   def is_error_ignored(self, message):
     if message.strip().startswith("Scanning repo:"):
@@ -675,7 +2232,7 @@ class ConnectorInputOutput(InputOutput):
     super().tool_error(message, strip)
     if self.connector and not self.is_error_ignored(message):
       sys.stderr.write(f"ERROR: {message}\n")
-      wait_for_async(self.connector, self.connector.send_log_message("error", message, False, self.prompt_context))
+      self.connector.post_log_message("error", message, False, self.prompt_context)
 
   def confirm_ask(
     self,
@@ -699,22 +2256,29 @@ class ConnectorInputOutput(InputOutput):
     if not self.connector:
       return False
 
-    # Reset the result
-    global confirmation_result
-    confirmation_result = None
-
-    # Create coroutine for emitting the question
+    # Create coroutine for emitting the question and waiting for its answer
     async def ask_question():
-      await self.connector.sio.emit('message', {
+      question_id = str(uuid.uuid4())
+      answer_future = self.connector.questions.register(question_id)
+      timeout = self.prompt_context.question_timeout if self.prompt_context else None
+
+      await self.connector.send_action({
         'action': 'ask-question',
+        'questionId': question_id,
         'question': question,
         'subject': subject,
         'isGroupQuestion': group is not None,
         'defaultAnswer': default
       })
-      while confirmation_result is None:
-        await asyncio.sleep(0.25)
-      return confirmation_result
+      try:
+        return await asyncio.wait_for(answer_future, timeout)
+      except asyncio.TimeoutError:
+        await self.connector.send_log_message("warning", f"No answer received for '{question}' within {timeout} seconds.", False, self.prompt_context)
+        return "n"
+      except asyncio.CancelledError:
+        return "n"
+      finally:
+        self.connector.questions.discard(question_id)
 
     if question == "Add URL to the chat?":
       # we are handling this in AiderDesk differently
@@ -738,7 +2302,7 @@ class ConnectorInputOutput(InputOutput):
       coder_for_prompt = self.connector.prompt_executor.get_coder(self.prompt_context.id) if self.prompt_context else None
       if coder_for_prompt: # Ensure we have a valid coder
         # Process architect coder
-        wait_for_async(self.connector, self.connector.send_log_message("loading", "Editing files...", False, self.prompt_context))
+        self.connector.post_log_message("loading", "Editing files...", False, self.prompt_context)
         wait_for_async(self.connector, run_editor_coder_stream(coder_for_prompt, self.connector, self.prompt_context))
       return False
 
@@ -821,17 +2385,114 @@ class ConnectorInputOutput(InputOutput):
           "name": f"AI request detected in files: {changed_files}",
           "color": "var(--color-agent-ai-request)"
         }
-        prompt_context = PromptContext(str(uuid.uuid4()), group)
+        prompt_context = PromptContext(str(uuid.uuid4()), group, priority=PROMPT_PRIORITY_FILE_WATCHER)
 
         self.connector.loop.create_task(process_changes())
 
+def copy_containers(obj, shared=()):
+  """Gives a shallow copy its own lists, dicts and sets, except the `shared` attributes."""
+  for name, value in list(vars(obj).items()):
+    if name not in shared and isinstance(value, (list, dict, set)):
+      setattr(obj, name, copy.copy(value))
+
+class CoderTemplatePool:
+  """Pre-built coders that prompts, commands and editor handoffs are checked out from, each checkout with its own repo map."""
+
+  # kwargs holding chat state rather than configuration, set on the checkout
+  STATE_KWARGS = ("total_cost",)
+  # not copied per checkout
+  SHARED_ATTRIBUTES = ("original_kwargs",)
+  SHARED_REPO_MAP_ATTRIBUTES = ("TAGS_CACHE",)
+
+  def __init__(self):
+    self.templates = {}
+    self.hits = 0
+    self.misses = 0
+
+  def clear(self):
+    self.templates.clear()
+
+  def _key(self, from_coder, kwargs):
+    main_model = kwargs.get("main_model") or from_coder.main_model
+    edit_format = kwargs.get("edit_format")
+    if edit_format in (None, "code"):
+      edit_format = from_coder.edit_format
+
+    options = tuple(sorted(
+      (name, value) for name, value in kwargs.items()
+      if name not in ("main_model", "edit_format") and name not in self.STATE_KWARGS
+    ))
+    key = (
+      main_model.name,
+      getattr(main_model.weak_model, "name", None),
+      getattr(main_model.editor_model, "name", None),
+      edit_format,
+      from_coder.root,
+      # coders inherit the construction kwargs of the coder they are cloned from
+      id(from_coder.original_kwargs),
+      options,
+    )
+    hash(key)
+    return key
+
+  def checkout(self, from_coder, **kwargs):
+    """Returns a new coder like `Coder.create(from_coder=from_coder, **kwargs)`, or None if the kwargs cannot be pooled."""
+    try:
+      key = self._key(from_coder, kwargs)
+    except TypeError:
+      return None
+
+    entry = self.templates.get(key)
+    if entry is None:
+      self.misses += 1
+      build_kwargs = {name: value for name, value in kwargs.items() if name not in self.STATE_KWARGS}
+      template = Coder.create(from_coder=from_coder, summarize_from_coder=False, **build_kwargs)
+      # keeps from_coder.original_kwargs alive so its id in the key is not reused
+      entry = self.templates[key] = (template, from_coder.original_kwargs)
+    else:
+      self.hits += 1
+
+    coder = copy.copy(entry[0])
+    copy_containers(coder, self.SHARED_ATTRIBUTES)
+    if coder.repo_map:
+      coder.repo_map = copy.copy(coder.repo_map)
+      copy_containers(coder.repo_map, self.SHARED_REPO_MAP_ATTRIBUTES)
+
+    # same state Coder.create brings along from the old coder
+    coder.main_model = kwargs.get("main_model") or from_coder.main_model
+    coder.abs_fnames = set(from_coder.abs_fnames)
+    coder.abs_read_only_fnames = set(from_coder.abs_read_only_fnames)
+    coder.done_messages = from_coder.done_messages if from_coder.done_messages else []
+    coder.cur_messages = from_coder.cur_messages if from_coder.cur_messages else []
+    coder.aider_commit_hashes = from_coder.aider_commit_hashes if from_coder.aider_commit_hashes else set()
+    coder.ignore_mentions = from_coder.ignore_mentions if from_coder.ignore_mentions else set()
+    coder.total_cost = from_coder.total_cost
+    coder.total_tokens_sent = from_coder.total_tokens_sent
+    coder.total_tokens_received = from_coder.total_tokens_received
+    coder.file_watcher = from_coder.file_watcher
+    coder.io = from_coder.io
+    coder.commands = from_coder.commands.clone()
+    coder.commands.coder = coder
+    from_coder.ok_to_warm_cache = False
+
+    for name in self.STATE_KWARGS:
+      if name in kwargs:
+        setattr(coder, name, kwargs[name])
+
+    return coder
+
 def clone_coder(connector, coder, prompt_context=None, messages=None, files=None, **kwargs):
-  kwargs["from_coder"] = coder
-  kwargs["summarize_from_coder"] = False
+  from_coder = coder
+  coder = connector.coder_pool.checkout(from_coder, **kwargs) if connector.coder_pool else None
+  if coder is None:
+    coder = Coder.create(from_coder=from_coder, summarize_from_coder=False, **kwargs)
+
+  if coder.repo:
+    # own repo wrapper per coder, so concurrent prompts do not overwrite each other's IO and patches
+    coder.repo = copy.copy(from_coder.repo or coder.repo)
 
-  coder = Coder.create(**kwargs)
   create_io(connector, coder, prompt_context)
-  connector.monkey_patch_coder_functions(coder)
+  connector.monkey_patch_coder_functions(coder, prompt_context)
 
   if coder.repo:
     connector.monkey_patch_repo_functions(coder.repo, prompt_context)
@@ -859,38 +2520,41 @@ def clone_coder(connector, coder, prompt_context=None, messages=None, files=None
 
   return coder
 
-def create_base_coder(connector):
-  coder = cli_main(return_coder=True)
+def create_base_coder(connector, argv=None):
+  coder = cli_main(argv=argv, return_coder=True)
   if not isinstance(coder, Coder):
     raise ValueError(coder)
 
   return coder
 
 def create_io(connector, coder, prompt_context=None):
-  io = ConnectorInputOutput(
-    connector=connector,
-    prompt_context=prompt_context,
-    pretty=False,
-    yes=None,
-    chat_history_file=coder.io.chat_history_file,
-    input=coder.io.input,
-    output=coder.io.output,
-    user_input_color=coder.io.user_input_color,
-    tool_output_color=coder.io.tool_output_color,
-    tool_warning_color=coder.io.tool_warning_color,
-    tool_error_color=coder.io.tool_error_color,
-    completion_menu_color=coder.io.completion_menu_color,
-    completion_menu_bg_color=coder.io.completion_menu_bg_color,
-    completion_menu_current_color=coder.io.completion_menu_current_color,
-    completion_menu_current_bg_color=coder.io.completion_menu_current_bg_color,
-    assistant_output_color=coder.io.assistant_output_color,
-    code_theme=coder.io.code_theme,
-    dry_run=coder.io.dry_run,
-    encoding=coder.io.encoding,
-    llm_history_file=coder.io.llm_history_file,
-    editingmode=coder.io.editingmode,
-    fancy_input=False
-  )
+  if isinstance(coder.io, ConnectorInputOutput):
+    io = coder.io.fork(prompt_context)
+  else:
+    io = ConnectorInputOutput(
+      connector=connector,
+      prompt_context=prompt_context,
+      pretty=False,
+      yes=None,
+      chat_history_file=coder.io.chat_history_file,
+      input=coder.io.input,
+      output=coder.io.output,
+      user_input_color=coder.io.user_input_color,
+      tool_output_color=coder.io.tool_output_color,
+      tool_warning_color=coder.io.tool_warning_color,
+      tool_error_color=coder.io.tool_error_color,
+      completion_menu_color=coder.io.completion_menu_color,
+      completion_menu_bg_color=coder.io.completion_menu_bg_color,
+      completion_menu_current_color=coder.io.completion_menu_current_color,
+      completion_menu_current_bg_color=coder.io.completion_menu_current_bg_color,
+      assistant_output_color=coder.io.assistant_output_color,
+      code_theme=coder.io.code_theme,
+      dry_run=coder.io.dry_run,
+      encoding=coder.io.encoding,
+      llm_history_file=coder.io.llm_history_file,
+      editingmode=coder.io.editingmode,
+      fancy_input=False
+    )
 
   coder.commands.io = io
   coder.io = io
@@ -899,8 +2563,52 @@ def create_io(connector, coder, prompt_context=None):
 
   return io
 
+async def connect_with_retry(sio, server_url, on_connect, before_attempt=None):
+  """Connects a Socket.IO client to AiderDesk with retry logic, then calls `on_connect`."""
+  max_retries = 10
+  base_delay = 0.5  # Initial delay in seconds
+  max_delay = 5.0   # Maximum delay in seconds
+
+  for attempt in range(max_retries):
+    try:
+      if before_attempt:
+        before_attempt()
+
+      # Add a small delay before the first connection attempt to give
+      # the server time to be fully ready. This helps avoid the
+      # "One or more namespaces failed to connect" error.
+      if attempt == 0:
+        await asyncio.sleep(0.1)
+
+      # Connect with explicit timeout. The default is 5 seconds which can
+      # be too short if the server is still initializing.
+      connector_token = os.getenv("AIDER_DESK_CONNECTOR_TOKEN")
+      auth = {"connectorToken": connector_token} if connector_token else None
+      await sio.connect(server_url, auth=auth)
+
+      # Explicitly call on_connect after successful connection
+      # This ensures init message is sent even if the event handler doesn't fire
+      # (which can happen on reconnection after namespace errors)
+      await on_connect()
+      return  # Connection successful
+    except Exception as e:
+      if attempt == max_retries - 1:
+        # Last attempt failed, re-raise the exception
+        raise
+
+      # Calculate delay with exponential backoff
+      delay = min(base_delay * (2 ** attempt), max_delay)
+      sys.stderr.write(f"Connection refused by the server: {e}. Retrying in {delay:.1f}s... (attempt {attempt + 1}/{max_retries})\n")
+      sys.stderr.flush()
+
+      # Disconnect any partial connection before retrying
+      if sio.connected:
+        await sio.disconnect()
+
+      await asyncio.sleep(delay)
+
 class Connector:
-  def __init__(self, base_dir, task_id, task_dir, watch_files=False, server_url="http://localhost:24337", reasoning_effort=None, thinking_tokens=None, confirm_before_edit=False):
+  def __init__(self, base_dir, task_id, task_dir, watch_files=False, server_url="http://localhost:24337", reasoning_effort=None, thinking_tokens=None, confirm_before_edit=False, argv=None, hub=None):
     self.base_dir = base_dir
     self.task_id = task_id
     self.task_dir = task_dir
@@ -910,15 +2618,37 @@ class Connector:
     self.confirm_before_edit = confirm_before_edit
     self.models_info = None
     self._initialized = False
+    self.hub = hub
 
-    try:
-      self.loop = asyncio.get_event_loop()
-    except RuntimeError:
-      self.loop = asyncio.new_event_loop()
-      asyncio.set_event_loop(self.loop)
+    if hub:
+      # a session of a ConnectorHub shares its loop and Socket.IO connection
+      self.loop = hub.loop
+      self.sio = hub.sio
+      self.outbound = SessionOutbound(hub.outbound, task_id)
+    else:
+      try:
+        self.loop = asyncio.get_event_loop()
+      except RuntimeError:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+      # Outgoing messages, ready before the coder starts logging
+      self.sio = socketio.AsyncClient()
+      self.outbound = OutboundQueue(self.sio, self.loop)
+    self.log_buffer = LogBuffer(self)
+
+    tags_cache_path = os.path.join(base_dir, ".aider-desk", "cache", "tags")
+    if not TAGS_CACHE_SHARED:
+      self.tags_cache = None
+    elif hub:
+      self.tags_cache = hub.get_tags_cache(tags_cache_path)
+    else:
+      self.tags_cache = ProjectTagsCache(tags_cache_path)
+
+    self.file_index = TrackedFileIndex()
 
     # Create initial coder for setup and non-prompt operations
-    self.coder = create_base_coder(self)
+    self.coder = create_base_coder(self, argv)
     if reasoning_effort is not None:
       self.coder.main_model.set_reasoning_effort(reasoning_effort)
     if thinking_tokens is not None:
@@ -929,10 +2659,36 @@ class Connector:
 
     create_io(self, self.coder)
 
+    self.coder_pool = CoderTemplatePool() if CODER_POOL_ENABLED else None
+
     # Initialize prompt executor
     self.prompt_executor = PromptExecutor(self)
+    self.questions = QuestionRegistry(self.loop)
 
-    self.current_tokenization_task = None
+    self.refresh_scheduler = LatestWinsScheduler(self.loop)
+    self.warm_up = None
+
+    token_cache_path = os.path.join(base_dir, ".aider-desk", "cache", "token-counts.json") if TOKEN_CACHE_PERSIST else None
+    if hub:
+      self.token_cache = hub.get_token_cache(token_cache_path)
+      hub.share_repo_map_cache(self.coder)
+    else:
+      self.token_cache = TokenCountCache(path=token_cache_path)
+      self.token_cache.load()
+    self.chat_token_counter = ChatTokenCounter()
+    self.token_count_lock = threading.Lock()
+    # one token counting pool per process, the sessions of a hub share the hub's
+    self.token_counter = hub.token_counter if hub else TokenCountEngine()
+    self.tag_scanner = ParallelTagScanner(progress=self.report_scan_progress)
+    self.repo_map_worker = RepoMapWorker(self.loop, scanner=self.tag_scanner)
+    # last repo map sent to AiderDesk, updates are sent as deltas against it
+    self.sent_repo_map = None
+    self.sent_repo_map_hash = None
+    self.repo_map_updates_skipped = 0
+    self.word_index = WordIndex()
+    # autocompletion words last sent to AiderDesk, updates are sent as versioned deltas against them
+    self.sent_words = None
+    self.sent_words_version = 0
 
     if watch_files:
       ignores = []
@@ -942,10 +2698,11 @@ class Connector:
         ignores.append(self.coder.repo.aider_ignore_file)
 
       self.file_watcher = FileWatcher(self.coder, gitignores=ignores)
+      self.watch_file_changes(self.file_watcher)
       self.file_watcher.start()
 
-    self.sio = socketio.AsyncClient()
-    self.register_events()
+    if not hub:
+      self.register_events()
 
   def monkey_patch_coder_functions(self, coder, prompt_context=None):
     # self here is the Connector instance
@@ -954,11 +2711,12 @@ class Connector:
     original_lint_edited = coder.lint_edited
     def _patched_lint_edited(coder_instance, fnames):
       # Add loading message before linting
-      wait_for_async(self, self.send_log_message("loading", "Linting...", False, prompt_context))
+      self.post_log_message("loading", "Linting...", False, prompt_context)
       # Call the original Coder.lint_edited logic
-      result = original_lint_edited(fnames)
+      with prompt_span(prompt_context, "lint"):
+        result = original_lint_edited(fnames)
       # Finish the loading message after linting
-      wait_for_async(self, self.send_log_message("loading", "Linting...", True, prompt_context))
+      self.post_log_message("loading", "Linting...", True, prompt_context)
       return result
 
     # Replace the original lint_edited method with the patched version
@@ -1011,17 +2769,25 @@ class Connector:
     # Replace the original run_shell_commands method with the patched version
     coder.run_shell_commands = types.MethodType(_patched_run_shell_commands, coder)
 
+    # tags of files parsed by any task of the project are not parsed again
+    if self.tags_cache:
+      self.tags_cache.install(coder.repo_map)
+
+    self.file_index.install(coder)
+
   def monkey_patch_repo_functions(self, repo, prompt_context=None):
     if not repo:
       return
 
     # patch repo.get_commit_message to send a loading message while generating commit message
-    original_get_commit_message = repo.get_commit_message
+    # (wraps the class method, so a copied repo never stacks patches)
+    original_get_commit_message = types.MethodType(type(repo).get_commit_message, repo)
 
     def _patched_get_commit_message(repo_instance, diffs, context, user_language=None):
-      wait_for_async(self, self.send_log_message("loading", "Generating commit message...", False, prompt_context))
-      result = original_get_commit_message(diffs, context, user_language)
-      wait_for_async(self, self.send_log_message("loading", "Generating commit message...", True, prompt_context))
+      self.post_log_message("loading", "Generating commit message...", False, prompt_context)
+      with prompt_span(prompt_context, "commitMessage"):
+        result = original_get_commit_message(diffs, context, user_language)
+      self.post_log_message("loading", "Generating commit message...", True, prompt_context)
 
       return result
 
@@ -1053,6 +2819,10 @@ class Connector:
       return
 
     self._initialized = True
+    # a new AiderDesk session gets the full repo map and word list first
+    self.sent_repo_map = None
+    self.sent_repo_map_hash = None
+    self.sent_words = None
     sys.stdout.write("---- AIDER CONNECTOR CONNECTED TO AIDER DESK ----")
     sys.stdout.write(f"DEBUG: Sending init message to {self.server_url}\n")
     sys.stdout.flush()
@@ -1067,6 +2837,9 @@ class Connector:
         "answer-question",
         "set-models",
         "request-context-info",
+        "request-commit-diff",
+        "request-repo-map",
+        "request-autocompletion",
         "run-command",
         "interrupt-response",
         "apply-edits",
@@ -1079,24 +2852,62 @@ class Connector:
     sys.stdout.write("DEBUG: Init message sent successfully\n")
     sys.stdout.flush()
     await self.send_current_models()
+    self.start_warm_up()
+
+  def start_warm_up(self):
+    """Primes the file list, tokenizer, system prompt token count and repo map before the first request needs them."""
+    if self.warm_up:
+      self.warm_up.cancel()
+    if not WARM_UP_ENABLED:
+      return
+
+    async def list_files():
+      await asyncio.to_thread(self.file_index.get, self.coder)
+
+    async def load_tokenizer():
+      await asyncio.to_thread(self.coder.main_model.token_count, "warm-up")
+
+    async def count_system_prompt():
+      def count():
+        with self.token_count_lock:
+          self.chat_token_counter.system_tokens(self.coder)
+      await asyncio.to_thread(count)
+
+    async def build_repo_map():
+      if not self.coder.repo_map:
+        return
+      try:
+        tracked_files = await asyncio.to_thread(self.file_index.get, self.coder)
+        await self.repo_map_worker.build(self.coder.repo_map, set(), tracked_files.abs_set)
+      finally:
+        if self.tags_cache:
+          self.tags_cache.schedule_save(self.loop)
+
+    started = time.perf_counter()
+
+    def report(step, done, total, finished, cancelled):
+      self.outbound.put("message", {
+        "action": "warm-up",
+        "step": step,
+        "done": done,
+        "total": total,
+        "finished": finished,
+        "cancelled": cancelled,
+        "elapsedMs": round((time.perf_counter() - started) * 1000),
+      })
 
-  def _tokenize_files_sync(self, root, rel_fnames, addable_rel_fnames, encoding, abs_read_only_fnames):
-    """Synchronous helper function for file tokenization."""
-    try:
-      auto_completer = AutoCompleter(
-        root=root,
-        rel_fnames=rel_fnames,
-        addable_rel_fnames=addable_rel_fnames,
-        commands=None,
-        encoding=encoding,
-        abs_read_only_fnames=abs_read_only_fnames,
-      )
-      auto_completer.tokenize()
-      # Return tokenized words
-      return [word[0] if isinstance(word, tuple) else word for word in auto_completer.words]
-    except Exception as e:
-      self.coder.io.tool_error(f"Error during tokenization: {str(e)}")
-      return []
+    self.warm_up = WarmUp(
+      self.loop,
+      [("files", list_files), ("tokenizer", load_tokenizer), ("system-prompt", count_system_prompt), ("repo-map", build_repo_map)],
+      report,
+      # requests from AiderDesk go first
+      is_busy=lambda: bool(self.refresh_scheduler.tasks or self.prompt_executor.active_prompts),
+    )
+    self.warm_up.start()
+
+  def cancel_warm_up(self):
+    if self.warm_up:
+      self.warm_up.cancel()
 
   async def on_message(self, data):
     await asyncio.create_task(self.process_message(data))
@@ -1107,57 +2918,46 @@ class Connector:
 
     self._initialized = False
 
+    # Nobody is left to answer pending questions
+    self.questions.cancel_all()
+    self.cancel_warm_up()
+
     # Shutdown prompt executor
     if self.prompt_executor:
       await self.prompt_executor.shutdown()
 
-    if self.current_tokenization_task and not self.current_tokenization_task.done():
-      self.current_tokenization_task.cancel()
+    self.refresh_scheduler.cancel_all()
 
-  async def connect(self):
-    """Connect to the server with retry logic."""
-    max_retries = 10
-    base_delay = 0.5  # Initial delay in seconds
-    max_delay = 5.0   # Maximum delay in seconds
+    await asyncio.to_thread(self.token_cache.save)
+    if self.tags_cache:
+      await asyncio.to_thread(self.tags_cache.save)
 
-    for attempt in range(max_retries):
-      try:
-        # Reset initialized flag before each connection attempt
-        # This ensures on_connect runs properly after reconnection
-        self._initialized = False
-
-        # Add a small delay before the first connection attempt to give
-        # the server time to be fully ready. This helps avoid the
-        # "One or more namespaces failed to connect" error.
-        if attempt == 0:
-          await asyncio.sleep(0.1)
-
-        # Connect with explicit timeout. The default is 5 seconds which can
-        # be too short if the server is still initializing.
-        connector_token = os.getenv("AIDER_DESK_CONNECTOR_TOKEN")
-        auth = {"connectorToken": connector_token} if connector_token else None
-        await self.sio.connect(self.server_url, auth=auth)
-
-        # Explicitly call on_connect after successful connection
-        # This ensures init message is sent even if the event handler doesn't fire
-        # (which can happen on reconnection after namespace errors)
-        await self.on_connect()
-        return  # Connection successful
-      except Exception as e:
-        if attempt == max_retries - 1:
-          # Last attempt failed, re-raise the exception
-          raise
+    metrics = self.outbound.get_metrics()
+    self.coder.io.tool_output(
+      f"Outbound queue: {metrics['sent']} messages sent, max depth {metrics['maxDepth']}, "
+      f"average latency {metrics['averageLatencyMs']:.1f} ms, max latency {metrics['maxLatencyMs']:.1f} ms"
+    )
+    refresh_metrics = self.refresh_scheduler.get_metrics()
+    self.coder.io.tool_output(
+      f"Context refreshes: {refresh_metrics.get('requested', 0)} requested, {refresh_metrics.get('completed', 0)} completed, "
+      f"{refresh_metrics.get('debounced', 0)} debounced, {refresh_metrics.get('cancelled', 0)} cancelled while running"
+    )
 
-        # Calculate delay with exponential backoff
-        delay = min(base_delay * (2 ** attempt), max_delay)
-        sys.stderr.write(f"Connection refused by the server: {e}. Retrying in {delay:.1f}s... (attempt {attempt + 1}/{max_retries})\n")
-        sys.stderr.flush()
+  async def connect(self):
+    """Connect to the server with retry logic."""
+    def _before_attempt():
+      # Reset initialized flag before each connection attempt
+      # This ensures on_connect runs properly after reconnection
+      self._initialized = False
 
-        # Disconnect any partial connection before retrying
-        if self.sio.connected:
-          await self.sio.disconnect()
+    await connect_with_retry(self.sio, self.server_url, self.on_connect, _before_attempt)
 
-        await asyncio.sleep(delay)
+  async def close(self):
+    """Stops a ConnectorHub session; the hub's process and connection stay up."""
+    if getattr(self, "file_watcher", None):
+      self.file_watcher.stop()
+    await self.on_disconnect()
+    self.repo_map_worker.executor.shutdown(wait=False)
 
   async def wait(self):
     """Wait for events."""
@@ -1167,12 +2967,20 @@ class Connector:
     await self.connect()
     await self.wait()
 
-  async def send_action(self, action, with_delay = True):
-    await self.sio.emit('message', action)
-    if with_delay:
-      await asyncio.sleep(0.01)
+  async def send_action(self, action, on_sent=None):
+    return self.outbound.put("message", action, on_sent)
 
   async def send_log_message(self, level, message, finished=False, prompt_context=None):
+    self.queue_log_message(level, message, finished, prompt_context)
+
+  def post_log_message(self, level, message, finished=False, prompt_context=None):
+    """Non-blocking variant of send_log_message that is safe to call from any thread."""
+    self.log_buffer.post(level, message, finished, prompt_context)
+
+  def report_scan_progress(self, done, total, finished):
+    self.post_log_message("loading", f"Scanning repository: {done}/{total} files", finished)
+
+  def queue_log_message(self, level, message, finished=False, prompt_context=None):
     payload = {
       "level": level,
       "message": message,
@@ -1185,8 +2993,7 @@ class Connector:
         "group": prompt_context.group if hasattr(prompt_context, 'group') else None
       }
 
-    await self.sio.emit("log", payload)
-    await asyncio.sleep(0.01)
+    self.outbound.put("log", payload)
 
   async def process_message(self, message):
     """Process incoming message and return response"""
@@ -1208,17 +3015,25 @@ class Connector:
         if not prompt:
           return
 
+        # the prompt needs the CPU and the repo map worker more than the warm-up
+        self.cancel_warm_up()
+
         # Log the options with default values
         auto_approve = options.get('autoApprove', False)
         deny_commands = options.get('denyCommands', False)
         self.coder.io.tool_output(f"AiderRunOptions received: autoApprove={auto_approve}, denyCommands={deny_commands}")
 
-        prompt_context = PromptContext(prompt_context_data.get('id'), prompt_context_data.get('group'), auto_approve, deny_commands)
+        prompt_context = PromptContext(
+          prompt_context_data.get('id'),
+          prompt_context_data.get('group'),
+          auto_approve,
+          deny_commands,
+          options.get('questionTimeout'),
+        )
         await self.prompt_executor.run_prompt(prompt, prompt_context, mode, architect_model, messages, files)
 
       elif action == "answer-question":
-        global confirmation_result
-        confirmation_result = message.get('answer')
+        self.questions.resolve(message.get('questionId'), message.get('answer'))
 
       elif action == "set-models":
         try:
@@ -1240,9 +3055,11 @@ class Connector:
           model.set_reasoning_effort(self.coder.main_model.get_reasoning_effort())
           model.set_thinking_tokens(self.coder.main_model.get_thinking_tokens())
 
+          self.clear_coder_pool()
           self.coder = clone_coder(self, self.coder, main_model=model, edit_format=edit_format)
           if self.coder.repo:
             self.coder.repo.models = model.commit_message_models()
+          self.prompt_executor.scheduler.set_limit(PromptScheduler.auto_limit(model))
 
           await asyncio.to_thread(models.sanity_check_models, self.coder.io, model)
 
@@ -1260,6 +3077,7 @@ class Connector:
         if not command:
           return
 
+        self.cancel_warm_up()
         await self.run_command(command, messages, files)
 
       elif action == "interrupt-response":
@@ -1283,6 +3101,7 @@ class Connector:
 
           main_model = models.Model(self.coder.main_model.name, weak_model=self.coder.main_model.weak_model.name)
           self.coder.main_model = main_model
+          self.clear_coder_pool()
 
       elif action == "update-models-info":
         models_info = message.get('modelsInfo')
@@ -1291,9 +3110,16 @@ class Connector:
       elif action == "request-context-info":
         messages = message.get('messages')
         files = message.get('files')
-        await self.send_tokens_info(messages, files)
-        await self.send_repo_map()
-        await self.send_autocompletion(files)
+        self.send_context_info(messages, files)
+
+      elif action == "request-commit-diff":
+        await self.send_commit_diff(message.get('requestId'), message.get('commitHash'), message.get('path'))
+
+      elif action == "request-repo-map":
+        await self.resend_repo_map()
+
+      elif action == "request-autocompletion":
+        await self.resend_autocompletion_words()
 
     except Exception as e:
       import traceback
@@ -1309,6 +3135,13 @@ class Connector:
         for key in environment_variables
       )
 
+      if self.hub:
+        # the environment of a hub is shared by its sessions, AiderDesk restarts a session with a changed one
+        changed = sorted(key for key, value in environment_variables.items() if value is not None and os.environ.get(key) != str(value))
+        if changed:
+          sys.stderr.write(f"Warning: not changing the shared environment of the connector hub: {', '.join(changed)}\n")
+        return
+
       # Update the environment variables in the current process
       for key, value in environment_variables.items():
         if value is not None:
@@ -1328,7 +3161,14 @@ class Connector:
     command_coder.io = self.coder.io
 
     if command.strip() == "/map":
-      repo_map = command_coder.repo_map.get_repo_map(set(), command_coder.get_all_abs_files()) if command_coder.repo_map else None
+      repo_map = None
+      if command_coder.repo_map:
+        try:
+          tracked_files = await asyncio.to_thread(self.file_index.get, command_coder)
+          repo_map = await self.repo_map_worker.build(command_coder.repo_map, set(), tracked_files.abs_set)
+        except asyncio.TimeoutError:
+          await self.send_log_message("warning", f"Repo map generation timed out after {self.repo_map_worker.timeout:g} seconds.")
+          return
       if repo_map:
         await self.send_log_message("info", repo_map)
       else:
@@ -1371,7 +3211,8 @@ class Connector:
 
     if command.startswith("/map-refresh"):
       await self.send_log_message("info", "The repo map has been refreshed.")
-      await self.send_repo_map()
+      # supersedes a pending request-context-info stage, so it has to carry the chat files too
+      self.refresh_scheduler.submit("repo-map", lambda: self.send_repo_map(files))
     elif command.startswith("/reasoning-effort"):
       self.coder.commands.run(command)
       await self.send_current_models()
@@ -1384,6 +3225,42 @@ class Connector:
         self.thinking_tokens = None
       await self.send_current_models()
 
+  async def send_commit_diff(self, request_id, commit_hash, path=None):
+    """Streams the diff of a commit (or of one of its files) as `commit-diff` chunks.
+
+    The diff is capped at COMMIT_DIFF_MAX_SIZE and sent in COMMIT_DIFF_CHUNK_SIZE pieces,
+    each one queued after the previous was emitted. The last chunk has `finished` set.
+    """
+    response = {
+      "action": "commit-diff",
+      "requestId": request_id,
+      "commitHash": commit_hash,
+      "path": path,
+    }
+
+    if not commit_hash or not self.coder.repo:
+      await self.send_action({**response, "index": 0, "content": "", "finished": True, "error": "No git repository"})
+      return
+
+    try:
+      diff, truncated = await asyncio.to_thread(commit_diff, self.coder.repo, commit_hash, path)
+    except Exception as e:
+      await self.send_action({**response, "index": 0, "content": "", "finished": True, "error": str(e)})
+      return
+
+    chunks = [diff[start:start + COMMIT_DIFF_CHUNK_SIZE] for start in range(0, len(diff), COMMIT_DIFF_CHUNK_SIZE)] or [""]
+    for index, chunk in enumerate(chunks):
+      finished = index == len(chunks) - 1
+      await self.send_action({
+        **response,
+        "index": index,
+        "content": chunk,
+        "finished": finished,
+        "truncated": truncated if finished else False,
+      })
+      if not finished:
+        await self.outbound.drain()
+
   async def send_autocompletion(self, files):
     try:
       # Use all files from files parameter and convert to relative paths
@@ -1399,58 +3276,67 @@ class Connector:
           relative_path = file_path
         rel_fnames.append(relative_path)
 
-      # Run tokenization in a separate thread
+      # Run tokenization in a separate thread, a newer request cancels this one through the refresh scheduler
       if len(rel_fnames) > 0:
-        # Cancel any previous tokenization task if it's still running
-        if self.current_tokenization_task and not self.current_tokenization_task.done():
-          self.current_tokenization_task.cancel()
-
-        async def tokenize_and_send():
-          try:
-            tokenized_words = await asyncio.to_thread(
-              self._tokenize_files_sync,
-              self.task_dir,
-              rel_fnames,
-              [],
-              self.coder.io.encoding,
-              self.coder.abs_read_only_fnames
-            )
-            await self.send_action({
-              "action": "update-autocompletion",
-              "words": tokenized_words,
-            })
-          except asyncio.CancelledError:
-            # Task was cancelled, do nothing.
-            pass
-          except Exception as e:
-            self.coder.io.tool_error(f"Error during tokenization: {str(e)}")
-
-        self.current_tokenization_task = asyncio.create_task(tokenize_and_send())
+        tokenized_words = await asyncio.to_thread(
+          self.word_index.get_words,
+          self.task_dir,
+          rel_fnames,
+          self.coder.io.encoding,
+          set(self.coder.abs_read_only_fnames),
+        )
+        await self.send_autocompletion_words(tokenized_words)
 
       # else: The initial message with just filenames is sufficient if too many files
     except Exception as e:
       self.coder.io.tool_error(f"Error in send_autocompletion: {str(e)}")
-      await self.send_action({
-        "action": "update-autocompletion",
-        "words": [],
-      })
+      await self.send_autocompletion_words(set())
 
-  async def send_repo_map(self):
-    if self.coder.repo_map:
-      try:
-        repo_map = self.coder.repo_map.get_repo_map(set(), self.coder.get_all_abs_files())
-        if repo_map:
-          # Remove the prefix before sending
-          prefix = self.coder.gpt_prompts.repo_content_prefix
-          if repo_map.startswith(prefix):
-            repo_map = repo_map[len(prefix):]
-
-          await self.send_action({
-            "action": "update-repo-map",
-            "repoMap": repo_map
-          })
-      except Exception as e:
-        self.coder.io.tool_error(f"Error sending repo map: {str(e)}")
+  async def send_autocompletion_words(self, words):
+    """Sends the full word list first, then only the words added and removed since the previous version."""
+    if self.sent_words is not None and words == self.sent_words:
+      return
+
+    self.sent_words_version += 1
+    message = {
+      "action": "update-autocompletion",
+      "version": self.sent_words_version,
+    }
+    if self.sent_words is None:
+      message["words"] = sorted(words)
+    else:
+      message["delta"] = {
+        "baseVersion": self.sent_words_version - 1,
+        "added": sorted(words - self.sent_words),
+        "removed": sorted(self.sent_words - words),
+      }
+
+    await self.send_action(message)
+    self.sent_words = words
+
+  async def resend_autocompletion_words(self):
+    """Sends the last word list in full under a new version, for AiderDesk to recover from a delta it could not apply."""
+    if self.sent_words is None:
+      return
+    self.sent_words_version += 1
+    await self.send_action({
+      "action": "update-autocompletion",
+      "version": self.sent_words_version,
+      "words": sorted(self.sent_words),
+    })
+
+  def watch_file_changes(self, file_watcher):
+    """Drops word index entries of files the watcher reports as changed, and the file listing when files come or go."""
+    original_filter_func = file_watcher.filter_func
+    root = str(getattr(file_watcher, "root", None) or self.coder.root)
+
+    def _filter_func(change_type, path):
+      self.word_index.invalidate(os.path.join(root, path))
+      if getattr(change_type, "name", None) != "modified":
+        self.file_index.invalidate()
+      return original_filter_func(change_type, path)
+
+    file_watcher.filter_func = _filter_func
 
   def get_context_files(self, coder=None):
     if not coder:
@@ -1478,18 +3364,34 @@ class Connector:
       "content": content
     })
 
+  async def send_add_context_messages(self, messages):
+    """Sends the messages in one add-messages frame, a single message keeps the add-message action."""
+    if len(messages) == 1:
+      await self.send_add_context_message(messages[0]["role"], messages[0]["content"])
+    elif messages:
+      await self.send_action({
+        "action": "add-messages",
+        "messages": messages
+      })
+
   async def send_add_context_files(self, coder=None):
+    """Sends the context files in one add-files frame, a single file keeps the add-file action."""
     context_files = self.get_context_files(coder)
-    for file in context_files:
+    if len(context_files) == 1:
       await self.send_action({
         "action": "add-file",
-        "path": file["path"],
-        "readOnly": file["readOnly"]
+        "path": context_files[0]["path"],
+        "readOnly": context_files[0]["readOnly"]
+      })
+    elif context_files:
+      await self.send_action({
+        "action": "add-files",
+        "files": context_files
       })
 
   async def send_update_context_files(self, coder=None):
     context_files = self.get_context_files(coder)
-    await self.sio.emit("message", {
+    await self.send_action({
       "action": "update-context-files",
       "files": context_files
     })
@@ -1517,43 +3419,8 @@ class Connector:
       "error": error
     })
 
-  async def send_tokens_info(self, messages, files):
-    cost_per_token = self.coder.main_model.info.get("input_cost_per_token") or 0
-    info = {
-      "files": {}
-    }
-
-    self.coder.choose_fence()
-
-    # system messages
-    main_sys = self.coder.fmt_system_prompt(self.coder.gpt_prompts.main_system)
-    main_sys += "\n" + self.coder.fmt_system_prompt(self.coder.gpt_prompts.system_reminder)
-    msgs = [
-      dict(role="system", content=main_sys),
-      dict(
-        role="system",
-        content=self.coder.fmt_system_prompt(self.coder.gpt_prompts.system_reminder),
-      ),
-    ]
-    tokens = self.coder.main_model.token_count(msgs)
-    info["systemMessages"] = {
-      "tokens": tokens,
-      "cost": tokens * cost_per_token,
-    }
-
-    # Convert messages to the format expected by token_count
-    msgs = [dict(role=msg['role'], content=msg['content']) for msg in messages]
-
-    if msgs:
-      tokens = self.coder.main_model.token_count(msgs)
-    else:
-      tokens = 0
-    info["chatHistory"] = {
-      "tokens": tokens,
-      "cost": tokens * cost_per_token,
-    }
-
-    # Convert context_files to absolute file paths like coder does
+  def resolve_context_files(self, files):
+    """Converts context files to absolute file paths like coder does."""
     abs_fnames = set()
     abs_read_only_fnames = set()
 
@@ -1567,23 +3434,71 @@ class Connector:
       else:
         abs_fnames.add(file_path)
 
-    all_abs_files = self.coder.get_all_abs_files()
-    other_files = set(all_abs_files) - abs_fnames
+    return abs_fnames, abs_read_only_fnames
 
-    if self.coder.repo_map:
-      repo_content = self.coder.repo_map.get_repo_map(abs_fnames, other_files)
-      if repo_content:
-        tokens = self.coder.main_model.token_count(repo_content)
-      else:
-        tokens = 0
-    else:
-      tokens = 0
-    info["repoMap"] = {
-      "tokens": tokens,
-      "cost": tokens * cost_per_token,
+  def send_context_info(self, messages, files):
+    """Schedules the request-context-info stages to run concurrently, each result is sent as soon as it is ready.
+
+    Token numbers, the repo map and autocompletion words are independent, so the cheap
+    token numbers do not wait behind the repo map. Every stage does its work off the loop,
+    and a newer request supersedes stages of an older one that have not finished yet.
+    """
+    self.refresh_scheduler.submit("tokens-info", lambda: self.send_tokens_info(messages, files))
+    self.refresh_scheduler.submit("repo-map", lambda: self.send_repo_map(files))
+    self.refresh_scheduler.submit("autocompletion", lambda: self.send_autocompletion(files))
+
+  async def send_tokens_info(self, messages, files):
+    """Sends the system, chat history and context file token numbers; the repo map part is sent by send_repo_map.
+
+    Files not counted before are first sent with an estimate (`tokensEstimated`), then
+    counted together on the token counting threads and sent again with exact numbers.
+    """
+    coder = self.coder
+    try:
+      if TOKEN_ESTIMATES:
+        info = await asyncio.to_thread(self._count_tokens_info, coder, messages, files, True)
+        await self.send_action({
+          "action": "tokens-info",
+          "info": info
+        })
+        if not any(file.get("tokensEstimated") for file in info["files"].values()):
+          return
+
+      info = await asyncio.to_thread(self._count_tokens_info, coder, messages, files)
+    except Exception as e:
+      self.coder.io.tool_error(f"Error counting tokens: {str(e)}")
+      return
+
+    await self.send_action({
+      "action": "tokens-info",
+      "info": info
+    })
+    self.token_cache.schedule_save(self.loop)
+
+  def _count_tokens_info(self, coder, messages, files, estimate=False):
+    cost_per_token = coder.main_model.info.get("input_cost_per_token") or 0
+    info = {
+      "files": {}
     }
 
+    with self.token_count_lock:
+      # system messages
+      tokens = self.chat_token_counter.system_tokens(coder)
+      info["systemMessages"] = {
+        "tokens": tokens,
+        "cost": tokens * cost_per_token,
+      }
+
+      tokens = self.chat_token_counter.count_messages(coder.main_model, messages)
+      info["chatHistory"] = {
+        "tokens": tokens,
+        "cost": tokens * cost_per_token,
+      }
+
     fence = "`" * 3
+    model_name = coder.main_model.name
+    # text files missing from the token cache, counted in one batch
+    uncounted = []
 
     # Process the provided context files
     for file in files:
@@ -1595,24 +3510,136 @@ class Connector:
       if os.path.isdir(file_path):
         continue
 
-      relative_fname = self.coder.get_rel_fname(file_path)
-      content = self.coder.io.read_text(file_path)
+      relative_fname = coder.get_rel_fname(file_path)
       if is_image_file(relative_fname):
-        tokens = self.coder.main_model.token_count_for_image(file_path)
-      elif content is not None:
-        # approximate
-        content = f"{relative_fname}\n{fence}\n" + content + "{fence}\n"
-        tokens = self.coder.main_model.token_count(content)
+        tokens = self.token_cache.count(file_path, model_name, "image", lambda: coder.main_model.token_count_for_image(file_path))
       else:
-        tokens = 0
+        key = self.token_cache.make_key(file_path, model_name, "text")
+        tokens = self.token_cache.get(key) if key else None
+        if tokens is None:
+          if estimate:
+            # the key holds the file size
+            tokens = self.token_counter.estimate(model_name, key[2] if key else 0)
+            info["files"][relative_fname] = {
+              "tokens": tokens,
+              "cost": tokens * cost_per_token,
+              "tokensEstimated": True,
+            }
+            continue
+          # keeps the order of the files
+          info["files"][relative_fname] = None
+          uncounted.append((relative_fname, file_path, key))
+          continue
+
       info["files"][relative_fname] = {
         "tokens": tokens,
         "cost": tokens * cost_per_token,
       }
 
+    if uncounted:
+      texts = {}
+      for relative_fname, file_path, _ in uncounted:
+        content = coder.io.read_text(file_path)
+        if content is not None:
+          # approximate
+          texts[relative_fname] = f"{relative_fname}\n{fence}\n" + content + "{fence}\n"
+      counts = dict(zip(texts, self.token_counter.count_batch(coder.main_model, list(texts.values()))))
+
+      for relative_fname, _, key in uncounted:
+        tokens = counts.get(relative_fname, 0)
+        if key:
+          self.token_cache.put(key, tokens)
+        info["files"][relative_fname] = {
+          "tokens": tokens,
+          "cost": tokens * cost_per_token,
+        }
+
+    return info
+
+  async def send_repo_map(self, files=None):
+    """Sends the repo map token numbers and the repo map for the UI.
+
+    The tracked files are taken from the file index once for both maps. The map sent with
+    prompts leaves out the chat files, so with no chat files it is the same map as the UI
+    one and is built once.
+    """
+    coder = self.coder
+    if not coder.repo_map:
+      if files is not None:
+        await self.send_action({
+          "action": "tokens-info",
+          "info": {"repoMap": {"tokens": 0, "cost": 0}},
+        })
+      return
+
+    try:
+      tracked_files = await asyncio.to_thread(self.file_index.get, coder)
+      ui_repo_map = None
+
+      if files is not None:
+        abs_fnames, _ = self.resolve_context_files(files)
+        if abs_fnames:
+          repo_content = await self.repo_map_worker.build(coder.repo_map, abs_fnames, tracked_files.other_files(abs_fnames))
+        else:
+          repo_content = ui_repo_map = await self.repo_map_worker.build(coder.repo_map, set(), tracked_files.abs_set)
+
+        tokens = await asyncio.to_thread(coder.main_model.token_count, repo_content) if repo_content else 0
+        cost_per_token = coder.main_model.info.get("input_cost_per_token") or 0
+        await self.send_action({
+          "action": "tokens-info",
+          "info": {"repoMap": {"tokens": tokens, "cost": tokens * cost_per_token}},
+        })
+
+      if ui_repo_map is None:
+        ui_repo_map = await self.repo_map_worker.build(coder.repo_map, set(), tracked_files.abs_set)
+      if ui_repo_map:
+        # Remove the prefix before sending
+        prefix = coder.gpt_prompts.repo_content_prefix
+        if ui_repo_map.startswith(prefix):
+          ui_repo_map = ui_repo_map[len(prefix):]
+
+        await self.send_repo_map_update(ui_repo_map)
+    except asyncio.TimeoutError:
+      self.coder.io.tool_warning(f"Repo map generation timed out after {self.repo_map_worker.timeout:g} seconds.")
+    except Exception as e:
+      self.coder.io.tool_error(f"Error sending repo map: {str(e)}")
+    finally:
+      if self.tags_cache:
+        self.tags_cache.schedule_save(self.loop)
+
+  async def send_repo_map_update(self, repo_map):
+    """Sends the repo map unless it is unchanged; after the first full map only line deltas are sent."""
+    new_hash = repo_map_hash(repo_map)
+    if new_hash == self.sent_repo_map_hash:
+      self.repo_map_updates_skipped += 1
+      return
+
+    message = {
+      "action": "update-repo-map",
+      "hash": new_hash,
+    }
+    if self.sent_repo_map is not None:
+      ops = await asyncio.to_thread(repo_map_delta, self.sent_repo_map, repo_map)
+      message["delta"] = {
+        "baseHash": self.sent_repo_map_hash,
+        "hash": new_hash,
+        "ops": ops,
+      }
+    else:
+      message["repoMap"] = repo_map
+
+    await self.send_action(message)
+    self.sent_repo_map = repo_map
+    self.sent_repo_map_hash = new_hash
+
+  async def resend_repo_map(self):
+    """Sends the last repo map in full, for AiderDesk to recover from a delta it could not apply."""
+    if self.sent_repo_map is None:
+      return
     await self.send_action({
-      "action": "tokens-info",
-      "info": info
+      "action": "update-repo-map",
+      "hash": self.sent_repo_map_hash,
+      "repoMap": self.sent_repo_map,
     })
 
   async def handle_models_info_update(self, models_info):
@@ -1623,7 +3650,370 @@ class Connector:
     update_model_params(self.models_info, self.coder.main_model)
     if self.coder.main_model.weak_model:
       update_model_params(self.models_info, self.coder.main_model.weak_model)
+    self.clear_coder_pool()
+
+  def clear_coder_pool(self):
+    if self.coder_pool:
+      self.coder_pool.clear()
+
+
+class ConnectorHub:
+  """Hosts the connectors of many tasks in one process over one Socket.IO connection.
+
+  Started with `--hub HUB_ID`. AiderDesk opens a session per task with `open-session`,
+  carrying the task's connector arguments and directories, and closes it with
+  `close-session`. Every other message carries the `taskId` of its session, and
+  everything a session sends is tagged with it. A session is a full Connector with its own
+  coder, PromptExecutor and base/task directory. Loaded modules, litellm's model metadata
+  and tokenizers, the token counting threads, the file token count caches and the repo map
+  tags caches are shared. The process environment and working directory are shared too,
+  and aider applies the project's .env, its arguments and model settings to the whole
+  process, so AiderDesk only puts tasks with the same environment, task directory,
+  arguments and config files into one hub, started in that directory.
+  """
+
+  def __init__(self, hub_id, server_url="http://localhost:24337"):
+    self.hub_id = hub_id
+    self.server_url = server_url
+    self.sessions = {}
+    # shared by the sessions: token count and project tags caches by path, aider's tags caches by
+    # repository root and the token counting threads
+    self.token_caches = {}
+    self.project_tags_caches = {}
+    self.tags_caches = {}
+    self.token_counter = TokenCountEngine()
+    self._initialized = False
+
+    try:
+      self.loop = asyncio.get_event_loop()
+    except RuntimeError:
+      self.loop = asyncio.new_event_loop()
+      asyncio.set_event_loop(self.loop)
+
+    self.sio = socketio.AsyncClient()
+    self.outbound = OutboundQueue(self.sio, self.loop)
+    self.register_events()
+
+  def register_events(self):
+    @self.sio.event
+    async def connect():
+      await self.on_connect()
+
+    @self.sio.event
+    async def message(data):
+      await self.on_message(data)
+
+    @self.sio.event
+    async def disconnect():
+      await self.on_disconnect()
+
+    @self.sio.event
+    async def connect_error(error):
+      sys.stderr.write(f"Connection error: {error}\n")
+
+  async def on_connect(self):
+    if self._initialized:
+      return
+    self._initialized = True
+
+    await self.send_action({
+      "action": "init-hub",
+      "hubId": self.hub_id,
+      "pid": os.getpid(),
+      "listenTo": ["open-session", "close-session"],
+    })
+    # after a reconnect the sessions introduce themselves again
+    for task_id, session in list(self.sessions.items()):
+      with session_context(task_id):
+        await session.on_connect()
+
+  async def on_message(self, data):
+    action = data.get("action")
+    task_id = data.get("taskId")
+
+    if action == "open-session":
+      await self.open_session(data)
+    elif action == "close-session":
+      await self.close_session(task_id)
+    elif task_id in self.sessions:
+      with session_context(task_id):
+        task = asyncio.create_task(self.sessions[task_id].process_message(data))
+      await task
+    else:
+      sys.stderr.write(f"Message {action} for unknown session {task_id}\n")
+
+  async def on_disconnect(self):
+    self._initialized = False
+    for task_id, session in list(self.sessions.items()):
+      with session_context(task_id):
+        await session.on_disconnect()
+
+  async def start(self):
+    await connect_with_retry(self.sio, self.server_url, self.on_connect, lambda: setattr(self, "_initialized", False))
+    await self.sio.wait()
+
+  async def send_action(self, action):
+    return self.outbound.put("message", action)
+
+  async def open_session(self, message):
+    task_id = message.get("taskId")
+    if task_id in self.sessions:
+      await self.close_session(task_id)
+
+    argv = message.get("args") or []
+    args, _ = create_arg_parser().parse_known_args(argv)
+    task_dir = message.get("taskDir") or message.get("baseDir")
+
+    with session_context(task_id):
+      # aider finds the repository and its config files from the working directory, which a hub
+      # is started in; AiderDesk only opens sessions of that directory here
+      if os.path.realpath(task_dir) != os.path.realpath(os.getcwd()):
+        await self.send_action({"action": "session-closed", "taskId": task_id, "error": f"Connector hub runs in {os.getcwd()}, not in {task_dir}"})
+        return
+
+      try:
+        session = Connector(
+          message.get("baseDir"),
+          task_id,
+          task_dir,
+          watch_files=args.watch_files,
+          server_url=self.server_url,
+          reasoning_effort=args.reasoning_effort,
+          thinking_tokens=args.thinking_tokens,
+          confirm_before_edit=bool(message.get("confirmBeforeEdit")),
+          argv=argv,
+          hub=self,
+        )
+      except (Exception, SystemExit) as e:
+        import traceback
+        traceback.print_exc()
+        await self.send_action({"action": "session-closed", "taskId": task_id, "error": str(e)})
+        return
 
+      self.sessions[task_id] = session
+      await session.on_connect()
+
+  async def close_session(self, task_id):
+    session = self.sessions.pop(task_id, None)
+    if session:
+      with session_context(task_id):
+        await session.close()
+    await self.send_action({"action": "session-closed", "taskId": task_id})
+
+  def post_output(self, task_id, stream, text):
+    """Sends stdout or stderr text of a session to AiderDesk; safe to call from any thread."""
+    if not text:
+      return
+
+    def _put():
+      self.outbound.put("output", {"taskId": task_id, "stream": stream, "data": text})
+
+    try:
+      on_loop = asyncio.get_running_loop() is self.loop
+    except RuntimeError:
+      on_loop = False
+    if on_loop:
+      _put()
+    else:
+      self.loop.call_soon_threadsafe(_put)
+
+  def get_tags_cache(self, path):
+    cache = self.project_tags_caches.get(path)
+    if cache is None:
+      cache = self.project_tags_caches[path] = ProjectTagsCache(path)
+    return cache
+
+  def get_token_cache(self, path):
+    cache = self.token_caches.get(path)
+    if cache is None:
+      cache = self.token_caches[path] = TokenCountCache(path=path)
+      cache.load()
+    return cache
+
+  def share_repo_map_cache(self, coder):
+    """Points the coder's repo map at the tags cache of an earlier session of the same repository."""
+    repo_map = coder.repo_map
+    if not repo_map or not hasattr(repo_map, "TAGS_CACHE"):
+      return
+    repo_map.TAGS_CACHE = self.tags_caches.setdefault(repo_map.root, repo_map.TAGS_CACHE)
+
+
+def run_hub(hub_id, server_url):
+  hub = ConnectorHub(hub_id, server_url)
+  sys.stdout = SessionOutputStream(hub, sys.stdout, "stdout")
+  sys.stderr = SessionOutputStream(hub, sys.stderr, "stderr")
+  asyncio.run(hub.start())
+
+
+def read_line(conn, limit=1024 * 1024):
+  """Reads one newline terminated line from a socket without reading past it."""
+  data = bytearray()
+  while not data.endswith(b"\n"):
+    byte = conn.recv(1)
+    if not byte or len(data) > limit:
+      raise ConnectionError("Connection closed before a full line was received")
+    data += byte
+  return data.decode("utf-8")
+
+def warm_up_fork_server(preload_models):
+  """Loads what every connector needs before it can connect, so forked children skip it."""
+  import aider.main  # noqa: F401
+  import aider.repomap  # noqa: F401
+
+  for model_name in preload_models:
+    try:
+      model = models.Model(model_name)
+      model.token_count("warm up")
+    except Exception as e:
+      sys.stderr.write(f"Unable to preload model {model_name}: {str(e)}\n")
+
+def fork_env_changes(env):
+  """Returns the variables outside FORK_PER_TASK_ENV whose values in `env` differ from IMPORT_ENV."""
+  return sorted(key for key in set(env) | set(IMPORT_ENV) if key not in FORK_PER_TASK_ENV and env.get(key) != IMPORT_ENV.get(key))
+
+def fork_connector(server, request, stdout_conn, stderr_conn):
+  """Forks a connector for one task; returns the child's pid in the parent, never returns in the child.
+
+  The child gets the two client connections as stdout and stderr, the task's environment
+  (replacing the fork server's), working directory and arguments, then runs `main` as `python -m connector` would.
+  Modules imported by the fork server may keep values they read from its environment, so a
+  task whose environment differs outside FORK_PER_TASK_ENV execs a fresh `python -m connector` instead.
+  """
+  sys.stdout.flush()
+  sys.stderr.flush()
+
+  pid = os.fork()
+  if pid:
+    stdout_conn.close()
+    stderr_conn.close()
+    return pid
+
+  code = 1
+  try:
+    server.close()
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # the connector must not go down with the fork server
+    os.setsid()
+
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(stdout_conn.fileno(), 1)
+    os.dup2(stderr_conn.fileno(), 2)
+    os.close(devnull)
+    stdout_conn.close()
+    stderr_conn.close()
+
+    # the request carries the task's full environment, nothing of the fork server's (the first task's) is kept
+    env = {key: str(value) for key, value in (request.get("env") or {}).items() if value is not None}
+    if request.get("cwd"):
+      os.chdir(request["cwd"])
+
+    sys.argv = ["connector"] + list(request.get("args") or [])
+    sys.stdout.write(json.dumps({"pid": os.getpid()}) + "\n")
+    sys.stdout.flush()
+
+    changed = fork_env_changes(env)
+    if changed:
+      sys.stderr.write(f"Environment differs from the fork server's in {', '.join(changed)}, starting a fresh connector\n")
+      sys.stderr.flush()
+      env.setdefault("PYTHONPATH", os.path.dirname(os.path.abspath(__file__)))
+      os.execve(sys.executable, [sys.executable, "-m", "connector"] + sys.argv[1:], env)
+
+    os.environ.clear()
+    os.environ.update(env)
+    apply_tls_overrides()
+
+    main(sys.argv[1:])
+    code = 0
+  except SystemExit as e:
+    code = e.code if isinstance(e.code, int) else 0 if e.code is None else 1
+  except BaseException:
+    import traceback
+    traceback.print_exc()
+  finally:
+    try:
+      sys.stdout.flush()
+      sys.stderr.flush()
+    finally:
+      os._exit(code)
+
+def run_fork_server(socket_path, preload_models=()):
+  """Serves connector processes forked from this warm interpreter.
+
+  JSON lines over a Unix domain socket: a client opens a connection and sends
+  `{"action": "spawn", "id", "args", "env", "cwd"}`, then opens a second one and sends
+  `{"action": "attach", "id"}`. Once both arrived a connector is forked with the first
+  connection as its stdout and the second as its stderr; its first stdout line is
+  `{"pid": ...}`. The connections close when the connector exits.
+
+  Only the accept loop runs here, no threads or event loops are started before forking.
+  """
+  # stdout carries the ready line, aider and litellm print their warnings while loading
+  with contextlib.redirect_stdout(sys.stderr):
+    warm_up_fork_server(preload_models)
+
+  # children are reaped automatically
+  signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+  if os.path.exists(socket_path):
+    os.unlink(socket_path)
+  server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  server.bind(socket_path)
+  os.chmod(socket_path, 0o600)
+  server.listen(16)
+
+  sys.stdout.write(json.dumps({"ready": True, "pid": os.getpid()}) + "\n")
+  sys.stdout.flush()
+
+  # spawn requests waiting for their stderr connection: id -> (request, conn, received at)
+  pending = {}
+  try:
+    while True:
+      conn, _ = server.accept()
+      try:
+        conn.settimeout(FORK_SERVER_ATTACH_TIMEOUT)
+        request = json.loads(read_line(conn))
+        conn.settimeout(None)
+      except (OSError, ValueError) as e:
+        sys.stderr.write(f"Invalid fork server request: {str(e)}\n")
+        conn.close()
+        continue
+
+      now = time.monotonic()
+      for request_id, (_, stale_conn, received_at) in list(pending.items()):
+        if now - received_at > FORK_SERVER_ATTACH_TIMEOUT:
+          stale_conn.close()
+          del pending[request_id]
+
+      action = request.get("action")
+      if action == "spawn":
+        pending[request.get("id")] = (request, conn, now)
+      elif action == "attach" and request.get("id") in pending:
+        spawn_request, stdout_conn, _ = pending.pop(request.get("id"))
+        try:
+          fork_connector(server, spawn_request, stdout_conn, conn)
+        except OSError as e:
+          sys.stderr.write(f"Unable to fork connector: {str(e)}\n")
+          stdout_conn.close()
+          conn.close()
+      else:
+        conn.close()
+  finally:
+    server.close()
+    if os.path.exists(socket_path):
+      os.unlink(socket_path)
+
+def create_arg_parser():
+  parser = argparse.ArgumentParser(description="AiderDesk Connector")
+  parser.add_argument("--watch-files", action="store_true", help="Watch files for changes")
+  parser.add_argument("--reasoning-effort", type=str, default=None, help="Set the reasoning effort for the model")
+  parser.add_argument("--thinking-tokens", type=str, default=None, help="Set the thinking tokens for the model")
+  parser.add_argument("--fork-server", type=str, default=None, metavar="SOCKET_PATH", help="Preload and fork a connector per task on requests to this Unix socket")
+  parser.add_argument("--preload-model", action="append", default=[], help="Model to preload in fork server mode")
+  parser.add_argument("--hub", type=str, default=None, metavar="HUB_ID", help="Host the connectors of many tasks in this process")
+  return parser
 
 def main(argv=None):
   try:
@@ -1631,15 +4021,21 @@ def main(argv=None):
       argv = sys.argv[1:]
 
     # Parse command line arguments
-    parser = argparse.ArgumentParser(description="AiderDesk Connector")
-    parser.add_argument("--watch-files", action="store_true", help="Watch files for changes")
-    parser.add_argument("--reasoning-effort", type=str, default=None, help="Set the reasoning effort for the model")
-    parser.add_argument("--thinking-tokens", type=str, default=None, help="Set the thinking tokens for the model")
-
+    parser = create_arg_parser()
     args, _ = parser.parse_known_args(argv) # Use parse_known_args to ignore unknown args
 
+    if args.fork_server:
+      run_fork_server(args.fork_server, args.preload_model)
+      return
+
     # Get environment variables
     server_url = os.getenv("CONNECTOR_SERVER_URL", "http://localhost:24337")
+
+    if args.hub:
+      setup_telemetry()
+      run_hub(args.hub, server_url)
+      return
+
     base_dir = os.getenv("BASE_DIR", os.getcwd())
     task_id = os.getenv("TASK_ID", "default")
     task_dir = os.getenv("TASK_DIR", os.getcwd())
@@ -1676,6 +4072,57 @@ def main(argv=None):
     sys.stderr.write(f"Unexpected error: {str(e)}\n")
     sys.exit(4)
 
+PROMPT_TRACER = None
+
+def setup_prompt_tracing():
+  """Exports prompt metrics as OpenTelemetry spans when CONNECTOR_OTEL_EXPORTER is set.
+
+  "console" writes the spans to stderr, "otlp" sends them to the OTLP/HTTP endpoint from
+  the standard OTEL_EXPORTER_OTLP_* variables (a local collector by default). A dedicated
+  tracer provider is used so litellm's own OpenTelemetry callbacks are not affected.
+  """
+  global PROMPT_TRACER
+
+  if OTEL_EXPORTER not in ("console", "otlp"):
+    return
+
+  try:
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if OTEL_EXPORTER == "otlp":
+      from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+      exporter = OTLPSpanExporter()
+    else:
+      exporter = ConsoleSpanExporter(out=sys.stderr)
+  except ImportError as e:
+    sys.stderr.write(f"Prompt metrics export disabled, OpenTelemetry exporter not available: {str(e)}\n")
+    return
+
+  provider = TracerProvider(resource=Resource.create({"service.name": "aider-desk-connector"}))
+  provider.add_span_processor(BatchSpanProcessor(exporter))
+  PROMPT_TRACER = provider.get_tracer("aider-desk.connector")
+
+def export_prompt_metrics(prompt_context, metrics):
+  """Exports a finished prompt as a `prompt` span with one child span per recorded span."""
+  if PROMPT_TRACER is None:
+    return
+
+  from opentelemetry import trace
+
+  prompt_metrics = prompt_context.metrics
+  with prompt_metrics.lock:
+    spans = list(prompt_metrics.spans)
+
+  attributes = {f"aider_desk.{key}": value for key, value in metrics.items() if value is not None}
+  attributes["aider_desk.promptId"] = prompt_context.id
+  root = PROMPT_TRACER.start_span("prompt", start_time=prompt_metrics.started_ns, attributes=attributes)
+  context = trace.set_span_in_context(root)
+  for name, start_ns, end_ns in spans:
+    PROMPT_TRACER.start_span(name, context=context, start_time=start_ns).end(end_time=end_ns)
+  root.end()
+
 def setup_telemetry():
   langfuse_public_key = os.getenv("LANGFUSE_PUBLIC_KEY")
   langfuse_secret_key = os.getenv("LANGFUSE_SECRET_KEY")
@@ -1692,6 +4139,8 @@ def setup_telemetry():
     litellm.success_callback.append("posthog")
     litellm.failure_callback.append("posthog")
 
+  setup_prompt_tracing()
+
   # Set OpenRouter site and app name
   os.environ["OR_SITE_URL"] = 'https://aiderdesk.hotovo.com'
   os.environ["OR_APP_NAME"] = 'AiderDesk'
@@ -0,0 +1,121 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import ChatTokenCounter  # noqa: E402
+
+
+class FakeModel:
+  """Counts like litellm: priming tokens plus a per-message overhead and one token per word."""
+
+  def __init__(self, name="gpt-4o"):
+    self.name = name
+    self.counted = []
+
+  def token_count(self, messages):
+    self.counted.append(len(messages))
+    return 3 + sum(4 + len(str(message["content"]).split()) for message in messages)
+
+
+class FakePrompts:
+  main_system = "Act as an expert {fence} and lint with {lint_cmd}"
+  system_reminder = "Reply in {fence} and {language}"
+
+
+class FakeCoder:
+  def __init__(self, model):
+    self.main_model = model
+    self.edit_format = "diff"
+    self.gpt_prompts = FakePrompts()
+    self.abs_fnames = set()
+    self.abs_read_only_fnames = set()
+    self.fence = ("```", "```")
+    self.lint_cmd = "flake8"
+    self.language = "English"
+    self.fences_chosen = 0
+
+  def choose_fence(self):
+    self.fences_chosen += 1
+
+  def fmt_system_prompt(self, prompt):
+    return prompt.format(fence=self.fence[0], lint_cmd=self.lint_cmd, language=self.language)
+
+
+def chat(length):
+  return [{"role": "user" if index % 2 == 0 else "assistant", "content": f"message number {index} " * (index % 5 + 1)} for index in range(length)]
+
+
+def test_matches_counting_the_whole_history():
+  model = FakeModel()
+  counter = ChatTokenCounter()
+  for length in (1, 2, 7, 30):
+    messages = chat(length)
+    assert counter.count_messages(model, messages) == model.token_count(messages)
+
+
+def test_only_new_messages_are_tokenized():
+  model = FakeModel()
+  counter = ChatTokenCounter()
+  counter.count_messages(model, chat(10))
+  model.counted.clear()
+
+  counter.count_messages(model, chat(12))
+  assert model.counted == [1, 1]
+
+
+def test_empty_history_counts_nothing():
+  model = FakeModel()
+  assert ChatTokenCounter().count_messages(model, []) == 0
+  assert model.counted == []
+
+
+def test_system_prompt_is_counted_once_per_model():
+  model = FakeModel()
+  coder = FakeCoder(model)
+  counter = ChatTokenCounter()
+
+  first = counter.system_tokens(coder)
+  second = counter.system_tokens(coder)
+  assert first == second
+  assert model.counted == [2]
+  assert coder.fences_chosen == 1
+
+  coder.main_model = FakeModel("claude-sonnet")
+  counter.system_tokens(coder)
+  assert coder.main_model.counted == [2]
+
+
+def test_system_prompt_is_counted_again_when_its_formatting_changes():
+  model = FakeModel()
+  coder = FakeCoder(model)
+  counter = ChatTokenCounter()
+  counter.system_tokens(coder)
+
+  coder.lint_cmd = "ruff check --select E,F,W,I"
+  assert counter.system_tokens(coder) == model.token_count([
+    dict(role="system", content=coder.fmt_system_prompt(FakePrompts.main_system) + "\n" + coder.fmt_system_prompt(FakePrompts.system_reminder)),
+    dict(role="system", content=coder.fmt_system_prompt(FakePrompts.system_reminder)),
+  ])
+
+  model.counted.clear()
+  coder.language = "Deutsch"
+  counter.system_tokens(coder)
+  assert model.counted == [2]
+
+
+def test_fence_is_chosen_again_when_chat_files_change(tmp_path):
+  coder = FakeCoder(FakeModel())
+  counter = ChatTokenCounter()
+  counter.system_tokens(coder)
+
+  file_path = tmp_path / "a.py"
+  file_path.write_text("x = 1\n")
+  coder.abs_fnames.add(str(file_path))
+  counter.system_tokens(coder)
+  counter.system_tokens(coder)
+  assert coder.fences_chosen == 2
@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("aider")
+
+import git  # noqa: E402
+from aider import models  # noqa: E402
+from aider.coders import Coder  # noqa: E402
+from aider.io import InputOutput  # noqa: E402
+from aider.repo import GitRepo  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import CoderTemplatePool  # noqa: E402
+
+
+@pytest.fixture
+def coder(tmp_path):
+  repo = git.Repo.init(tmp_path)
+  for index in range(20):
+    (tmp_path / f"module_{index}.py").write_text(f"def function_{index}():\n  return {index}\n", encoding="utf-8")
+  repo.index.add([f"module_{index}.py" for index in range(20)])
+  repo.index.commit("init")
+
+  io = InputOutput(yes=True, pretty=False)
+  return Coder.create(
+    main_model=models.Model("gpt-4o-mini"),
+    edit_format="diff",
+    io=io,
+    repo=GitRepo(io, [], str(tmp_path)),
+    map_tokens=1024,
+  )
+
+
+def test_checkouts_have_their_own_repo_map(coder):
+  pool = CoderTemplatePool()
+  first = pool.checkout(coder)
+  second = pool.checkout(coder)
+
+  assert (pool.misses, pool.hits) == (1, 1)
+  assert first.repo_map is not second.repo_map
+  assert first.repo_map.map_cache is not second.repo_map.map_cache
+  assert first.repo_map.tree_cache is not second.repo_map.tree_cache
+  # the tags are shared
+  assert first.repo_map.TAGS_CACHE is second.repo_map.TAGS_CACHE
+
+  first.repo_map.get_repo_map(set(), set(first.get_all_abs_files()))
+  assert first.repo_map.last_map
+  assert second.repo_map.last_map is None
+  assert second.repo_map.map_cache == {}
+
+
+def test_concurrent_checkouts_build_their_maps(coder):
+  pool = CoderTemplatePool()
+  checkouts = [pool.checkout(coder) for _ in range(4)]
+  files = set(coder.get_all_abs_files())
+  results, errors = {}, []
+
+  def build(index, checkout):
+    try:
+      # each one with other chat files, so the maps differ
+      chat_files = {sorted(files)[index]}
+      results[index] = checkout.repo_map.get_repo_map(chat_files, files - chat_files)
+    except Exception as e:
+      errors.append(e)
+
+  threads = [threading.Thread(target=build, args=(index, checkout)) for index, checkout in enumerate(checkouts)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert errors == []
+  # every checkout kept the map it built itself
+  for index, checkout in enumerate(checkouts):
+    assert results[index].endswith(checkout.repo_map.last_map)
+  assert len({checkout.repo_map.last_map for checkout in checkouts}) == len(checkouts)
@@ -0,0 +1,86 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aider")
+
+import git  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import commit_diff, commit_diff_summary  # noqa: E402
+
+
+def write(root, rel_fname, content):
+  mode = "wb" if isinstance(content, bytes) else "w"
+  with open(os.path.join(root, rel_fname), mode) as file:
+    file.write(content)
+
+
+def commit(repo, message):
+  repo.git.add("-A")
+  repo.git.commit("-m", message, "--no-verify", "-q")
+  return repo.head.commit.hexsha
+
+
+@pytest.fixture
+def repo(tmp_path):
+  repo = git.Repo.init(tmp_path)
+  repo.git.config("user.name", "test")
+  repo.git.config("user.email", "test@example.com")
+  return repo
+
+
+def test_summary_of_a_commit(repo):
+  root = repo.working_tree_dir
+  write(root, "app.py", "a\nb\nc\n")
+  write(root, "old name.py", "".join(f"line {index}\n" for index in range(20)))
+  commit(repo, "init")
+
+  write(root, "app.py", "a\nB\nc\nd\ne\n")
+  os.rename(os.path.join(root, "old name.py"), os.path.join(root, "new name.py"))
+  # quoted by git without -z
+  write(root, "naïve café.py", "x\n")
+  write(root, "logo.png", b"\x89PNG\0\0\0binary")
+  commit_hash = commit(repo, "change")
+
+  files = commit_diff_summary(SimpleNamespace(repo=repo), commit_hash)
+
+  assert sorted(files, key=lambda file: file["path"]) == [
+    {"path": "app.py", "added": 3, "removed": 1},
+    {"path": "logo.png", "added": None, "removed": None},
+    {"path": "naïve café.py", "added": 1, "removed": 0},
+    {"path": "new name.py", "added": 0, "removed": 0},
+  ]
+
+
+def test_summary_of_root_commit(repo):
+  write(repo.working_tree_dir, "app.py", "a\nb\n")
+  commit_hash = commit(repo, "init")
+
+  assert commit_diff_summary(SimpleNamespace(repo=repo), commit_hash) == [{"path": "app.py", "added": 2, "removed": 0}]
+
+
+def test_diff_limited_to_path(repo):
+  root = repo.working_tree_dir
+  write(root, "app.py", "a\n")
+  write(root, "other.py", "b\n")
+  commit_hash = commit(repo, "init")
+
+  diff, truncated = commit_diff(SimpleNamespace(repo=repo), commit_hash, "app.py")
+
+  assert not truncated
+  assert "+a" in diff
+  assert "other.py" not in diff
+
+
+def test_diff_is_truncated_at_limit(repo):
+  write(repo.working_tree_dir, "app.py", "x" * 100)
+  commit_hash = commit(repo, "init")
+
+  diff, truncated = commit_diff(SimpleNamespace(repo=repo), commit_hash, limit=40)
+
+  assert len(diff) == 40
+  assert truncated
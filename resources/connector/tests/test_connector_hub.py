@@ -0,0 +1,245 @@
+import asyncio
+import io
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+pytest.importorskip("aider")
+
+import git  # noqa: E402
+from aider.coders import Coder  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import Connector, ConnectorHub, OutboundQueue, SessionOutbound, SessionOutputStream, session_context  # noqa: E402
+
+
+class FakeSio:
+  def __init__(self):
+    self.emitted = []
+
+  async def emit(self, event, data):
+    self.emitted.append((event, data))
+
+
+class FakeSession:
+  def __init__(self):
+    self.messages = []
+    self.closed = False
+
+  async def process_message(self, message):
+    self.messages.append(message)
+
+  async def close(self):
+    self.closed = True
+
+
+def create_hub():
+  hub = ConnectorHub("hub")
+  hub.sio = FakeSio()
+  hub.outbound = OutboundQueue(hub.sio, asyncio.get_running_loop())
+  return hub
+
+
+def test_session_outbound_tags_messages_with_task_id():
+  async def scenario():
+    sio = FakeSio()
+    outbound = OutboundQueue(sio, asyncio.get_running_loop())
+    SessionOutbound(outbound, "a").put("message", {"action": "response"})
+    SessionOutbound(outbound, "b").put("log", {"level": "info"})
+    await outbound.drain()
+    return sio.emitted
+
+  assert asyncio.run(scenario()) == [
+    ("message", {"action": "response", "taskId": "a"}),
+    ("log", {"level": "info", "taskId": "b"}),
+  ]
+
+
+def test_messages_are_routed_by_task_id():
+  async def scenario():
+    hub = create_hub()
+    hub.sessions = {"a": FakeSession(), "b": FakeSession()}
+    await hub.on_message({"action": "prompt", "taskId": "b"})
+    await hub.on_message({"action": "prompt", "taskId": "unknown"})
+    return hub.sessions
+
+  sessions = asyncio.run(scenario())
+  assert sessions["a"].messages == []
+  assert sessions["b"].messages == [{"action": "prompt", "taskId": "b"}]
+
+
+def test_close_session_reports_it_closed():
+  async def scenario():
+    hub = create_hub()
+    session = FakeSession()
+    hub.sessions = {"a": session}
+    await hub.on_message({"action": "close-session", "taskId": "a"})
+    await hub.outbound.drain()
+    return hub, session
+
+  hub, session = asyncio.run(scenario())
+  assert session.closed
+  assert hub.sessions == {}
+  assert hub.sio.emitted == [("message", {"action": "session-closed", "taskId": "a"})]
+
+
+def test_session_output_is_forwarded_from_its_threads():
+  async def scenario():
+    hub = create_hub()
+    real = io.StringIO()
+    stream = SessionOutputStream(hub, real, "stdout")
+
+    stream.write("hub\n")
+    with session_context("a"):
+      stream.write("from loop\n")
+      await asyncio.to_thread(stream.write, "from thread\n")
+    # plain threads do not run session code
+    thread = threading.Thread(target=stream.write, args=("other\n",))
+    thread.start()
+    thread.join()
+
+    await asyncio.sleep(0)
+    await hub.outbound.drain()
+    return real.getvalue(), hub.sio.emitted
+
+  real, emitted = asyncio.run(scenario())
+  assert real == "hub\nother\n"
+  assert emitted == [
+    ("output", {"taskId": "a", "stream": "stdout", "data": "from loop\n"}),
+    ("output", {"taskId": "a", "stream": "stdout", "data": "from thread\n"}),
+  ]
+
+
+def test_sessions_of_other_directories_are_refused(tmp_path):
+  async def scenario():
+    hub = create_hub()
+    await hub.on_message({"action": "open-session", "taskId": "a", "baseDir": str(tmp_path), "taskDir": str(tmp_path), "args": []})
+    await hub.outbound.drain()
+    return hub
+
+  hub = asyncio.run(scenario())
+  assert hub.sessions == {}
+  [(event, data)] = hub.sio.emitted
+  assert (event, data["action"], data["taskId"]) == ("message", "session-closed", "a")
+  assert str(tmp_path) in data["error"]
+
+
+def test_sessions_do_not_change_the_shared_environment(monkeypatch, capsys):
+  monkeypatch.setenv("HUB_TEST_KEY", "hub")
+  session = types.SimpleNamespace(hub=object())
+
+  asyncio.run(Connector.update_environment_variables(session, {"HUB_TEST_KEY": "session", "HUB_TEST_OTHER": "session"}))
+
+  assert os.environ["HUB_TEST_KEY"] == "hub"
+  assert "HUB_TEST_OTHER" not in os.environ
+  assert "HUB_TEST_KEY, HUB_TEST_OTHER" in capsys.readouterr().err
+
+
+def create_repo(root):
+  repo = git.Repo.init(root)
+  with open(os.path.join(root, "a.py"), "w", encoding="utf-8") as file:
+    file.write("def a():\n  return 1\n")
+  repo.index.add(["a.py"])
+  repo.index.commit("init")
+
+
+async def open_session(hub, task_id, root):
+  await hub.on_message({
+    "action": "open-session",
+    "taskId": task_id,
+    "baseDir": root,
+    "taskDir": root,
+    "args": ["--model", "gpt-4o-mini", "--no-check-update", "--no-show-model-warnings", "--no-auto-commits"],
+  })
+  # litellm answers without calling the provider
+  hub.sessions[task_id].coder.main_model.extra_params = {"mock_response": "Nothing to change."}
+
+
+async def run_prompt(hub, task_id, prompt_id):
+  await hub.on_message({"action": "prompt", "taskId": task_id, "prompt": "hi", "mode": "code", "promptContext": {"id": prompt_id}, "options": {}})
+  for _ in range(300):
+    await hub.outbound.drain()
+    if any(data.get("action") == "prompt-finished" and data.get("promptId") == prompt_id for _, data in hub.sio.emitted):
+      return
+    await asyncio.sleep(0.1)
+  raise TimeoutError(prompt_id)
+
+
+def test_prompt_thread_output_goes_to_its_session(tmp_path, monkeypatch):
+  create_repo(str(tmp_path))
+  monkeypatch.chdir(tmp_path)
+  run_stream = Coder.run_stream
+
+  def printing_run_stream(coder, message):
+    print("from prompt thread")
+    yield from run_stream(coder, message)
+
+  monkeypatch.setattr(Coder, "run_stream", printing_run_stream)
+
+  async def scenario():
+    hub = create_hub()
+    real = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", SessionOutputStream(hub, real, "stdout"))
+    await open_session(hub, "a", str(tmp_path))
+    await open_session(hub, "b", str(tmp_path))
+    await run_prompt(hub, "b", "prompt")
+    for task_id in ("a", "b"):
+      await hub.close_session(task_id)
+    await hub.outbound.drain()
+    return real.getvalue(), hub.sio.emitted
+
+  real, emitted = asyncio.run(scenario())
+  assert "from prompt thread" not in real
+  assert [data["taskId"] for event, data in emitted if event == "output" and data["data"] == "from prompt thread"] == ["b"]
+
+
+def test_sessions_share_the_token_counter(tmp_path, monkeypatch):
+  create_repo(str(tmp_path))
+  monkeypatch.chdir(tmp_path)
+
+  async def scenario():
+    hub = create_hub()
+    await open_session(hub, "a", str(tmp_path))
+    await open_session(hub, "b", str(tmp_path))
+    counters = {task_id: session.token_counter for task_id, session in hub.sessions.items()}
+    model = hub.sessions["b"].coder.main_model
+    await hub.close_session("a")
+    # still counting for the other session
+    counts = hub.token_counter.count_batch(model, ["one two", "three"])
+    await hub.close_session("b")
+    await hub.outbound.drain()
+    return hub, counters, counts
+
+  hub, counters, counts = asyncio.run(scenario())
+  assert counters["a"] is hub.token_counter
+  assert counters["b"] is hub.token_counter
+  assert len(counts) == 2 and all(count > 0 for count in counts)
+
+
+def test_map_refresh_keeps_the_chat_files_of_the_repo_map_stage(tmp_path, monkeypatch):
+  create_repo(str(tmp_path))
+  monkeypatch.chdir(tmp_path)
+  files = [{"path": "a.py"}]
+
+  async def scenario():
+    hub = create_hub()
+    await open_session(hub, "a", str(tmp_path))
+    session = hub.sessions["a"]
+    sent = []
+
+    async def send_repo_map(files=None):
+      sent.append(files)
+
+    session.send_repo_map = send_repo_map
+    session.send_context_info([], files)
+    await session.run_command("/map-refresh", [], files)
+    await asyncio.sleep(session.refresh_scheduler.debounce + 0.5)
+    await hub.close_session("a")
+    await hub.outbound.drain()
+    return sent
+
+  assert asyncio.run(scenario()) == [files]
@@ -0,0 +1,96 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("aider")
+
+if not hasattr(os, "fork"):
+  pytest.skip("the fork server needs os.fork", allow_module_level=True)
+
+CONNECTOR_DIR = os.path.join(os.path.dirname(__file__), "..")
+SERVER_ENV = {**os.environ, "SERVER_ONLY": "server"}
+
+# the forked child runs this `main` instead of a real connector
+SERVER_SCRIPT = """
+import os, sys
+import connector
+
+def main(argv):
+  print("args", argv, os.getcwd(), os.environ.get("TASK_ID"), os.environ.get("SERVER_ONLY"), flush=True)
+  sys.stderr.write("to stderr\\n")
+  sys.exit(3)
+
+connector.main = main
+connector.run_fork_server(sys.argv[1])
+"""
+
+
+@pytest.fixture
+def fork_server(tmp_path):
+  socket_path = str(tmp_path / "fork.sock")
+  process = subprocess.Popen([sys.executable, "-c", SERVER_SCRIPT, socket_path], cwd=CONNECTOR_DIR, stdout=subprocess.PIPE, env=SERVER_ENV)
+  try:
+    assert json.loads(process.stdout.readline())["ready"]
+    yield socket_path
+  finally:
+    process.terminate()
+    process.wait(10)
+
+
+def request(socket_path, payload):
+  conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  conn.connect(socket_path)
+  conn.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+  return conn
+
+
+def read_all(conn):
+  data = b""
+  while chunk := conn.recv(4096):
+    data += chunk
+  return data.decode("utf-8")
+
+
+def test_forks_connector_with_task_environment(fork_server, tmp_path):
+  env = {**SERVER_ENV, "TASK_ID": "t1"}
+  stdout = request(fork_server, {"action": "spawn", "id": "task", "args": ["--model", "gpt-4o"], "env": env, "cwd": str(tmp_path)})
+  stderr = request(fork_server, {"action": "attach", "id": "task"})
+
+  header, output = read_all(stdout).split("\n", 1)
+  assert json.loads(header)["pid"] > 0
+  assert output == f"args ['--model', 'gpt-4o'] {os.path.realpath(tmp_path)} t1 server\n"
+  assert read_all(stderr) == "to stderr\n"
+
+
+@pytest.mark.parametrize("env", [
+  {key: value for key, value in SERVER_ENV.items() if key != "SERVER_ONLY"},
+  {**SERVER_ENV, "HTTPS_PROXY": "http://proxy:3128"},
+])
+def test_task_with_other_environment_gets_a_fresh_connector(fork_server, tmp_path, env):
+  stdout = request(fork_server, {"action": "spawn", "id": "task", "args": ["--help"], "env": env, "cwd": str(tmp_path)})
+  stderr = request(fork_server, {"action": "attach", "id": "task"})
+
+  header, output = read_all(stdout).split("\n", 1)
+  assert json.loads(header)["pid"] > 0
+  # the real connector, not the `main` of the fork server
+  assert output.startswith("usage:")
+  assert "starting a fresh connector" in read_all(stderr)
+
+
+def test_unmatched_attach_is_closed(fork_server):
+  conn = request(fork_server, {"action": "attach", "id": "unknown"})
+  conn.settimeout(5)
+  assert read_all(conn) == ""
+
+
+def test_server_keeps_serving_after_a_child_exits(fork_server, tmp_path):
+  for task_id in ("a", "b"):
+    stdout = request(fork_server, {"action": "spawn", "id": task_id, "env": {**SERVER_ENV, "TASK_ID": task_id}, "cwd": str(tmp_path)})
+    request(fork_server, {"action": "attach", "id": task_id})
+    assert read_all(stdout).endswith(f" {task_id} server\n")
+    time.sleep(0.1)
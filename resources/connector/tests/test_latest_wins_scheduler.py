@@ -0,0 +1,101 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import LatestWinsScheduler  # noqa: E402
+
+
+def run(coroutine):
+  loop = asyncio.new_event_loop()
+  try:
+    return loop.run_until_complete(coroutine(loop))
+  finally:
+    loop.close()
+
+
+def test_burst_within_debounce_runs_only_the_latest():
+  async def scenario(loop):
+    scheduler = LatestWinsScheduler(loop, debounce=0.01)
+    runs = []
+
+    def job(value):
+      async def run_job():
+        runs.append(value)
+      return run_job
+
+    for value in range(5):
+      task = scheduler.submit("repo-map", job(value))
+    await task
+
+    assert runs == [4]
+    assert scheduler.get_metrics() == {"requested": 5, "debounced": 4, "completed": 1}
+
+  run(scenario)
+
+
+def test_newer_request_cancels_running_work():
+  async def scenario(loop):
+    scheduler = LatestWinsScheduler(loop, debounce=0)
+    started = asyncio.Event()
+    runs = []
+
+    async def slow():
+      started.set()
+      await asyncio.sleep(10)
+      runs.append("slow")
+
+    async def fast():
+      runs.append("fast")
+
+    scheduler.submit("tokens-info", slow)
+    await started.wait()
+    await scheduler.submit("tokens-info", fast)
+
+    assert runs == ["fast"]
+    assert scheduler.get_metrics()["cancelled"] == 1
+    assert not scheduler.tasks
+
+  run(scenario)
+
+
+def test_keys_are_independent():
+  async def scenario(loop):
+    scheduler = LatestWinsScheduler(loop, debounce=0.01)
+    runs = []
+
+    def job(value):
+      async def run_job():
+        runs.append(value)
+      return run_job
+
+    first = scheduler.submit("tokens-info", job("tokens"))
+    second = scheduler.submit("repo-map", job("map"))
+    await asyncio.gather(first, second)
+
+    assert sorted(runs) == ["map", "tokens"]
+
+  run(scenario)
+
+
+def test_cancel_all_stops_pending_work():
+  async def scenario(loop):
+    scheduler = LatestWinsScheduler(loop, debounce=0.05)
+    runs = []
+
+    async def job():
+      runs.append(1)
+
+    task = scheduler.submit("autocompletion", job)
+    scheduler.cancel_all()
+    await asyncio.sleep(0.1)
+
+    assert task.cancelled()
+    assert runs == []
+
+  run(scenario)
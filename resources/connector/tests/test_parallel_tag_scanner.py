@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import ParallelTagScanner, ProjectTagsCache, RepoMapCancelled  # noqa: E402
+
+
+class FakeIO:
+  encoding = "utf-8"
+
+
+class CountingCache(dict):
+  def __init__(self):
+    super().__init__()
+    self.lookups = 0
+
+  def get(self, key, default=None):
+    self.lookups += 1
+    return super().get(key, default)
+
+
+class FakeRepoMap:
+  def __init__(self, root):
+    self.root = root
+    self.io = FakeIO()
+    self.TAGS_CACHE = CountingCache()
+
+  def get_mtime(self, fname):
+    return os.path.getmtime(fname)
+
+  def get_rel_fname(self, fname):
+    return os.path.relpath(fname, self.root)
+
+
+def create_files(root, count):
+  os.makedirs(root, exist_ok=True)
+  fnames = []
+  for index in range(count):
+    fname = os.path.join(root, f"module_{index}.py")
+    with open(fname, "w", encoding="utf-8") as file:
+      file.write(f"def function_{index}():\n  return {index}\n")
+    fnames.append(fname)
+  return fnames
+
+
+def test_scan_fills_the_repo_map_cache(tmp_path):
+  fnames = create_files(str(tmp_path), 40)
+  repo_map = FakeRepoMap(str(tmp_path))
+  progress = []
+  scanner = ParallelTagScanner(progress=lambda *args: progress.append(args), min_files=10, workers=2)
+
+  assert scanner.scan(repo_map, set(fnames)) == 40
+
+  entry = repo_map.TAGS_CACHE[fnames[3]]
+  assert entry["mtime"] == os.path.getmtime(fnames[3])
+  assert {(tag.rel_fname, tag.name, tag.kind) for tag in entry["data"] if tag.kind == "def"} == {("module_3.py", "function_3", "def")}
+  assert progress[0] == (0, 40, False)
+  assert progress[-1] == (40, 40, True)
+
+  # everything is cached now
+  other = FakeRepoMap(str(tmp_path))
+  other.TAGS_CACHE = repo_map.TAGS_CACHE
+  assert scanner.scan(other, set(fnames)) == 0
+
+
+def test_small_scans_are_left_to_the_repo_map(tmp_path):
+  fnames = create_files(str(tmp_path), 5)
+  repo_map = FakeRepoMap(str(tmp_path))
+
+  assert ParallelTagScanner(min_files=10, workers=2).scan(repo_map, set(fnames)) == 0
+  assert repo_map.TAGS_CACHE == {}
+
+
+def test_only_the_first_build_of_a_map_is_scanned(tmp_path):
+  fnames = create_files(str(tmp_path), 5)
+  repo_map = FakeRepoMap(str(tmp_path))
+  scanner = ParallelTagScanner(min_files=10, workers=2)
+  scanner.scan(repo_map, set(fnames))
+  assert repo_map.TAGS_CACHE.lookups == 5
+
+  # later builds leave new files to aider, without checking the caches again
+  fnames += create_files(str(tmp_path / "more"), 20)
+  assert scanner.scan(repo_map, set(fnames)) == 0
+  assert repo_map.TAGS_CACHE.lookups == 5
+
+
+def test_scan_fills_the_project_cache(tmp_path):
+  fnames = create_files(str(tmp_path / "repo"), 20)
+  repo_map = FakeRepoMap(str(tmp_path / "repo"))
+  tags_cache = ProjectTagsCache(str(tmp_path / "cache"))
+  repo_map.connector_tags_cache = tags_cache
+  scanner = ParallelTagScanner(min_files=10, workers=2)
+
+  scanner.scan(repo_map, set(fnames))
+  assert tags_cache.misses == 20
+
+  # a new task of the project finds them in the project cache
+  other = FakeRepoMap(str(tmp_path / "repo"))
+  other.connector_tags_cache = tags_cache
+  assert scanner.scan(other, set(fnames)) == 0
+
+
+def test_cancelled_scan_raises(tmp_path):
+  fnames = create_files(str(tmp_path), 20)
+  cancel_event = threading.Event()
+  cancel_event.set()
+
+  with pytest.raises(RepoMapCancelled):
+    ParallelTagScanner(min_files=10, workers=2).scan(FakeRepoMap(str(tmp_path)), set(fnames), cancel_event)
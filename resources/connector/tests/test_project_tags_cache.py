@@ -0,0 +1,113 @@
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aider.repomap import Tag  # noqa: E402
+
+from connector import ProjectTagsCache  # noqa: E402
+
+
+class FakeRepoMap:
+  def __init__(self):
+    self.parsed = []
+
+  def get_tags_raw(self, fname, rel_fname):
+    self.parsed.append(fname)
+    with open(fname, "r", encoding="utf-8") as file:
+      for line, text in enumerate(file):
+        if text.startswith("def "):
+          yield Tag(rel_fname=rel_fname, fname=fname, line=line, name=text[4:].split("(")[0], kind="def")
+
+
+def write(root, rel_fname, content):
+  path = os.path.join(root, rel_fname)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, "w", encoding="utf-8") as file:
+    file.write(content)
+  return path
+
+
+def get_tags(repo_map, root, rel_fname):
+  return list(repo_map.get_tags_raw(os.path.join(root, rel_fname), rel_fname))
+
+
+def test_blob_hash_matches_git():
+  # git hash-object of an empty file and of "hello\n"
+  assert ProjectTagsCache.blob_hash(b"") == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+  assert ProjectTagsCache.blob_hash(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_worktrees_share_tags_of_unchanged_files(tmp_path):
+  cache = ProjectTagsCache(str(tmp_path / "cache"))
+  first, second = str(tmp_path / "first"), str(tmp_path / "second")
+  for root in (first, second):
+    write(root, "pkg/a.py", "def a():\n  pass\n")
+
+  first_map, second_map = FakeRepoMap(), FakeRepoMap()
+  cache.install(first_map)
+  cache.install(second_map)
+
+  assert get_tags(first_map, first, "pkg/a.py")[0].name == "a"
+  tags = get_tags(second_map, second, "pkg/a.py")
+
+  assert second_map.parsed == []
+  assert tags == [Tag(rel_fname="pkg/a.py", fname=os.path.join(second, "pkg/a.py"), line=0, name="a", kind="def")]
+  assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_changed_content_is_parsed_again(tmp_path):
+  cache = ProjectTagsCache(str(tmp_path / "cache"))
+  root = str(tmp_path / "repo")
+  write(root, "a.py", "def a():\n  pass\n")
+  repo_map = FakeRepoMap()
+  cache.install(repo_map)
+
+  get_tags(repo_map, root, "a.py")
+  write(root, "a.py", "def b():\n  pass\n")
+
+  assert get_tags(repo_map, root, "a.py")[0].name == "b"
+  assert len(repo_map.parsed) == 2
+
+
+def test_saved_entries_are_merged_and_loaded(tmp_path):
+  path = str(tmp_path / "cache")
+  root = str(tmp_path / "repo")
+  write(root, "a.py", "def a():\n  pass\n")
+  write(root, "b.py", "def b():\n  pass\n")
+
+  # two connectors of the project save at once
+  caches = [ProjectTagsCache(path), ProjectTagsCache(path)]
+  for cache, rel_fname in zip(caches, ("a.py", "b.py")):
+    repo_map = FakeRepoMap()
+    cache.install(repo_map)
+    get_tags(repo_map, root, rel_fname)
+  threads = [threading.Thread(target=cache.save) for cache in caches]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  repo_map = FakeRepoMap()
+  ProjectTagsCache(path).install(repo_map)
+  assert [tag.name for rel_fname in ("a.py", "b.py") for tag in get_tags(repo_map, root, rel_fname)] == ["a", "b"]
+  assert repo_map.parsed == []
+
+
+def test_files_without_language_are_not_cached(tmp_path):
+  cache = ProjectTagsCache(str(tmp_path / "cache"))
+  root = str(tmp_path / "repo")
+  write(root, "notes.unknownext", "def a():\n")
+  repo_map = FakeRepoMap()
+  cache.install(repo_map)
+
+  get_tags(repo_map, root, "notes.unknownext")
+  get_tags(repo_map, root, "notes.unknownext")
+
+  assert len(repo_map.parsed) == 2
+  assert cache.misses == 0
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("aider")
+
+import git  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import ConnectorHub, OutboundQueue, PromptMetrics  # noqa: E402
+
+
+def test_spans_with_same_name_add_up():
+  metrics = PromptMetrics()
+  with metrics.span("lint"):
+    pass
+  with metrics.span("lint"):
+    pass
+  metrics.add_duration("outboundWait", 0.25)
+
+  result = metrics.to_dict()
+  assert [name for name, _, _ in metrics.spans] == ["lint", "lint"]
+  assert result["lintMs"] >= 0
+  assert result["outboundWaitMs"] == 250.0
+  assert result["cloneMs"] == 0
+  assert set(f"{name}Ms" for name in PromptMetrics.SPANS) <= set(result)
+
+
+def test_spans_from_threads():
+  metrics = PromptMetrics()
+
+  def record():
+    with metrics.span("commitMessage"):
+      pass
+
+  threads = [threading.Thread(target=record) for _ in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert len(metrics.spans) == 8
+
+
+def test_first_token_comes_from_first_stream():
+  metrics = PromptMetrics()
+  metrics.record_stream(10.0, 10.5, 12.5, 101)
+  metrics.record_stream(20.0, 20.1, 22.1, 99)
+  metrics.record_stream(30.0, None, None, 0)
+  metrics.reflections = 1
+
+  result = metrics.to_dict()
+  assert result["timeToFirstTokenMs"] == 500.0
+  assert result["streamedChunks"] == 200
+  assert result["tokensPerSecond"] == 50.0
+  assert result["reflections"] == 1
+
+
+def test_no_stream_has_no_rates():
+  result = PromptMetrics().to_dict()
+  assert result["timeToFirstTokenMs"] is None
+  assert result["tokensPerSecond"] is None
+
+
+class FakeSio:
+  def __init__(self):
+    self.emitted = []
+
+  async def emit(self, event, data):
+    self.emitted.append((event, data))
+
+
+def test_outbound_queue_reports_latency_once_sent():
+  async def scenario():
+    sio = FakeSio()
+    queue = OutboundQueue(sio, asyncio.get_running_loop())
+    latencies = []
+    queue.put("message", {"action": "response"}, latencies.append)
+    queue.put("log", {"level": "info"})
+    assert latencies == []
+
+    await queue.drain()
+    assert len(latencies) == 1 and latencies[0] >= 0
+    assert [event for event, _ in sio.emitted] == ["message", "log"]
+
+  asyncio.run(scenario())
+
+
+EDIT_RESPONSE = "a.py\n```python\n<<<<<<< SEARCH\n  return 1\n=======\n  return 2\n>>>>>>> REPLACE\n```\n"
+
+
+def test_prompt_edits_are_linted_within_the_prompt_metrics(tmp_path, monkeypatch):
+  repo = git.Repo.init(tmp_path)
+  (tmp_path / "a.py").write_text("def a():\n  return 1\n", encoding="utf-8")
+  repo.index.add(["a.py"])
+  repo.index.commit("init")
+  monkeypatch.chdir(tmp_path)
+
+  async def scenario():
+    hub = ConnectorHub("hub")
+    hub.sio = FakeSio()
+    hub.outbound = OutboundQueue(hub.sio, asyncio.get_running_loop())
+    await hub.on_message({
+      "action": "open-session",
+      "taskId": "a",
+      "baseDir": str(tmp_path),
+      "taskDir": str(tmp_path),
+      "args": ["--model", "gpt-4o-mini", "--no-check-update", "--no-show-model-warnings", "--no-auto-commits", "--auto-lint"],
+    })
+    # litellm answers with the edit without calling the provider
+    hub.sessions["a"].coder.main_model.extra_params = {"mock_response": EDIT_RESPONSE}
+    await hub.on_message({
+      "action": "prompt",
+      "taskId": "a",
+      "prompt": "return 2",
+      "mode": "diff",
+      "promptContext": {"id": "prompt"},
+      "files": [{"path": "a.py"}],
+      "options": {"autoApprove": True},
+    })
+    for _ in range(300):
+      await hub.outbound.drain()
+      metrics = [data["metrics"] for _, data in hub.sio.emitted if data.get("action") == "prompt-metrics"]
+      if metrics:
+        break
+      await asyncio.sleep(0.1)
+    await hub.close_session("a")
+    await hub.outbound.drain()
+    return metrics
+
+  [metrics] = asyncio.run(scenario())
+  assert (tmp_path / "a.py").read_text(encoding="utf-8") == "def a():\n  return 2\n"
+  assert metrics["lintMs"] > 0
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import (  # noqa: E402
+  PROMPT_PRIORITY_EDITOR,
+  PROMPT_PRIORITY_FILE_WATCHER,
+  PROMPT_PRIORITY_INTERACTIVE,
+  PromptContext,
+  PromptScheduler,
+)
+
+
+class FakeConnector:
+  def __init__(self, loop):
+    self.loop = loop
+    self.logs = []
+
+  def post_log_message(self, level, message, finished=False, prompt_context=None):
+    self.logs.append((level, message, finished, prompt_context.id if prompt_context else None))
+
+
+def run(coroutine):
+  loop = asyncio.new_event_loop()
+  try:
+    return loop.run_until_complete(coroutine(loop))
+  finally:
+    loop.close()
+
+
+def test_admits_up_to_limit_then_queues():
+  async def scenario(loop):
+    scheduler = PromptScheduler(FakeConnector(loop), 2)
+    await scheduler.acquire(PromptContext("a"))
+    await scheduler.acquire(PromptContext("b"))
+
+    waiting = loop.create_task(scheduler.acquire(PromptContext("c")))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+    assert scheduler.get_state() == {"limit": 2, "running": 2, "queued": 1}
+
+    scheduler.release("a")
+    await waiting
+    assert scheduler.running == {"b", "c"}
+
+  run(scenario)
+
+
+def test_priority_order_then_fifo():
+  async def scenario(loop):
+    scheduler = PromptScheduler(FakeConnector(loop), 1)
+    await scheduler.acquire(PromptContext("running"))
+
+    order = []
+
+    async def wait(prompt_context):
+      await scheduler.acquire(prompt_context)
+      order.append(prompt_context.id)
+
+    tasks = [
+      loop.create_task(wait(PromptContext("watcher", priority=PROMPT_PRIORITY_FILE_WATCHER))),
+      loop.create_task(wait(PromptContext("editor", priority=PROMPT_PRIORITY_EDITOR))),
+      loop.create_task(wait(PromptContext("first", priority=PROMPT_PRIORITY_INTERACTIVE))),
+      loop.create_task(wait(PromptContext("second", priority=PROMPT_PRIORITY_INTERACTIVE))),
+    ]
+    await asyncio.sleep(0)
+
+    previous = "running"
+    for _ in tasks:
+      scheduler.release(previous)
+      await asyncio.sleep(0)
+      previous = order[-1]
+
+    assert order == ["first", "second", "editor", "watcher"]
+
+  run(scenario)
+
+
+def test_cancelled_while_queued_frees_nothing_and_is_skipped():
+  async def scenario(loop):
+    connector = FakeConnector(loop)
+    scheduler = PromptScheduler(connector, 1)
+    await scheduler.acquire(PromptContext("a"))
+
+    cancelled = loop.create_task(scheduler.acquire(PromptContext("b")))
+    waiting = loop.create_task(scheduler.acquire(PromptContext("c")))
+    await asyncio.sleep(0)
+
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+      await cancelled
+
+    scheduler.release("a")
+    await waiting
+    assert scheduler.running == {"c"}
+    assert ("loading", "", True, "b") in connector.logs
+
+  run(scenario)
+
+
+def test_release_drops_queued_entry_of_same_prompt():
+  async def scenario(loop):
+    scheduler = PromptScheduler(FakeConnector(loop), 1)
+    await scheduler.acquire(PromptContext("a"))
+
+    waiting = loop.create_task(scheduler.acquire(PromptContext("b")))
+    await asyncio.sleep(0)
+    scheduler.release("b")
+
+    with pytest.raises(asyncio.CancelledError):
+      await waiting
+    assert scheduler.get_state()["queued"] == 0
+
+  run(scenario)
+
+
+def test_raising_limit_admits_waiting_prompts():
+  async def scenario(loop):
+    scheduler = PromptScheduler(FakeConnector(loop), 1)
+    await scheduler.acquire(PromptContext("a"))
+    waiting = loop.create_task(scheduler.acquire(PromptContext("b")))
+    await asyncio.sleep(0)
+
+    scheduler.set_limit(2)
+    await waiting
+    assert scheduler.running == {"a", "b"}
+
+  run(scenario)
@@ -0,0 +1,116 @@
+import os
+import random
+import sys
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import ANSWER_MARKER, THINKING_MARKER, ReasoningStreamParser  # noqa: E402
+
+THINKING = "------\n► **THINKING**\n"
+ANSWER = "------\n► **ANSWER**\n"
+TEXT = f"{THINKING}Let me think about it.\n{ANSWER}The answer is 42.\n"
+
+
+def parse_whole(text):
+  """Reference split of the whole output, as done before incremental parsing."""
+  thinking_match = THINKING_MARKER.search(text)
+  if not thinking_match:
+    return "", text
+  answer_match = ANSWER_MARKER.search(text)
+  if not answer_match:
+    return text[thinking_match.end():].strip(), ""
+  return text[thinking_match.end():answer_match.start()].strip(), text[answer_match.end():].strip()
+
+
+def stream(chunks):
+  parser = ReasoningStreamParser()
+  deltas = []
+  for chunk in chunks:
+    deltas.extend(parser.feed(chunk))
+  deltas.extend(parser.finish())
+  return parser, deltas
+
+
+def joined(deltas, kind):
+  return "".join(text for delta_kind, text in deltas if delta_kind == kind)
+
+
+def assert_split(text, chunks):
+  parser, deltas = stream(chunks)
+  reasoning, answer = parse_whole(text)
+
+  assert parser.content == text
+  assert parser.reasoning == reasoning
+  assert parser.answer == answer
+  assert joined(deltas, "reasoning").strip() == reasoning
+  if THINKING_MARKER.search(text):
+    assert joined(deltas, "content").strip().endswith(answer)
+  else:
+    assert joined(deltas, "content") == text
+  for _, delta in deltas:
+    assert "►" not in delta
+
+
+def test_single_chunk():
+  assert_split(TEXT, [TEXT])
+
+
+def test_char_by_char():
+  assert_split(TEXT, list(TEXT))
+
+
+@pytest.mark.parametrize("text", [TEXT, f"{THINKING}Only thinking here.\n", "Plain answer --- with dashes.\n"])
+def test_every_two_way_split(text):
+  for i in range(len(text) + 1):
+    assert_split(text, [text[:i], text[i:]])
+
+
+def test_every_three_way_split():
+  for i in range(len(TEXT) + 1):
+    for j in range(i, len(TEXT) + 1):
+      assert_split(TEXT, [TEXT[:i], TEXT[i:j], TEXT[j:]])
+
+
+def test_random_chunking():
+  rng = random.Random(1234)
+  text = f"Intro\n{THINKING}" + "reasoning line\n" * 50 + ANSWER + "answer --- line\n" * 50
+  for _ in range(200):
+    chunks = []
+    position = 0
+    while position < len(text):
+      size = rng.randint(1, 12)
+      chunks.append(text[position:position + size])
+      position += size
+    assert_split(text, chunks)
+
+
+def test_content_before_thinking_is_streamed_as_content():
+  parser, deltas = stream(["Hello\n", THINKING, "hmm\n", ANSWER, "done\n"])
+  assert deltas[0] == ("content", "Hello\n")
+  assert joined(deltas, "reasoning") == "hmm\n"
+  assert parser.answer == "done"
+
+
+def test_answer_marker_without_thinking_stays_content():
+  text = f"{ANSWER}no reasoning\n"
+  parser, deltas = stream(list(text))
+  assert parser.reasoning == ""
+  assert parser.answer == text
+  assert joined(deltas, "content") == text
+
+
+def test_dashes_are_held_back_only_until_ruled_out():
+  parser = ReasoningStreamParser()
+  assert parser.feed("a ---") == [("content", "a ")]
+  assert parser.feed(" b") == [("content", "--- b")]
+
+
+def test_tail_stays_bounded():
+  parser = ReasoningStreamParser()
+  for _ in range(1000):
+    parser.feed("-" * 10)
+  assert len(parser._tail) <= ReasoningStreamParser.MAX_TAIL_SIZE
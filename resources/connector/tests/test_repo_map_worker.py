@@ -0,0 +1,144 @@
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import Connector, RepoMapWorker, repo_map_delta  # noqa: E402
+
+
+def apply_delta(old, ops):
+  lines = old.split("\n")
+  for start, end, new_lines in reversed(ops):
+    lines[start:end] = new_lines
+  return "\n".join(lines)
+
+
+class SlowRepoMap:
+  """Tags each file with a short sleep, like tree-sitter on a large repo."""
+
+  def __init__(self, delay=0.01):
+    self.delay = delay
+    self.tagged = []
+
+  def get_tags(self, fname, rel_fname):
+    time.sleep(self.delay)
+    self.tagged.append(fname)
+    return []
+
+  def get_repo_map(self, chat_files, other_files):
+    for fname in sorted(other_files):
+      self.get_tags(fname, fname)
+    return "\n".join(sorted(other_files))
+
+
+def run(coroutine):
+  loop = asyncio.new_event_loop()
+  try:
+    return loop.run_until_complete(coroutine(loop))
+  finally:
+    loop.close()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_delta_reproduces_new_map(seed):
+  rng = random.Random(seed)
+  old_lines = [f"src/file{index}.py:\n│def f{index}()" for index in range(rng.randint(0, 30))]
+  new_lines = list(old_lines)
+  for _ in range(rng.randint(0, 10)):
+    position = rng.randint(0, len(new_lines))
+    if new_lines and rng.random() < 0.5:
+      del new_lines[min(position, len(new_lines) - 1)]
+    else:
+      new_lines.insert(position, f"src/new{rng.randint(0, 1000)}.py:")
+  old = "\n".join(old_lines)
+  new = "\n".join(new_lines)
+
+  assert apply_delta(old, repo_map_delta(old, new)) == new
+
+
+def test_unchanged_map_has_empty_delta():
+  repo_map = "a.py:\n│def a()\nb.py:"
+  assert repo_map_delta(repo_map, repo_map) == []
+
+
+def test_builds_off_the_loop_thread():
+  async def scenario(loop):
+    worker = RepoMapWorker(loop)
+    repo_map = SlowRepoMap(delay=0)
+    thread_names = []
+    original = repo_map.get_repo_map
+
+    def get_repo_map(chat_files, other_files):
+      thread_names.append(threading.current_thread().name)
+      return original(chat_files, other_files)
+
+    repo_map.get_repo_map = get_repo_map
+    result = await worker.build(repo_map, set(), {"a.py", "b.py"})
+
+    assert result == "a.py\nb.py"
+    assert thread_names[0].startswith("repo-map")
+
+  run(scenario)
+
+
+def test_timeout_stops_the_build_early():
+  async def scenario(loop):
+    worker = RepoMapWorker(loop, timeout=0.05)
+    repo_map = SlowRepoMap(delay=0.01)
+    files = {f"file{index}.py" for index in range(200)}
+
+    with pytest.raises(asyncio.TimeoutError):
+      await worker.build(repo_map, set(), files)
+
+    # the next build waits for the abandoned one, which stops at the next file
+    worker.timeout = 5
+    await worker.build(SlowRepoMap(delay=0), set(), {"a.py"})
+    assert len(repo_map.tagged) < len(files)
+
+  run(scenario)
+
+
+def test_cancel_does_not_affect_other_threads_using_the_same_map():
+  async def scenario(loop):
+    worker = RepoMapWorker(loop)
+    repo_map = SlowRepoMap(delay=0.005)
+    files = {f"file{index}.py" for index in range(50)}
+
+    task = loop.create_task(worker.build(repo_map, set(), files))
+    await asyncio.sleep(0.02)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+      await task
+
+    # a prompt thread using the wrapped map is not cancelled
+    result = await asyncio.to_thread(repo_map.get_repo_map, set(), {"a.py"})
+    assert result == "a.py"
+
+  run(scenario)
+
+
+def test_full_repo_map_is_sent_again_on_request():
+  sent = []
+
+  async def send_action(message):
+    sent.append(message)
+
+  session = types.SimpleNamespace(sent_repo_map=None, sent_repo_map_hash=None, repo_map_updates_skipped=0, send_action=send_action)
+
+  async def scenario():
+    await Connector.send_repo_map_update(session, "a.py:\n│def a()")
+    await Connector.send_repo_map_update(session, "a.py:\n│def b()")
+    await Connector.resend_repo_map(session)
+
+  asyncio.run(scenario())
+  assert "delta" in sent[1]
+  assert sent[2] == {"action": "update-repo-map", "hash": sent[1]["hash"], "repoMap": "a.py:\n│def b()"}
@@ -0,0 +1,103 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import TokenCountCache  # noqa: E402
+
+
+class Counter:
+  def __init__(self, tokens):
+    self.tokens = tokens
+    self.calls = 0
+
+  def __call__(self):
+    self.calls += 1
+    return self.tokens
+
+
+def write(path, content, mtime_ns):
+  path.write_text(content)
+  os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_counts_once_until_file_changes(tmp_path):
+  file_path = tmp_path / "a.py"
+  write(file_path, "print(1)\n", 1_000_000_000)
+  cache = TokenCountCache()
+  counter = Counter(7)
+
+  assert cache.count(str(file_path), "gpt-4o", "text", counter) == 7
+  assert cache.count(str(file_path), "gpt-4o", "text", counter) == 7
+  assert counter.calls == 1
+
+  write(file_path, "print(12)\n", 2_000_000_000)
+  assert cache.count(str(file_path), "gpt-4o", "text", counter) == 7
+  assert counter.calls == 2
+
+
+def test_model_and_kind_are_part_of_the_key(tmp_path):
+  file_path = tmp_path / "a.png"
+  write(file_path, "x", 1_000_000_000)
+  cache = TokenCountCache()
+  counter = Counter(3)
+
+  cache.count(str(file_path), "gpt-4o", "image", counter)
+  cache.count(str(file_path), "claude-sonnet", "image", counter)
+  cache.count(str(file_path), "gpt-4o", "text", counter)
+  assert counter.calls == 3
+
+
+def test_missing_file_is_not_cached(tmp_path):
+  cache = TokenCountCache()
+  counter = Counter(0)
+  missing = str(tmp_path / "missing.py")
+
+  cache.count(missing, "gpt-4o", "text", counter)
+  cache.count(missing, "gpt-4o", "text", counter)
+  assert counter.calls == 2
+  assert not cache.entries
+
+
+def test_evicts_least_recently_used(tmp_path):
+  cache = TokenCountCache(capacity=2)
+  paths = []
+  for index in range(3):
+    path = tmp_path / f"{index}.py"
+    write(path, str(index), 1_000_000_000)
+    paths.append(str(path))
+
+  cache.count(paths[0], "m", "text", Counter(1))
+  cache.count(paths[1], "m", "text", Counter(1))
+  cache.count(paths[0], "m", "text", Counter(1))
+  cache.count(paths[2], "m", "text", Counter(1))
+
+  cached_paths = {key[0] for key in cache.entries}
+  assert cached_paths == {paths[0], paths[2]}
+
+
+def test_persists_and_merges_between_instances(tmp_path):
+  cache_path = str(tmp_path / ".aider-desk" / "cache" / "token-counts.json")
+  first_file = tmp_path / "a.py"
+  second_file = tmp_path / "b.py"
+  write(first_file, "a", 1_000_000_000)
+  write(second_file, "b", 1_000_000_000)
+
+  first = TokenCountCache(path=cache_path)
+  first.count(str(first_file), "m", "text", Counter(11))
+  first.save()
+
+  second = TokenCountCache(path=cache_path)
+  second.count(str(second_file), "m", "text", Counter(22))
+  second.save()
+
+  restarted = TokenCountCache(path=cache_path)
+  restarted.load()
+  counter = Counter(0)
+  assert restarted.count(str(first_file), "m", "text", counter) == 11
+  assert restarted.count(str(second_file), "m", "text", counter) == 22
+  assert counter.calls == 0
@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import TokenCountEngine  # noqa: E402
+
+
+class FakeModel:
+  name = "fake-model"
+
+  def __init__(self):
+    self.threads = set()
+
+  def token_count(self, text):
+    self.threads.add(threading.get_ident())
+    return len(text.split())
+
+
+def test_count_batch_keeps_the_order():
+  engine = TokenCountEngine(workers=4)
+  texts = [" ".join(["word"] * count) for count in range(50)]
+
+  assert engine.count_batch(FakeModel(), texts) == list(range(50))
+
+
+def test_count_batch_uses_the_pool():
+  engine = TokenCountEngine(workers=4)
+  model = FakeModel()
+  engine.count_batch(model, ["a b"] * 200)
+
+  assert threading.get_ident() not in model.threads
+
+
+def test_estimate_starts_from_the_default_ratio():
+  engine = TokenCountEngine(workers=1)
+
+  assert engine.estimate("fake-model", 4000) == 1000
+  assert engine.estimate("fake-model", 0) == 0
+  assert engine.estimate("fake-model", 1) == 1
+
+
+def test_exact_counts_calibrate_the_estimate():
+  engine = TokenCountEngine(workers=1)
+  model = FakeModel()
+  # one token per 8 bytes ("abcdefg ")
+  engine.count_batch(model, ["abcdefg " * 1000] * 10)
+
+  assert engine.estimate("fake-model", 8000) == pytest.approx(1000, rel=0.05)
+  assert engine.estimate("other-model", 8000) == 2000
+
+
+def test_short_texts_do_not_calibrate():
+  engine = TokenCountEngine(workers=1)
+  engine.count(FakeModel(), "a")
+
+  assert engine.calibration == {}
@@ -0,0 +1,103 @@
+import os
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("aider")
+
+import git  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import TrackedFileIndex  # noqa: E402
+
+
+class FakeCoder:
+  def __init__(self, root):
+    self.root = root
+    self.repo = types.SimpleNamespace(repo=git.Repo(root), aider_ignore_file=None)
+    self.listed = 0
+
+  def get_all_relative_files(self):
+    self.listed += 1
+    return sorted(path for path, _ in self.repo.repo.index.entries.keys())
+
+  def abs_root_path(self, path):
+    return os.path.join(self.root, path)
+
+
+def add_file(repo, rel_fname):
+  with open(os.path.join(repo.working_tree_dir, rel_fname), "w", encoding="utf-8") as file:
+    file.write(rel_fname)
+  repo.index.add([rel_fname])
+  repo.index.write()
+
+
+@pytest.fixture
+def coder(tmp_path):
+  repo = git.Repo.init(tmp_path)
+  add_file(repo, "a.py")
+  return FakeCoder(str(tmp_path))
+
+
+def test_listing_is_reused_until_the_index_changes(coder):
+  index = TrackedFileIndex()
+
+  first = index.get(coder)
+  assert index.get(coder) is first
+  assert coder.listed == 1
+
+  add_file(coder.repo.repo, "b.py")
+  assert index.get(coder).rel_files == ["a.py", "b.py"]
+  assert coder.listed == 2
+
+
+def test_invalidate_lists_again(coder):
+  index = TrackedFileIndex()
+  index.get(coder)
+  index.invalidate()
+  index.get(coder)
+
+  assert (index.listings, index.reused) == (2, 0)
+
+
+def test_views(coder):
+  add_file(coder.repo.repo, "b.py")
+  tracked_files = TrackedFileIndex().get(coder)
+  a, b = (os.path.join(coder.root, name) for name in ("a.py", "b.py"))
+
+  assert tracked_files.abs_files == [a, b]
+  assert tracked_files.other_files({a}) == {b}
+  assert tracked_files.get_rel_fname(b) == "b.py"
+  assert tracked_files.get_rel_fname(os.path.join(coder.root, "missing.py")) is None
+
+
+def test_install_serves_the_coder_listing(coder):
+  index = TrackedFileIndex()
+  index.install(coder)
+
+  assert coder.get_all_relative_files() == ["a.py"]
+  assert coder.get_all_abs_files() == [os.path.join(coder.root, "a.py")]
+  assert coder.listed == 1
+
+
+class ChatFilesCoder(FakeCoder):
+  def __init__(self, root):
+    self.root = root
+    self.repo = None
+    self.listed = 0
+
+  def get_all_relative_files(self):
+    self.listed += 1
+    return ["chat.py"]
+
+
+def test_coders_without_repo_are_not_cached(tmp_path):
+  coder = ChatFilesCoder(str(tmp_path))
+  index = TrackedFileIndex()
+
+  assert index.get(coder).rel_files == ["chat.py"]
+  index.get(coder)
+  assert coder.listed == 2
+  assert index.listings == 0
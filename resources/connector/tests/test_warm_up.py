@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import WarmUp  # noqa: E402
+
+
+def create_warm_up(steps, reports, is_busy=lambda: False):
+  return WarmUp(asyncio.get_running_loop(), steps, lambda *args: reports.append(args), is_busy, delay=0, poll_interval=0.01)
+
+
+def test_steps_run_in_order_and_report_progress():
+  async def scenario():
+    ran, reports = [], []
+
+    def step(name):
+      async def run():
+        ran.append(name)
+      return (name, run)
+
+    await create_warm_up([step("files"), step("repo-map")], reports).start()
+    return ran, reports
+
+  ran, reports = asyncio.run(scenario())
+  assert ran == ["files", "repo-map"]
+  assert reports == [("files", 1, 2, False, False), ("repo-map", 2, 2, True, False)]
+
+
+def test_failed_step_does_not_stop_the_others():
+  async def scenario():
+    async def fail():
+      raise RuntimeError("no tokenizer")
+
+    async def succeed():
+      pass
+
+    reports = []
+    warm_up = create_warm_up([("tokenizer", fail), ("repo-map", succeed)], reports)
+    await warm_up.start()
+    return warm_up, reports
+
+  warm_up, reports = asyncio.run(scenario())
+  assert warm_up.errors == {"tokenizer": "no tokenizer"}
+  assert reports[-1] == ("repo-map", 2, 2, True, False)
+
+
+def test_steps_wait_while_busy():
+  async def scenario():
+    busy = [True]
+    ran = []
+
+    async def step():
+      ran.append("files")
+
+    warm_up = create_warm_up([("files", step)], [], is_busy=lambda: busy[0])
+    task = warm_up.start()
+    await asyncio.sleep(0.05)
+    waited = list(ran)
+    busy[0] = False
+    await task
+    return waited, ran
+
+  waited, ran = asyncio.run(scenario())
+  assert waited == []
+  assert ran == ["files"]
+
+
+def test_cancel_stops_the_running_step():
+  async def scenario():
+    started = asyncio.Event()
+
+    async def slow():
+      started.set()
+      await asyncio.sleep(10)
+
+    async def never():
+      raise AssertionError("ran after cancel")
+
+    reports = []
+    warm_up = create_warm_up([("repo-map", slow), ("other", never)], reports)
+    task = warm_up.start()
+    await started.wait()
+    warm_up.cancel()
+    await task
+    return reports
+
+  assert asyncio.run(scenario()) == [(None, 0, 2, True, True)]
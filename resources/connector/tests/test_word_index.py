@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("aider")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from connector import Connector, WordIndex  # noqa: E402
+
+
+def write(path, content, mtime_ns):
+  path.write_text(content)
+  os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_only_changed_files_are_lexed_again(tmp_path):
+  write(tmp_path / "a.py", "def alpha():\n  return beta\n", 1_000_000_000)
+  write(tmp_path / "b.py", "class Gamma:\n  pass\n", 1_000_000_000)
+  index = WordIndex()
+
+  words = index.get_words(str(tmp_path), ["a.py", "b.py"], "utf-8")
+  assert {"alpha", "Gamma", "a.py", "b.py"} <= words
+  assert index.lexed == 2
+
+  index.get_words(str(tmp_path), ["a.py", "b.py"], "utf-8")
+  assert index.lexed == 2
+
+  write(tmp_path / "b.py", "class Delta:\n  pass\n", 2_000_000_000)
+  words = index.get_words(str(tmp_path), ["a.py", "b.py"], "utf-8")
+  assert "Delta" in words and "Gamma" not in words
+  assert index.lexed == 3
+
+
+def test_invalidate_forces_lexing(tmp_path):
+  write(tmp_path / "a.py", "def alpha():\n  pass\n", 1_000_000_000)
+  index = WordIndex()
+  index.get_words(str(tmp_path), ["a.py"], "utf-8")
+
+  index.invalidate(str(tmp_path / "a.py"))
+  index.get_words(str(tmp_path), ["a.py"], "utf-8")
+  assert index.lexed == 2
+
+
+def test_read_only_files_are_included(tmp_path):
+  write(tmp_path / "ro.py", "def readonly_func():\n  pass\n", 1_000_000_000)
+  index = WordIndex()
+
+  words = index.get_words(str(tmp_path), [], "utf-8", {str(tmp_path / "ro.py")})
+  assert "readonly_func" in words
+
+
+def test_full_words_are_sent_again_on_request():
+  sent = []
+
+  async def send_action(message):
+    sent.append(message)
+
+  session = types.SimpleNamespace(sent_words=None, sent_words_version=0, send_action=send_action)
+
+  async def scenario():
+    await Connector.send_autocompletion_words(session, {"alpha", "beta"})
+    await Connector.send_autocompletion_words(session, {"alpha", "gamma"})
+    await Connector.resend_autocompletion_words(session)
+
+  asyncio.run(scenario())
+  assert sent[1]["delta"] == {"baseVersion": 1, "added": ["gamma"], "removed": ["beta"]}
+  # a new version, so deltas made against the words AiderDesk could not update do not apply
+  assert sent[2] == {"action": "update-autocompletion", "version": 3, "words": ["alpha", "gamma"]}
@@ -0,0 +1,247 @@
+import { ChildProcessWithoutNullStreams, spawn } from 'child_process';
+import { EventEmitter } from 'events';
+import { existsSync, statSync, unlinkSync } from 'fs';
+import net from 'net';
+import os from 'os';
+import path from 'path';
+import { PassThrough, Readable } from 'stream';
+
+import { v4 as uuidv4 } from 'uuid';
+
+import { AIDER_DESK_CONNECTOR_DIR, PYTHON_COMMAND } from '@/constants';
+import logger from '@/logger';
+
+const START_TIMEOUT = 60_000;
+const SPAWN_TIMEOUT = 10_000;
+
+// read by each forked connector itself, so they do not require a fork server restart
+const PER_TASK_ENV_VARIABLES = ['CONNECTOR_SERVER_URL', 'CONNECTOR_CONFIRM_BEFORE_EDIT'];
+// read by the connector module on import, a change requires a fresh fork server
+const IMPORT_TIME_ENV_VARIABLES = ['AIDER_DESK_INSECURE_TLS', 'AIDER_DESK_CA_BUNDLE_PATH', 'PYTHONUTF8'];
+
+/**
+ * The parts of an Aider connector process used by AiderManager, provided by spawned and forked connectors alike.
+ */
+export interface ConnectorProcess {
+  readonly pid?: number;
+  readonly stdout: Readable;
+  readonly stderr: Readable;
+  on(event: 'close', listener: (code: number | null) => void): this;
+  // stops a connector that shares its process with others, which must not be killed
+  stop?(): Promise<void>;
+}
+
+class ForkedConnectorProcess extends EventEmitter implements ConnectorProcess {
+  constructor(
+    readonly pid: number,
+    readonly stdout: Readable,
+    readonly stderr: Readable,
+    sockets: net.Socket[],
+  ) {
+    super();
+
+    // the connections close when the connector exits, its exit code is not known
+    let open = sockets.length;
+    sockets.forEach((socket) =>
+      socket.once('close', () => {
+        open--;
+        if (open === 0) {
+          this.emit('close', null);
+        }
+      }),
+    );
+  }
+}
+
+const connect = (socketPath: string, request: Record<string, unknown>): Promise<net.Socket> => {
+  return new Promise((resolve, reject) => {
+    const socket = net.createConnection(socketPath, () => {
+      socket.off('error', reject);
+      socket.write(`${JSON.stringify(request)}\n`);
+      resolve(socket);
+    });
+    socket.once('error', reject);
+  });
+};
+
+/**
+ * Reads the `{"pid": ...}` header line of a forked connector and returns the rest of the socket as its stdout.
+ */
+const readHeader = (socket: net.Socket): Promise<{ pid: number; stdout: Readable }> => {
+  return new Promise((resolve, reject) => {
+    let buffer = Buffer.alloc(0);
+
+    const cleanup = () => {
+      clearTimeout(timeout);
+      socket.off('data', onData);
+      socket.off('close', onClose);
+    };
+    const onClose = () => {
+      cleanup();
+      reject(new Error('Fork server closed the connection before the connector started'));
+    };
+    const onData = (data: Buffer) => {
+      buffer = Buffer.concat([buffer, data]);
+      const newline = buffer.indexOf('\n');
+      if (newline === -1) {
+        return;
+      }
+
+      cleanup();
+      socket.pause();
+      try {
+        const { pid } = JSON.parse(buffer.subarray(0, newline).toString('utf8'));
+        const stdout = new PassThrough();
+        if (newline + 1 < buffer.length) {
+          stdout.write(buffer.subarray(newline + 1));
+        }
+        socket.pipe(stdout);
+        resolve({ pid, stdout });
+      } catch (error) {
+        socket.destroy();
+        reject(error);
+      }
+    };
+    const timeout = setTimeout(() => {
+      cleanup();
+      socket.destroy();
+      reject(new Error('Timed out waiting for the forked connector'));
+    }, SPAWN_TIMEOUT);
+
+    socket.on('data', onData);
+    socket.once('close', onClose);
+  });
+};
+
+/**
+ * A warm `python -m connector --fork-server` process that has the connector's heavy imports and model metadata
+ * loaded and forks a connector per task, so opening a task does not pay for a fresh interpreter.
+ * A task whose environment differs from the server's in more than the per-task variables (FORK_PER_TASK_ENV in
+ * connector.py) gets a fresh interpreter from the fork server, as the warm imports may hold values of the old one.
+ * Not available on Windows, which has no fork; set AIDER_DESK_CONNECTOR_FORK_SERVER=false to disable it elsewhere.
+ */
+export class ConnectorForkServer {
+  private serverProcess: ChildProcessWithoutNullStreams | null = null;
+  private startPromise: Promise<string> | null = null;
+  private signature: string | null = null;
+  private readonly socketPath = path.join(os.tmpdir(), `aider-desk-connector-${process.pid}.sock`);
+
+  public isEnabled(): boolean {
+    return process.platform !== 'win32' && process.env.AIDER_DESK_CONNECTOR_FORK_SERVER !== 'false';
+  }
+
+  public async spawnConnector(args: string[], env: NodeJS.ProcessEnv, cwd: string, preloadModels: string[] = []): Promise<ConnectorProcess> {
+    const socketPath = await this.ensureStarted(env, preloadModels);
+
+    const id = uuidv4();
+    const stdoutSocket = await connect(socketPath, { action: 'spawn', id, args, env, cwd });
+    let stderrSocket: net.Socket;
+    try {
+      stderrSocket = await connect(socketPath, { action: 'attach', id });
+    } catch (error) {
+      stdoutSocket.destroy();
+      throw error;
+    }
+
+    try {
+      const { pid, stdout } = await readHeader(stdoutSocket);
+      return new ForkedConnectorProcess(pid, stdout, stderrSocket, [stdoutSocket, stderrSocket]);
+    } catch (error) {
+      stderrSocket.destroy();
+      throw error;
+    }
+  }
+
+  public stop(): void {
+    this.startPromise = null;
+    this.signature = null;
+    if (this.serverProcess) {
+      this.serverProcess.kill();
+      this.serverProcess = null;
+    }
+    if (existsSync(this.socketPath)) {
+      try {
+        unlinkSync(this.socketPath);
+      } catch (error) {
+        logger.warn('Failed to remove connector fork server socket', { error });
+      }
+    }
+  }
+
+  private getSignature(env: NodeJS.ProcessEnv): string {
+    const connectorPath = path.join(AIDER_DESK_CONNECTOR_DIR, 'connector.py');
+    const connectorMtime = existsSync(connectorPath) ? statSync(connectorPath).mtimeMs : 0;
+    const importTimeEnv = Object.entries(env)
+      .filter(([key]) => (key.startsWith('CONNECTOR_') && !PER_TASK_ENV_VARIABLES.includes(key)) || IMPORT_TIME_ENV_VARIABLES.includes(key))
+      .sort(([a], [b]) => a.localeCompare(b));
+    return JSON.stringify([connectorMtime, importTimeEnv]);
+  }
+
+  private ensureStarted(env: NodeJS.ProcessEnv, preloadModels: string[]): Promise<string> {
+    const signature = this.getSignature(env);
+    if (this.startPromise && this.signature === signature) {
+      return this.startPromise;
+    }
+
+    if (this.startPromise) {
+      logger.info('Connector or its environment changed, restarting connector fork server');
+      this.stop();
+    }
+
+    const startPromise = this.start(env, preloadModels);
+    this.signature = signature;
+    this.startPromise = startPromise;
+    startPromise.catch(() => {
+      if (this.startPromise === startPromise) {
+        this.stop();
+      }
+    });
+    return startPromise;
+  }
+
+  private start(env: NodeJS.ProcessEnv, preloadModels: string[]): Promise<string> {
+    return new Promise((resolve, reject) => {
+      const args = ['-m', 'connector', '--fork-server', this.socketPath, ...preloadModels.flatMap((model) => ['--preload-model', model])];
+      const startedAt = Date.now();
+      const serverProcess = spawn(PYTHON_COMMAND, args, {
+        cwd: os.homedir(),
+        detached: false,
+        env: {
+          ...env,
+          PYTHONPATH: AIDER_DESK_CONNECTOR_DIR,
+        },
+      });
+      this.serverProcess = serverProcess;
+
+      let output = '';
+      const timeout = setTimeout(() => {
+        serverProcess.kill();
+        reject(new Error('Timed out waiting for the connector fork server'));
+      }, START_TIMEOUT);
+
+      serverProcess.stdout.on('data', (data) => {
+        output += data.toString();
+        if (output.includes('"ready": true')) {
+          clearTimeout(timeout);
+          logger.info('Connector fork server ready', { pid: serverProcess.pid, startupMs: Date.now() - startedAt });
+          resolve(this.socketPath);
+        }
+      });
+      serverProcess.stderr.on('data', (data) => {
+        logger.debug('Connector fork server stderr:', { output: data.toString() });
+      });
+      serverProcess.on('close', (code) => {
+        clearTimeout(timeout);
+        logger.info('Connector fork server exited', { code });
+        if (this.serverProcess === serverProcess) {
+          this.serverProcess = null;
+          this.startPromise = null;
+          this.signature = null;
+        }
+        reject(new Error(`Connector fork server exited (code ${code ?? 'unknown'})`));
+      });
+    });
+  }
+}
+
+export const connectorForkServer = new ConnectorForkServer();
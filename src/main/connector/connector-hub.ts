@@ -0,0 +1,295 @@
+import { ChildProcessWithoutNullStreams, spawn } from 'child_process';
+import { EventEmitter } from 'events';
+import { existsSync, readFileSync, statSync } from 'fs';
+import os from 'os';
+import path from 'path';
+import { PassThrough } from 'stream';
+
+import { Socket } from 'socket.io';
+import { v4 as uuidv4 } from 'uuid';
+
+import { AIDER_DESK_CONNECTOR_DIR, PYTHON_COMMAND } from '@/constants';
+import logger from '@/logger';
+import { CloseSessionMessage, InitHubMessage, OpenSessionMessage, SessionClosedMessage, SessionOutputMessage } from '@/messages';
+import { ConnectorProcess } from '@/connector/connector-fork-server';
+
+const START_TIMEOUT = 60_000;
+const IDLE_TIMEOUT = 60_000;
+const CLOSE_TIMEOUT = 10_000;
+
+// sent with each session instead, they do not need a hub of their own
+const PER_TASK_ENV_VARIABLES = ['BASE_DIR', 'TASK_ID', 'TASK_DIR', 'CONNECTOR_CONFIRM_BEFORE_EDIT'];
+// arguments whose value is per task, every other argument has to match for tasks to share a hub
+const PER_TASK_ARGS = ['--chat-history-file'];
+// files aider loads into process-wide state (environment, model settings) when a session starts, from the home
+// and the task directory or given by the arguments
+const CONFIG_FILES = ['.env', '.aider.conf.yml', '.aider.model.settings.yml', '.aider.model.metadata.json'];
+const CONFIG_FILE_ARGS = ['--env-file', '--config', '-c', '--model-settings-file', '--model-metadata-file'];
+
+const readConfigFile = (file: string): string | null => {
+  try {
+    return readFileSync(file, 'utf8');
+  } catch {
+    return null;
+  }
+};
+
+class HubSession extends EventEmitter implements ConnectorProcess {
+  readonly pid = undefined;
+  readonly stdout = new PassThrough();
+  readonly stderr = new PassThrough();
+
+  constructor(
+    readonly taskId: string,
+    private readonly hub: HubProcess,
+  ) {
+    super();
+  }
+
+  public stop(): Promise<void> {
+    return this.hub.closeSession(this.taskId);
+  }
+
+  public end(code: number | null, error?: string) {
+    if (error) {
+      this.stderr.write(`${error}\n`);
+    }
+    this.stdout.end();
+    this.stderr.end();
+    this.emit('close', code);
+  }
+}
+
+class HubProcess {
+  readonly id = uuidv4();
+  readonly sessions = new Map<string, HubSession>();
+  readonly ready: Promise<void>;
+  socket: Socket | null = null;
+  private readonly process: ChildProcessWithoutNullStreams;
+  private resolveReady!: () => void;
+  private readonly closing = new Map<string, () => void>();
+  private idleTimeout: NodeJS.Timeout | null = null;
+
+  constructor(
+    cwd: string,
+    env: NodeJS.ProcessEnv,
+    private readonly onExit: (hub: HubProcess) => void,
+  ) {
+    let rejectReady!: (error: Error) => void;
+    this.ready = new Promise<void>((resolve, reject) => {
+      this.resolveReady = resolve;
+      rejectReady = reject;
+    });
+    const startedAt = Date.now();
+    const timeout = setTimeout(() => {
+      rejectReady(new Error('Timed out waiting for the connector hub'));
+      this.process.kill();
+    }, START_TIMEOUT);
+    void this.ready.then(
+      () => {
+        clearTimeout(timeout);
+        logger.info('Connector hub ready', { hubId: this.id, pid: this.process.pid, startupMs: Date.now() - startedAt });
+      },
+      () => clearTimeout(timeout),
+    );
+
+    // aider finds the repository and its config files from the working directory, all sessions of a hub share it
+    this.process = spawn(PYTHON_COMMAND, ['-m', 'connector', '--hub', this.id], {
+      cwd,
+      detached: false,
+      env: {
+        ...env,
+        PYTHONPATH: AIDER_DESK_CONNECTOR_DIR,
+      },
+    });
+    this.process.stdout.on('data', (data) => {
+      logger.debug('Connector hub output:', { hubId: this.id, output: data.toString() });
+    });
+    this.process.stderr.on('data', (data) => {
+      logger.debug('Connector hub stderr:', { hubId: this.id, output: data.toString() });
+    });
+    this.process.on('close', (code) => {
+      clearTimeout(timeout);
+      this.clearIdleTimeout();
+      logger.info('Connector hub exited', { hubId: this.id, code, sessions: this.sessions.size });
+      rejectReady(new Error(`Connector hub exited (code ${code ?? 'unknown'})`));
+      this.sessions.forEach((session) => session.end(code));
+      this.sessions.clear();
+      this.closing.forEach((resolve) => resolve());
+      this.closing.clear();
+      this.onExit(this);
+    });
+  }
+
+  public handleConnected(socket: Socket) {
+    // also after a reconnect, when the sessions introduce themselves again
+    this.socket = socket;
+    this.resolveReady();
+  }
+
+  public async openSession(taskId: string, baseDir: string, taskDir: string, args: string[], confirmBeforeEdit: boolean): Promise<HubSession> {
+    await this.ready;
+    if (!this.socket?.connected) {
+      throw new Error('Connector hub is not connected');
+    }
+
+    this.clearIdleTimeout();
+    const session = new HubSession(taskId, this);
+    this.sessions.get(taskId)?.end(null);
+    this.sessions.set(taskId, session);
+
+    const message: OpenSessionMessage = {
+      action: 'open-session',
+      taskId,
+      baseDir,
+      taskDir,
+      args,
+      confirmBeforeEdit,
+    };
+    this.socket.emit('message', message);
+    return session;
+  }
+
+  public closeSession(taskId: string): Promise<void> {
+    if (!this.sessions.has(taskId) || !this.socket?.connected) {
+      return Promise.resolve();
+    }
+
+    return new Promise((resolve) => {
+      const timeout = setTimeout(() => {
+        logger.warn('Timed out closing connector hub session', { hubId: this.id, taskId });
+        this.closing.delete(taskId);
+        resolve();
+      }, CLOSE_TIMEOUT);
+      this.closing.set(taskId, () => {
+        clearTimeout(timeout);
+        resolve();
+      });
+      const message: CloseSessionMessage = {
+        action: 'close-session',
+        taskId,
+      };
+      this.socket!.emit('message', message);
+    });
+  }
+
+  public handleSessionClosed(message: SessionClosedMessage) {
+    const session = this.sessions.get(message.taskId);
+    this.sessions.delete(message.taskId);
+    session?.end(message.error ? 1 : 0, message.error);
+    this.closing.get(message.taskId)?.();
+    this.closing.delete(message.taskId);
+
+    if (this.sessions.size === 0) {
+      // a hub nobody uses anymore is not worth its memory
+      this.clearIdleTimeout();
+      this.idleTimeout = setTimeout(() => this.stop(), IDLE_TIMEOUT);
+    }
+  }
+
+  public handleOutput(message: SessionOutputMessage) {
+    const session = this.sessions.get(message.taskId);
+    (message.stream === 'stderr' ? session?.stderr : session?.stdout)?.write(message.data);
+  }
+
+  public handleDisconnected() {
+    this.socket = null;
+  }
+
+  public stop() {
+    this.clearIdleTimeout();
+    this.process.kill();
+  }
+
+  private clearIdleTimeout() {
+    if (this.idleTimeout) {
+      clearTimeout(this.idleTimeout);
+      this.idleTimeout = null;
+    }
+  }
+}
+
+/**
+ * Multiplexed connector processes, each hosting the Aider connectors of many tasks as sessions over a single
+ * Socket.IO connection (`python -m connector --hub`), so open tasks share one copy of litellm, the model metadata
+ * and the repo map tags instead of a process each. A Python process has one environment and working directory, and
+ * aider applies the project's .env, the key and environment arguments and the model settings to the whole process,
+ * so tasks are only put into the same hub when their environment, task directory, arguments and config files all
+ * match. Enabled with AIDER_DESK_CONNECTOR_HUB=true.
+ */
+export class ConnectorHub {
+  private hubs = new Map<string, HubProcess>();
+
+  public isEnabled(): boolean {
+    return process.env.AIDER_DESK_CONNECTOR_HUB === 'true';
+  }
+
+  public async openSession(
+    taskId: string,
+    baseDir: string,
+    taskDir: string,
+    args: string[],
+    env: NodeJS.ProcessEnv,
+    confirmBeforeEdit: boolean,
+  ): Promise<ConnectorProcess> {
+    const signature = this.getSignature(taskDir, args, env);
+    let hub = this.hubs.get(signature);
+    if (!hub) {
+      hub = new HubProcess(taskDir, env, (exited) => {
+        if (this.hubs.get(signature) === exited) {
+          this.hubs.delete(signature);
+        }
+      });
+      this.hubs.set(signature, hub);
+    }
+
+    return hub.openSession(taskId, baseDir, taskDir, args, confirmBeforeEdit);
+  }
+
+  /**
+   * Returns true when the message came from a hub started here.
+   */
+  public handleHubConnected(socket: Socket, message: InitHubMessage): boolean {
+    const hub = this.findHub((hub) => hub.id === message.hubId);
+    hub?.handleConnected(socket);
+    return !!hub;
+  }
+
+  public handleSessionClosed(socket: Socket, message: SessionClosedMessage) {
+    this.findHub((hub) => hub.socket === socket)?.handleSessionClosed(message);
+  }
+
+  public handleOutput(socket: Socket, message: SessionOutputMessage) {
+    this.findHub((hub) => hub.socket === socket)?.handleOutput(message);
+  }
+
+  public handleDisconnected(socket: Socket) {
+    this.findHub((hub) => hub.socket === socket)?.handleDisconnected();
+  }
+
+  public stop(): void {
+    this.hubs.forEach((hub) => hub.stop());
+    this.hubs.clear();
+  }
+
+  private findHub(predicate: (hub: HubProcess) => boolean): HubProcess | undefined {
+    return Array.from(this.hubs.values()).find(predicate);
+  }
+
+  private getSignature(taskDir: string, args: string[], env: NodeJS.ProcessEnv): string {
+    const connectorPath = path.join(AIDER_DESK_CONNECTOR_DIR, 'connector.py');
+    const connectorMtime = existsSync(connectorPath) ? statSync(connectorPath).mtimeMs : 0;
+    const sharedArgs = args.filter((arg, index) => !PER_TASK_ARGS.includes(arg) && !PER_TASK_ARGS.includes(args[index - 1]));
+    const configFiles = [
+      ...CONFIG_FILES.flatMap((file) => [path.join(os.homedir(), file), path.join(taskDir, file)]),
+      ...args.filter((_arg, index) => CONFIG_FILE_ARGS.includes(args[index - 1])).map((file) => path.resolve(taskDir, file)),
+    ];
+    const configContents = configFiles.map((file) => [file, readConfigFile(file)]);
+    const sharedEnv = Object.entries(env)
+      .filter(([key]) => !PER_TASK_ENV_VARIABLES.includes(key))
+      .sort(([a], [b]) => a.localeCompare(b));
+    return JSON.stringify([connectorMtime, taskDir, sharedArgs, configContents, sharedEnv]);
+  }
+}
+
+export const connectorHub = new ConnectorHub();
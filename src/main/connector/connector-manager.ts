@@ -6,8 +6,10 @@ import { Server, Socket } from 'socket.io';
 import logger from '@/logger';
 import {
   isAddFileMessage,
+  isAddFilesMessage,
   isAskQuestionMessage,
   isDropFileMessage,
+  isInitHubMessage,
   isInitMessage,
   isPromptFinishedMessage,
   isResponseMessage,
@@ -19,7 +21,13 @@ import {
   isUseCommandOutputMessage,
   LogMessage,
   Message,
+  SessionOutputMessage,
   isAddMessageMessage,
+  isAddMessagesMessage,
+  isCommitDiffMessage,
+  isPromptMetricsMessage,
+  isSessionClosedMessage,
+  isWarmUpMessage,
   isSubscribeEventsMessage,
   isUnsubscribeEventsMessage,
   isReadonlySubscribeEventsMessage,
@@ -32,6 +40,7 @@ import { Store } from '@/store';
 import { createCorsOriginValidator } from '@/server/cors';
 import { READONLY_MODE } from '@/constants';
 import { CONNECTOR_TOKEN } from '@/connector/connector-auth';
+import { connectorHub } from '@/connector/connector-hub';
 
 export const READONLY_EVENT_TYPES = [
   'task-created',
@@ -123,18 +132,26 @@ export class ConnectorManager {
         }
         this.processLogMessage(socket, message);
       });
+      socket.on('output', (message: SessionOutputMessage) => {
+        if (this.isReadonlyMode && socket.data.clientRole !== 'connector') {
+          socket.disconnect(true);
+          return;
+        }
+        connectorHub.handleOutput(socket, message);
+      });
 
       socket.on('disconnect', (reason) => {
-        const connector = this.findConnectorBySocket(socket);
+        // a connector hub has the connectors of many tasks on one socket
+        const connectors = this.connectors.filter((c) => c.socket === socket);
         logger.info('Socket.IO client disconnected', {
-          baseDir: connector?.baseDir,
+          baseDir: connectors[0]?.baseDir,
+          connectors: connectors.length,
           reason,
           socketId: socket.id,
         });
         this.eventManager.unsubscribe(socket);
-        if (connector) {
-          this.removeConnector(socket);
-        }
+        connectors.forEach((connector) => this.removeConnector(connector));
+        connectorHub.handleDisconnected(socket);
       });
     });
 
@@ -176,7 +193,20 @@ export class ConnectorManager {
         message: JSON.stringify(message).slice(0, 1000),
       });
 
-      if (isInitMessage(message)) {
+      if (isInitHubMessage(message)) {
+        logger.info('Connector hub connected', { hubId: message.hubId, pid: message.pid });
+        if (!connectorHub.handleHubConnected(socket, message)) {
+          logger.warn('Unknown connector hub', { hubId: message.hubId });
+          socket.disconnect(true);
+        }
+      } else if (isSessionClosedMessage(message)) {
+        logger.info('Connector hub session closed', { taskId: message.taskId, error: message.error });
+        const connector = this.findConnectorBySocket(socket, message.taskId);
+        if (connector) {
+          this.removeConnector(connector);
+        }
+        connectorHub.handleSessionClosed(socket, message);
+      } else if (isInitMessage(message)) {
         logger.info('Initializing connector for base directory:', {
           baseDir: message.baseDir,
           taskId: message.taskId,
@@ -191,7 +221,7 @@ export class ConnectorManager {
             baseDir: message.baseDir,
             taskId: message.taskId,
           });
-          this.removeConnector(existingConnector.socket);
+          this.removeConnector(existingConnector);
         }
 
         const connector = new Connector(socket, message.baseDir, message.taskId, message.source, message.listenTo, message.inputHistoryFile);
@@ -206,13 +236,13 @@ export class ConnectorManager {
           taskId: message.taskId,
         });
       } else if (isResponseMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
         void this.projectManager.getProject(connector.baseDir).getTask(connector.taskId)?.processResponseMessage(message);
       } else if (isAddFileMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
@@ -235,8 +265,25 @@ export class ConnectorManager {
             readOnly: message.readOnly,
           });
         }
+      } else if (isAddFilesMessage(message)) {
+        const connector = this.findConnectorBySocket(socket, message.taskId);
+        if (!connector) {
+          return;
+        }
+        logger.info('Adding files in project', { baseDir: connector.baseDir, count: message.files.length });
+        const project = this.projectManager.getProject(connector.baseDir);
+        const files = message.files.map((file) => ({
+          path: file.path,
+          readOnly: file.readOnly,
+        }));
+        if (connector.taskId) {
+          project.getTask(connector.taskId)?.addFiles(...files);
+        } else {
+          project.forEachTask((task) => task.addFiles(...files));
+          project.getInternalTask()?.addFiles(...files);
+        }
       } else if (isDropFileMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
@@ -249,7 +296,7 @@ export class ConnectorManager {
           project.getInternalTask()?.dropFile(message.path);
         }
       } else if (isUpdateAutocompletionMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
@@ -259,14 +306,14 @@ export class ConnectorManager {
           const project = this.projectManager.getProject(connector.baseDir);
           const task = project.getTask(connector.taskId);
           if (task) {
-            void task.updateAutocompletionData(message.words);
+            void task.updateAutocompletionFromConnector(message);
           }
         } else {
           // Handle the case where taskId is not available, e.g., log an error or apply to all tasks
           logger.warn('Received update-autocompletion message from a connector without a taskId.');
         }
       } else if (isAskQuestionMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
@@ -277,6 +324,7 @@ export class ConnectorManager {
         const questionData: QuestionData = {
           baseDir: connector.baseDir,
           taskId: connector.taskId,
+          questionId: message.questionId,
           text: message.question,
           subject: message.subject,
           defaultAnswer: message.defaultAnswer,
@@ -284,7 +332,7 @@ export class ConnectorManager {
         };
         void this.projectManager.getProject(connector.baseDir).getTask(connector.taskId)?.askQuestion(questionData, false);
       } else if (isSetModelsMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
@@ -296,7 +344,7 @@ export class ConnectorManager {
 
         this.projectManager.getProject(connector.baseDir).getTask(connector.taskId)?.updateAiderModels(modelsData);
       } else if (isUpdateContextFilesMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
@@ -304,7 +352,7 @@ export class ConnectorManager {
       } else if (isUseCommandOutputMessage(message)) {
         logger.info('Use command output', { ...message });
 
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
@@ -315,19 +363,19 @@ export class ConnectorManager {
           project.getTask(connector.taskId)?.openCommandOutput(message.command);
         }
       } else if (isTokensInfoMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
 
-        const data: TokensInfoData = {
+        const data: Partial<TokensInfoData> = {
           baseDir: connector.baseDir,
           taskId: connector.taskId!,
           ...message.info,
         };
         this.projectManager.getProject(connector.baseDir).getTask(connector.taskId)?.updateTokensInfo(data);
       } else if (isPromptFinishedMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
@@ -336,15 +384,41 @@ export class ConnectorManager {
           promptId: message.promptId,
         });
         this.projectManager.getProject(connector.baseDir).getTask(connector.taskId)?.promptFinished(message.promptId);
+      } else if (isPromptMetricsMessage(message)) {
+        const connector = this.findConnectorBySocket(socket, message.taskId);
+        if (!connector) {
+          return;
+        }
+        logger.info('Prompt metrics', {
+          baseDir: connector.baseDir,
+          taskId: connector.taskId,
+          promptId: message.promptId,
+          ...message.metrics,
+        });
+      } else if (isWarmUpMessage(message)) {
+        const connector = this.findConnectorBySocket(socket, message.taskId);
+        if (!connector) {
+          return;
+        }
+        const data = {
+          baseDir: connector.baseDir,
+          taskId: connector.taskId,
+          ...message,
+        };
+        if (message.finished) {
+          logger.info(message.cancelled ? 'Connector warm-up cancelled' : 'Connector warm-up finished', data);
+        } else {
+          logger.debug('Connector warm-up step finished', data);
+        }
       } else if (isUpdateRepoMapMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
         logger.debug('Updating repo map', { baseDir: connector.baseDir });
-        this.projectManager.getProject(connector.baseDir).getTask(connector.taskId)?.updateRepoMapFromConnector(message.repoMap);
+        this.projectManager.getProject(connector.baseDir).getTask(connector.taskId)?.updateRepoMapFromConnector(message);
       } else if (isAddMessageMessage(message)) {
-        const connector = this.findConnectorBySocket(socket);
+        const connector = this.findConnectorBySocket(socket, message.taskId);
         if (!connector) {
           return;
         }
@@ -352,6 +426,18 @@ export class ConnectorManager {
           .getProject(connector.baseDir)
           .getTask(connector.taskId)
           ?.addRoleContextMessage(message.role, message.content, message.usageReport);
+      } else if (isAddMessagesMessage(message)) {
+        const connector = this.findConnectorBySocket(socket, message.taskId);
+        if (!connector) {
+          return;
+        }
+        void this.projectManager.getProject(connector.baseDir).getTask(connector.taskId)?.addRoleContextMessages(message.messages);
+      } else if (isCommitDiffMessage(message)) {
+        const connector = this.findConnectorBySocket(socket, message.taskId);
+        if (!connector) {
+          return;
+        }
+        this.projectManager.getProject(connector.baseDir).getTask(connector.taskId)?.processCommitDiffMessage(message);
       } else if (isSubscribeEventsMessage(message)) {
         logger.info('Subscribing to events', { eventTypes: message.eventTypes, baseDirs: message.baseDirs });
         this.eventManager.subscribe(socket, {
@@ -375,7 +461,7 @@ export class ConnectorManager {
       return;
     }
     logger.debug('Received log message from connector', { message });
-    const connector = this.findConnectorBySocket(socket);
+    const connector = this.findConnectorBySocket(socket, message.taskId);
     if (!connector) {
       return;
     }
@@ -384,20 +470,15 @@ export class ConnectorManager {
     project.getTask(connector.taskId)?.addLogMessage(message.level, message.message, message.finished, message.promptContext);
   };
 
-  private removeConnector = (socket: Socket) => {
-    const connector = this.findConnectorBySocket(socket);
-    if (!connector) {
-      return;
-    }
-
+  private removeConnector = (connector: Connector) => {
     const project = this.projectManager.getProject(connector.baseDir);
     project.removeConnector(connector);
 
     this.connectors = this.connectors.filter((c) => c !== connector);
   };
 
-  private findConnectorBySocket = (socket: Socket): Connector | undefined => {
-    const connector = this.connectors.find((c) => c.socket === socket);
+  private findConnectorBySocket = (socket: Socket, taskId?: string): Connector | undefined => {
+    const connector = this.connectors.find((c) => c.socket === socket && (!taskId || c.taskId === taskId));
     if (!connector) {
       logger.warn('Connector not found');
     }
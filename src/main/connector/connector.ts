@@ -15,7 +15,10 @@ import {
   Message,
   MessageAction,
   PromptMessage,
+  RequestAutocompletionMessage,
+  RequestCommitDiffMessage,
   RequestContextInfoMessage,
+  RequestRepoMapMessage,
   RunCommandMessage,
   SetModelsMessage,
   UpdateEnvVarsMessage,
@@ -41,7 +44,8 @@ export class Connector {
       baseDir: this.baseDir,
       messageType: message.action,
     });
-    this.socket.emit('message', message);
+    // a connector process hosting many tasks routes messages by task id
+    this.socket.emit('message', this.taskId ? { ...message, taskId: this.taskId } : message);
   };
 
   public sendPromptMessage(
@@ -66,9 +70,10 @@ export class Connector {
     this.sendMessage(message);
   }
 
-  public sendAnswerQuestionMessage = (answer: string) => {
+  public sendAnswerQuestionMessage = (answer: string, questionId?: string) => {
     const message: AnswerQuestionMessage = {
       action: 'answer-question',
+      questionId,
       answer,
     };
     this.sendMessage(message);
@@ -166,6 +171,30 @@ export class Connector {
     this.sendMessage(message);
   }
 
+  public sendRequestCommitDiffMessage(requestId: string, commitHash: string, path?: string) {
+    const message: RequestCommitDiffMessage = {
+      action: 'request-commit-diff',
+      requestId,
+      commitHash,
+      path,
+    };
+    this.sendMessage(message);
+  }
+
+  public sendRequestRepoMapMessage() {
+    const message: RequestRepoMapMessage = {
+      action: 'request-repo-map',
+    };
+    this.sendMessage(message);
+  }
+
+  public sendRequestAutocompletionMessage() {
+    const message: RequestAutocompletionMessage = {
+      action: 'request-autocompletion',
+    };
+    this.sendMessage(message);
+  }
+
   public sendUpdateModelsInfoMessage(modelsInfo: Record<string, ModelInfo>) {
     const message: UpdateModelsInfoMessage = {
       action: 'update-models-info',
@@ -1,2 +1,4 @@
 export * from './connector';
 export * from './connector-manager';
+export * from './connector-fork-server';
+export * from './connector-hub';
@@ -6,6 +6,7 @@ import {
   AutonomyMode,
   CloudflareTunnelStatus,
   CommandsData,
+  CommitDiff,
   CreateTaskParams,
   EditFormat,
   EnvironmentVariable,
@@ -347,6 +348,14 @@ export class EventsHandler {
     return await task.getUpdatedFiles();
   }
 
+  async requestCommitDiff(baseDir: string, taskId: string, commitHash: string, path?: string): Promise<CommitDiff> {
+    const task = this.projectManager.getProject(baseDir).getTask(taskId);
+    if (!task) {
+      throw new Error(`Task ${taskId} not found`);
+    }
+    return await task.requestCommitDiff(commitHash, path);
+  }
+
   async addFile(baseDir: string, taskId: string, filePath: string, readOnly = false): Promise<void> {
     void this.projectManager.getProject(baseDir).getTask(taskId)?.addFiles({ path: filePath, readOnly });
   }
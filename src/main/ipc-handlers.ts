@@ -169,6 +169,10 @@ export const setupIpcHandlers = (eventsHandler: EventsHandler, serverController:
     return await eventsHandler.getUpdatedFiles(baseDir, taskId);
   });
 
+  ipcMain.handle('request-commit-diff', async (_, baseDir: string, taskId: string, commitHash: string, path?: string) => {
+    return await eventsHandler.requestCommitDiff(baseDir, taskId, commitHash, path);
+  });
+
   ipcMain.handle('refresh-context-files', async (_, baseDir: string, taskId: string) => {
     await eventsHandler.refreshContextFiles(baseDir, taskId);
   });
@@ -4,7 +4,7 @@ import type { WindowManager } from '@/window-manager';
 
 import { AgentProfileManager, McpConfigManager, McpManager } from '@/agent';
 import { CloudflareTunnelManager, ServerController } from '@/server';
-import { ConnectorManager } from '@/connector';
+import { ConnectorManager, connectorForkServer, connectorHub } from '@/connector';
 import { ProjectManager } from '@/project';
 import { EventManager } from '@/events';
 import { ModelManager } from '@/models';
@@ -167,6 +167,8 @@ export const initManagers = async (store: Store, windowManager?: WindowManager):
 
     try {
       cloudflareTunnelManager.stop();
+      connectorForkServer.stop();
+      connectorHub.stop();
       terminalManager.close();
       versionsManager.destroy();
       dataManager.close();
@@ -1,5 +1,7 @@
 import {
   AiderRunOptions,
+  CommitDiff,
+  CommitDiffFile,
   ContextFile,
   ContextFileSourceType,
   EditFormat,
@@ -16,10 +18,17 @@ import {
 
 export type MessageAction =
   | 'init'
+  | 'init-hub'
+  | 'open-session'
+  | 'close-session'
+  | 'session-closed'
   | 'prompt'
   | 'prompt-finished'
+  | 'prompt-metrics'
+  | 'warm-up'
   | 'response'
   | 'add-file'
+  | 'add-files'
   | 'drop-file'
   | 'update-autocompletion'
   | 'ask-question'
@@ -30,12 +39,17 @@ export type MessageAction =
   | 'run-command'
   | 'tokens-info'
   | 'add-message'
+  | 'add-messages'
   | 'interrupt-response'
   | 'apply-edits'
   | 'compact-conversation'
   | 'update-repo-map'
   | 'update-env-vars'
   | 'request-context-info'
+  | 'request-commit-diff'
+  | 'commit-diff'
+  | 'request-repo-map'
+  | 'request-autocompletion'
   | 'subscribe-events'
   | 'unsubscribe-events'
   | 'readonly-subscribe-events'
@@ -44,6 +58,8 @@ export type MessageAction =
 
 export interface Message {
   action: MessageAction;
+  // set on messages to and from a session of a multiplexed connector process
+  taskId?: string;
 }
 
 export interface LogMessage {
@@ -51,6 +67,7 @@ export interface LogMessage {
   level: LogLevel;
   finished?: boolean;
   promptContext?: PromptContext;
+  taskId?: string;
 }
 
 export interface InitMessage {
@@ -67,6 +84,47 @@ export const isInitMessage = (message: Message): message is InitMessage => {
   return typeof message === 'object' && message !== null && 'action' in message && message.action === 'init';
 };
 
+export interface InitHubMessage extends Message {
+  action: 'init-hub';
+  hubId: string;
+  pid: number;
+  listenTo?: MessageAction[];
+}
+
+export const isInitHubMessage = (message: Message): message is InitHubMessage => {
+  return typeof message === 'object' && message !== null && 'action' in message && message.action === 'init-hub';
+};
+
+export interface OpenSessionMessage extends Message {
+  action: 'open-session';
+  taskId: string;
+  baseDir: string;
+  taskDir: string;
+  args: string[];
+  confirmBeforeEdit: boolean;
+}
+
+export interface CloseSessionMessage extends Message {
+  action: 'close-session';
+  taskId: string;
+}
+
+export interface SessionClosedMessage extends Message {
+  action: 'session-closed';
+  taskId: string;
+  error?: string;
+}
+
+export const isSessionClosedMessage = (message: Message): message is SessionClosedMessage => {
+  return typeof message === 'object' && message !== null && 'action' in message && message.action === 'session-closed';
+};
+
+export interface SessionOutputMessage {
+  taskId: string;
+  stream: 'stdout' | 'stderr';
+  data: string;
+}
+
 export interface PromptMessage extends Message {
   action: 'prompt';
   prompt: string;
@@ -89,7 +147,9 @@ export interface ResponseMessage extends Message {
   editedFiles?: string[];
   commitHash?: string;
   commitMessage?: string;
+  // full diff, only included for small commits; larger ones are fetched with request-commit-diff
   diff?: string;
+  diffFiles?: CommitDiffFile[];
   sequenceNumber?: number;
   promptContext?: PromptContext;
 }
@@ -110,6 +170,15 @@ export const isAddFileMessage = (message: Message): message is AddFileMessage =>
   return typeof message === 'object' && message !== null && 'action' in message && message.action === 'add-file';
 };
 
+export interface AddFilesMessage extends Message {
+  action: 'add-files';
+  files: { path: string; readOnly?: boolean }[];
+}
+
+export const isAddFilesMessage = (message: Message): message is AddFilesMessage => {
+  return typeof message === 'object' && message !== null && 'action' in message && message.action === 'add-files';
+};
+
 export interface DropFileMessage extends Message {
   action: 'drop-file';
   path: string;
@@ -128,9 +197,17 @@ export interface RunCommandMessage extends Message {
   files?: ContextFile[];
 }
 
+export interface AutocompletionWordsDelta {
+  baseVersion: number;
+  added: string[];
+  removed: string[];
+}
+
 export interface UpdateAutocompletionMessage extends Message {
   action: 'update-autocompletion';
-  words: string[];
+  version?: number;
+  words?: string[];
+  delta?: AutocompletionWordsDelta;
 }
 
 export const isUpdateAutocompletionMessage = (message: Message): message is UpdateAutocompletionMessage => {
@@ -139,6 +216,7 @@ export const isUpdateAutocompletionMessage = (message: Message): message is Upda
 
 export interface AskQuestionMessage extends Message {
   action: 'ask-question';
+  questionId?: string;
   question: string;
   subject?: string;
   defaultAnswer: string;
@@ -151,6 +229,7 @@ export const isAskQuestionMessage = (message: Message): message is AskQuestionMe
 
 export interface AnswerQuestionMessage extends Message {
   action: 'answer-question';
+  questionId?: string;
   answer: string;
 }
 
@@ -190,11 +269,12 @@ export const isUseCommandOutputMessage = (message: Message): message is UseComma
 
 export interface TokensInfoMessage extends Message {
   action: 'tokens-info';
+  // stages of the context info are sent as soon as each is ready, so any part may be missing
   info: {
-    files: Record<string, TokensCost>;
-    systemMessages: TokensCost;
-    chatHistory: TokensCost;
-    repoMap: TokensCost;
+    files?: Record<string, TokensCost>;
+    systemMessages?: TokensCost;
+    chatHistory?: TokensCost;
+    repoMap?: TokensCost;
   };
 }
 
@@ -214,6 +294,15 @@ export const isAddMessageMessage = (message: Message): message is AddMessageMess
   return message.action === 'add-message';
 };
 
+export interface AddMessagesMessage extends Message {
+  action: 'add-messages';
+  messages: { role: MessageRole; content: string }[];
+}
+
+export const isAddMessagesMessage = (message: Message): message is AddMessagesMessage => {
+  return message.action === 'add-messages';
+};
+
 export interface InterruptResponseMessage extends Message {
   action: 'interrupt-response';
 }
@@ -227,6 +316,46 @@ export const isPromptFinishedMessage = (message: Message): message is PromptFini
   return message.action === 'prompt-finished';
 };
 
+export interface PromptMetrics {
+  totalMs: number;
+  queueWaitMs: number;
+  cloneMs: number;
+  streamMs: number;
+  lintMs: number;
+  commitMessageMs: number;
+  diffMs: number;
+  outboundWaitMs: number;
+  timeToFirstTokenMs: number | null;
+  streamedChunks: number;
+  tokensPerSecond: number | null;
+  reflections: number;
+}
+
+export interface PromptMetricsMessage extends Message {
+  action: 'prompt-metrics';
+  promptId: string;
+  metrics: PromptMetrics;
+}
+
+export const isPromptMetricsMessage = (message: Message): message is PromptMetricsMessage => {
+  return message.action === 'prompt-metrics';
+};
+
+export interface WarmUpMessage extends Message {
+  action: 'warm-up';
+  // null when cancelled
+  step: string | null;
+  done: number;
+  total: number;
+  finished: boolean;
+  cancelled: boolean;
+  elapsedMs: number;
+}
+
+export const isWarmUpMessage = (message: Message): message is WarmUpMessage => {
+  return message.action === 'warm-up';
+};
+
 export interface ApplyEditsMessage extends Message {
   action: 'apply-edits';
   edits: FileEdit[];
@@ -237,9 +366,18 @@ export interface CompactConversationMessage extends Message {
   customInstructions?: string;
 }
 
+export interface RepoMapDelta {
+  baseHash: string;
+  hash: string;
+  // [start, end, lines]: replaces lines start..end (exclusive) of the base map with lines
+  ops: [number, number, string[]][];
+}
+
 export interface UpdateRepoMapMessage extends Message {
   action: 'update-repo-map';
-  repoMap: string;
+  hash?: string;
+  repoMap?: string;
+  delta?: RepoMapDelta;
 }
 
 export const isUpdateRepoMapMessage = (message: Message): message is UpdateRepoMapMessage => {
@@ -274,6 +412,39 @@ export const isRequestContextInfoMessage = (message: Message): message is Reques
   return message.action === 'request-context-info';
 };
 
+// asks for the full repo map, after a delta could not be applied
+export interface RequestRepoMapMessage extends Message {
+  action: 'request-repo-map';
+}
+
+// asks for the full autocompletion words, after a delta could not be applied
+export interface RequestAutocompletionMessage extends Message {
+  action: 'request-autocompletion';
+}
+
+export interface RequestCommitDiffMessage extends Message {
+  action: 'request-commit-diff';
+  requestId: string;
+  commitHash: string;
+  path?: string;
+}
+
+export interface CommitDiffMessage extends Message {
+  action: 'commit-diff';
+  requestId: string;
+  commitHash: string;
+  path?: string | null;
+  index: number;
+  content: string;
+  finished: boolean;
+  truncated?: boolean;
+  error?: string;
+}
+
+export const isCommitDiffMessage = (message: Message): message is CommitDiffMessage => {
+  return message.action === 'commit-diff';
+};
+
 export interface SubscribeEventsMessage extends Message {
   action: 'subscribe-events';
   eventTypes?: string[];
@@ -35,6 +35,13 @@ const GetUpdatedFilesSchema = z.object({
   taskId: z.string().min(1, 'Task ID is required'),
 });
 
+const RequestCommitDiffSchema = z.object({
+  projectDir: z.string().min(1, 'Project directory is required'),
+  taskId: z.string().min(1, 'Task ID is required'),
+  commitHash: z.string().min(1, 'Commit hash is required'),
+  path: z.string().optional(),
+});
+
 const RefreshContextFilesSchema = z.object({
   projectDir: z.string().min(1, 'Project directory is required'),
   taskId: z.string().min(1, 'Task ID is required'),
@@ -144,6 +151,20 @@ export class ContextApi extends BaseApi {
       }),
     );
 
+    router.post(
+      '/request-commit-diff',
+      this.handleRequest(async (req, res) => {
+        const parsed = this.validateRequest(RequestCommitDiffSchema, req.body, res);
+        if (!parsed) {
+          return;
+        }
+
+        const { projectDir, taskId, commitHash, path } = parsed;
+        const commitDiff = await this.eventsHandler.requestCommitDiff(projectDir, taskId, commitHash, path);
+        res.status(200).json(commitDiff);
+      }),
+    );
+
     router.post(
       '/refresh-context-files',
       this.handleRequest(async (req, res) => {
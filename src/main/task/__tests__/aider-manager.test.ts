@@ -4,7 +4,7 @@ import { AiderManager } from '../aider-manager';
 
 type FakeAiderProcess = { pid?: number };
 
-const createManager = () => {
+const createManager = (connectors: unknown[] = []) => {
   const task = {
     getProjectDir: () => '/tmp/aider-desk-test-project',
     getTaskDir: () => '/tmp/aider-desk-test-project/task',
@@ -16,7 +16,7 @@ const createManager = () => {
   };
 
   return {
-    manager: new AiderManager(task as never, {} as never, {} as never, eventManager as never, () => [], {} as never),
+    manager: new AiderManager(task as never, {} as never, {} as never, eventManager as never, () => connectors as never, {} as never),
     eventManager,
   };
 };
@@ -46,4 +46,86 @@ describe('AiderManager process lifecycle', () => {
       'task-id',
     );
   });
+
+  it('stops a session of a shared connector process instead of killing the process', async () => {
+    const { manager } = createManager();
+    const stop = vi.fn().mockResolvedValue(undefined);
+    const internals = manager as unknown as {
+      aiderProcess: (FakeAiderProcess & { stop: () => Promise<void> }) | null;
+    };
+
+    internals.aiderProcess = { stop };
+
+    await manager.kill();
+
+    expect(stop).toHaveBeenCalledOnce();
+    expect(manager.isStarted()).toBe(false);
+  });
+});
+
+describe('AiderManager connector hub sessions', () => {
+  const createHubSession = () => {
+    const { manager } = createManager();
+    const sendUpdateEnvVarsMessage = vi.fn();
+    const internals = manager as unknown as {
+      aiderProcess: FakeAiderProcess | null;
+      hubSessionEnvironmentVariables: Record<string, unknown> | null;
+      getConnectors: () => unknown[];
+    };
+    internals.aiderProcess = { pid: undefined };
+    internals.hubSessionEnvironmentVariables = { OPENAI_API_KEY: 'key' };
+    internals.getConnectors = () => [{ listenTo: ['update-env-vars'], sendUpdateEnvVarsMessage }];
+    const start = vi.spyOn(manager, 'start').mockResolvedValue(undefined);
+
+    return { manager, start, sendUpdateEnvVarsMessage };
+  };
+
+  it('restarts a hub session instead of changing the shared environment', () => {
+    const { manager, start, sendUpdateEnvVarsMessage } = createHubSession();
+
+    manager.sendUpdateEnvVars({ OPENAI_API_KEY: 'other-key' });
+
+    expect(start).toHaveBeenCalledWith(true);
+    expect(sendUpdateEnvVarsMessage).not.toHaveBeenCalled();
+  });
+
+  it('keeps a hub session when the environment is unchanged', () => {
+    const { manager, start, sendUpdateEnvVarsMessage } = createHubSession();
+
+    manager.sendUpdateEnvVars({ OPENAI_API_KEY: 'key' });
+
+    expect(start).not.toHaveBeenCalled();
+    expect(sendUpdateEnvVarsMessage).not.toHaveBeenCalled();
+  });
+});
+
+describe('AiderManager repo map deltas', () => {
+  it('applies line deltas on top of the full repo map', () => {
+    const { manager } = createManager();
+    manager.setRepoMap('a.py:\n│def a()\nb.py:\n│def b()', 'hash-1');
+
+    const applied = manager.applyRepoMapDelta({
+      baseHash: 'hash-1',
+      hash: 'hash-2',
+      ops: [
+        [1, 2, ['│def a2()', '│def a3()']],
+        [3, 4, []],
+      ],
+    });
+
+    expect(applied).toBe(true);
+    expect(manager.getRepoMap()).toBe('a.py:\n│def a2()\n│def a3()\nb.py:');
+  });
+
+  it('requests the full repo map for a delta made against another repo map', () => {
+    const connector = { listenTo: ['request-repo-map'], sendRequestRepoMapMessage: vi.fn() };
+    const { manager } = createManager([connector]);
+    manager.setRepoMap('a.py:', 'hash-1');
+
+    const applied = manager.applyRepoMapDelta({ baseHash: 'other', hash: 'hash-2', ops: [[0, 1, ['b.py:']]] });
+
+    expect(applied).toBe(false);
+    expect(manager.getRepoMap()).toBe('a.py:');
+    expect(connector.sendRequestRepoMapMessage).toHaveBeenCalledTimes(1);
+  });
 });
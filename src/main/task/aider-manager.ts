@@ -1,4 +1,4 @@
-import { ChildProcessWithoutNullStreams, spawn } from 'child_process';
+import { spawn } from 'child_process';
 import { createHash } from 'crypto';
 import { unlinkSync } from 'fs';
 import fs from 'fs/promises';
@@ -10,7 +10,7 @@ import treeKill from 'tree-kill';
 import { DEFAULT_AIDER_MAIN_MODEL } from '@common/agent';
 
 import { AIDER_DESK_CONNECTOR_DIR, AIDER_DESK_PROJECT_RULES_DIR, AIDER_DESK_TASKS_DIR, PID_FILES_DIR, PYTHON_COMMAND, SERVER_PORT } from '@/constants';
-import { Connector } from '@/connector';
+import { Connector, ConnectorProcess, connectorForkServer, connectorHub } from '@/connector';
 import { CONNECTOR_TOKEN } from '@/connector/connector-auth';
 import logger from '@/logger';
 import { Store } from '@/store';
@@ -20,9 +20,12 @@ import { getEnvironmentVariablesForAider } from '@/utils';
 import { Task } from '@/task/task';
 import { PythonDependenciesInstaller } from '@/python-dependencies-installer';
 import { getNetworkEnvVars } from '@/network-manager';
+import { RepoMapDelta } from '@/messages';
 
 export class AiderManager {
-  private aiderProcess: ChildProcessWithoutNullStreams | null = null;
+  private aiderProcess: ConnectorProcess | null = null;
+  // environment variables a connector hub session was opened with, the hub's process environment is shared
+  private hubSessionEnvironmentVariables: Record<string, unknown> | null = null;
   private aiderStarting: boolean = false;
   private aiderStartPromise: Promise<void> | null = null;
   private aiderStartResolve: (() => void) | null = null;
@@ -32,6 +35,7 @@ export class AiderManager {
   private currentCommand: string | null = null;
   private commandOutputs: Map<string, string> = new Map();
   private repoMap: string = '';
+  private repoMapHash: string | null = null;
 
   constructor(
     private readonly task: Task,
@@ -177,12 +181,20 @@ export class AiderManager {
       CONNECTOR_CONFIRM_BEFORE_EDIT: settings.aider.confirmBeforeEdit ? '1' : '0',
     };
 
-    // Spawn without shell to have direct process control
-    this.aiderProcess = spawn(PYTHON_COMMAND, args, {
-      cwd: this.task.getTaskDir(),
-      detached: false,
-      env,
-    });
+    // Open a session in a shared connector process or fork from the warm fork server when possible,
+    // otherwise spawn without shell to have direct process control
+    const hubSession = await this.openHubSession(args.slice(2), env, settings.aider.confirmBeforeEdit);
+    this.hubSessionEnvironmentVariables = hubSession ? { ...environmentVariables, ...networkEnvVars } : null;
+    const connectorProcess =
+      hubSession ??
+      (await this.forkConnector(args.slice(2), env, [mainModelName, ...(weakModelName ? [weakModelName] : [])]));
+    this.aiderProcess =
+      connectorProcess ??
+      spawn(PYTHON_COMMAND, args, {
+        cwd: this.task.getTaskDir(),
+        detached: false,
+        env,
+      });
 
     logger.info('Starting Aider...', {
       baseDir: this.task.getTaskDir(),
@@ -225,6 +237,40 @@ export class AiderManager {
     void this.writeAiderProcessPidFile();
   }
 
+  private async openHubSession(args: string[], env: NodeJS.ProcessEnv, confirmBeforeEdit: boolean): Promise<ConnectorProcess | null> {
+    if (!connectorHub.isEnabled()) {
+      return null;
+    }
+
+    try {
+      return await connectorHub.openSession(this.task.task.id, this.task.getProjectDir(), this.task.getTaskDir(), args, env, confirmBeforeEdit);
+    } catch (error) {
+      logger.warn('Failed to open Aider connector hub session, starting a connector process instead', {
+        baseDir: this.task.getTaskDir(),
+        taskId: this.task.task.id,
+        error: error instanceof Error ? error.message : String(error),
+      });
+      return null;
+    }
+  }
+
+  private async forkConnector(args: string[], env: NodeJS.ProcessEnv, preloadModels: string[]): Promise<ConnectorProcess | null> {
+    if (!connectorForkServer.isEnabled()) {
+      return null;
+    }
+
+    try {
+      return await connectorForkServer.spawnConnector(args, env, this.task.getTaskDir(), preloadModels);
+    } catch (error) {
+      logger.warn('Failed to fork Aider connector, spawning a new process instead', {
+        baseDir: this.task.getTaskDir(),
+        taskId: this.task.task.id,
+        error: error instanceof Error ? error.message : String(error),
+      });
+      return null;
+    }
+  }
+
   public async kill(): Promise<void> {
     if (this.aiderProcess) {
       logger.info('Killing Aider...', {
@@ -232,21 +278,12 @@ export class AiderManager {
         taskId: this.task.task.id,
       });
       try {
-        await new Promise<void>((resolve, reject) => {
-          treeKill(this.aiderProcess!.pid!, 'SIGKILL', (err) => {
-            if (err) {
-              logger.error('Error killing Aider process:', {
-                baseDir: this.task.getTaskDir(),
-                taskId: this.task.task.id,
-                error: err,
-              });
-              reject(err);
-            } else {
-              this.removeAiderProcessPidFile();
-              resolve();
-            }
-          });
-        });
+        if (this.aiderProcess.stop) {
+          // a session of a shared connector process, only the session is closed
+          await this.aiderProcess.stop();
+        } else {
+          await this.killAiderProcess(this.aiderProcess);
+        }
 
         this.currentCommand = null;
       } catch (error) {
@@ -262,11 +299,29 @@ export class AiderManager {
     }
   }
 
+  private killAiderProcess(aiderProcess: ConnectorProcess): Promise<void> {
+    return new Promise<void>((resolve, reject) => {
+      treeKill(aiderProcess.pid!, 'SIGKILL', (err) => {
+        if (err) {
+          logger.error('Error killing Aider process:', {
+            baseDir: this.task.getTaskDir(),
+            taskId: this.task.task.id,
+            error: err,
+          });
+          reject(err);
+        } else {
+          this.removeAiderProcessPidFile();
+          resolve();
+        }
+      });
+    });
+  }
+
   public isStarted(): boolean {
     return !!this.aiderProcess;
   }
 
-  private handleAiderProcessExit(process: ChildProcessWithoutNullStreams, code: number | null): void {
+  private handleAiderProcessExit(process: ConnectorProcess, code: number | null): void {
     logger.info('Aider process exited:', {
       baseDir: this.task.getTaskDir(),
       taskId: this.task.task.id,
@@ -504,8 +559,34 @@ export class AiderManager {
     return this.repoMap;
   }
 
-  public setRepoMap(repoMap: string): void {
+  public setRepoMap(repoMap: string, hash?: string): void {
     this.repoMap = repoMap;
+    this.repoMapHash = hash ?? null;
+  }
+
+  public applyRepoMapDelta(delta: RepoMapDelta): boolean {
+    if (delta.baseHash !== this.repoMapHash) {
+      logger.warn('Repo map delta does not match the current repo map, requesting the full repo map', {
+        baseDir: this.task.getProjectDir(),
+        baseHash: delta.baseHash,
+        currentHash: this.repoMapHash,
+      });
+      this.getConnectors()
+        .filter((connector) => connector.listenTo.includes('request-repo-map'))
+        .forEach((connector) => connector.sendRequestRepoMapMessage());
+      return false;
+    }
+
+    const lines = this.repoMap.split('\n');
+    // ops are in ascending order, applying them from the end keeps the earlier indexes valid
+    for (let i = delta.ops.length - 1; i >= 0; i--) {
+      const [start, end, newLines] = delta.ops[i];
+      lines.splice(start, end - start, ...newLines);
+    }
+
+    this.repoMap = lines.join('\n');
+    this.repoMapHash = delta.hash;
+    return true;
   }
 
   public openCommandOutput(command: string): void {
@@ -539,6 +620,21 @@ export class AiderManager {
   }
 
   public sendUpdateEnvVars(environmentVariables: Record<string, unknown>): void {
+    const hubSessionEnvironmentVariables = this.hubSessionEnvironmentVariables;
+    if (this.aiderProcess && hubSessionEnvironmentVariables) {
+      // the environment of a connector hub is shared by its sessions, a changed one needs a hub of its own
+      const changed = Object.entries(environmentVariables).some(
+        ([key, value]) => value != null && String(value) !== String(hubSessionEnvironmentVariables[key] ?? ''),
+      );
+      if (changed) {
+        logger.info('Environment variables or LLM providers changed, restarting the connector hub session.', {
+          taskId: this.task.task.id,
+        });
+        void this.start(true);
+      }
+      return;
+    }
+
     logger.info('Environment variables or LLM providers changed, updating connectors.');
     const connectors = this.getConnectors();
     connectors
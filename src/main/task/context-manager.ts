@@ -953,6 +953,7 @@ export class ContextManager {
                 commitHash: response.commitHash,
                 commitMessage: response.commitMessage,
                 diff: response.diff,
+                diffFiles: response.diffFiles,
                 usageReport: response.usageReport,
                 promptContext: message.promptContext,
                 timestamp: message.timestamp,
@@ -1079,6 +1080,7 @@ export class ContextManager {
               commitHash: message.commitHash,
               commitMessage: message.commitMessage,
               diff: message.diff,
+              diffFiles: message.diffFiles,
               usageReport: message.usageReport,
               promptContext: message.promptContext,
               timestamp: message.timestamp,
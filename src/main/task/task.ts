@@ -10,6 +10,7 @@ import {
   AiderRunOptions,
   AutonomyMode,
   ChangeRequestItem,
+  CommitDiff,
   ConnectorMessage,
   ContextAssistantMessage,
   ContextFile,
@@ -100,7 +101,7 @@ import { findEnabledSubagent, runSubagentTask } from '@/agent/subagent';
 import { Connector } from '@/connector';
 import { DataManager } from '@/data-manager';
 import logger from '@/logger';
-import { MessageAction, ResponseMessage } from '@/messages';
+import { CommitDiffMessage, MessageAction, ResponseMessage, UpdateAutocompletionMessage, UpdateRepoMapMessage } from '@/messages';
 import { Store } from '@/store';
 import { ModelManager } from '@/models';
 import { CustomCommandManager, ShellCommandError } from '@/custom-commands';
@@ -160,6 +161,9 @@ export class Task {
   private currentPromptResponses: ResponseCompletedData[] = [];
   private runPromptResolves: ((value: ResponseCompletedData[]) => void)[] = [];
   private autocompletionAllFiles: string[] | null = null;
+  private connectorWords: Set<string> = new Set();
+  private connectorWordsVersion: number | null = null;
+  private commitDiffRequests: Map<string, { chunks: string[]; resolve: (diff: CommitDiff) => void; reject: (error: Error) => void }> = new Map();
   private agentRunResolves: (() => void)[] = [];
   private git: SimpleGit | null = null;
   private responseChunkMap: Map<string, { contentBuffer: string; reasoningBuffer: string; interval: NodeJS.Timeout }> = new Map();
@@ -678,6 +682,11 @@ export class Task {
 
   public removeConnector(connector: Connector) {
     this.connectors = this.connectors.filter((c) => c !== connector);
+
+    if (this.commitDiffRequests.size > 0 && this.findMessageConnectors('request-commit-diff').length === 0) {
+      this.commitDiffRequests.forEach((request) => request.reject(new Error('Connector disconnected')));
+      this.commitDiffRequests.clear();
+    }
   }
 
   public getProjectDir() {
@@ -1070,6 +1079,7 @@ export class Task {
           commitHash: response.commitHash,
           commitMessage: response.commitMessage,
           diff: response.diff,
+          diffFiles: response.diffFiles,
           promptContext,
         };
         this.contextManager.addContextMessage(assistantMessage);
@@ -1571,6 +1581,7 @@ export class Task {
         commitHash: message.commitHash,
         commitMessage: message.commitMessage,
         diff: message.diff,
+        diffFiles: message.diffFiles,
         usageReport,
         sequenceNumber: message.sequenceNumber,
         promptContext: message.promptContext,
@@ -1753,7 +1764,7 @@ export class Task {
     const questionToAnswer = this.currentQuestion;
 
     if (!this.currentQuestion.internal) {
-      this.findMessageConnectors('answer-question').forEach((connector) => connector.sendAnswerQuestionMessage(determinedAnswer));
+      this.findMessageConnectors('answer-question').forEach((connector) => connector.sendAnswerQuestionMessage(determinedAnswer, questionToAnswer.questionId));
     }
     this.currentQuestion = null;
 
@@ -2574,8 +2585,48 @@ export class Task {
     return this.aiderManager.getRepoMap();
   }
 
-  public updateRepoMapFromConnector(repoMap: string): void {
-    this.aiderManager.setRepoMap(repoMap);
+  public updateRepoMapFromConnector(message: UpdateRepoMapMessage): void {
+    if (message.delta) {
+      this.aiderManager.applyRepoMapDelta(message.delta);
+    } else if (message.repoMap !== undefined) {
+      this.aiderManager.setRepoMap(message.repoMap, message.hash);
+    }
+  }
+
+  /**
+   * Fetches the diff of a commit made by Aider, or of a single file of it, from the connector.
+   * Used for commits whose diff was too large to be included in the response.
+   */
+  public requestCommitDiff(commitHash: string, path?: string): Promise<CommitDiff> {
+    const connector = this.findMessageConnectors('request-commit-diff')[0];
+    if (!connector) {
+      return Promise.reject(new Error('No connector available to provide the commit diff'));
+    }
+
+    const requestId = uuidv4();
+    return new Promise<CommitDiff>((resolve, reject) => {
+      this.commitDiffRequests.set(requestId, { chunks: [], resolve, reject });
+      connector.sendRequestCommitDiffMessage(requestId, commitHash, path);
+    });
+  }
+
+  public processCommitDiffMessage(message: CommitDiffMessage): void {
+    const request = this.commitDiffRequests.get(message.requestId);
+    if (!request) {
+      return;
+    }
+
+    request.chunks[message.index] = message.content;
+    if (!message.finished) {
+      return;
+    }
+
+    this.commitDiffRequests.delete(message.requestId);
+    if (message.error) {
+      request.reject(new Error(message.error));
+    } else {
+      request.resolve({ diff: request.chunks.join(''), truncated: !!message.truncated });
+    }
   }
 
   public openCommandOutput(command: string) {
@@ -2755,6 +2806,16 @@ export class Task {
     await this.updateContextInfo();
   }
 
+  public async addRoleContextMessages(messages: { role: MessageRole; content: string }[]) {
+    logger.debug('Adding role messages to session:', {
+      baseDir: this.project.baseDir,
+      count: messages.length,
+    });
+
+    messages.forEach(({ role, content }) => this.contextManager.addContextMessage(role, content));
+    await this.updateContextInfo();
+  }
+
   public async addContextMessage(message: ContextMessage, updateContextInfo = false) {
     this.contextManager.addContextMessage(message);
     if (updateContextInfo) {
@@ -3690,6 +3751,30 @@ export class Task {
     );
   }
 
+  public async updateAutocompletionFromConnector(message: UpdateAutocompletionMessage) {
+    if (message.delta) {
+      if (message.delta.baseVersion !== this.connectorWordsVersion) {
+        logger.warn('Autocompletion delta does not match the current words, requesting the full words', {
+          baseDir: this.project.baseDir,
+          taskId: this.taskId,
+          baseVersion: message.delta.baseVersion,
+          currentVersion: this.connectorWordsVersion,
+        });
+        this.findMessageConnectors('request-autocompletion').forEach((connector) => connector.sendRequestAutocompletionMessage());
+        return;
+      }
+      message.delta.removed.forEach((word) => this.connectorWords.delete(word));
+      message.delta.added.forEach((word) => this.connectorWords.add(word));
+    } else if (message.words) {
+      this.connectorWords = new Set(message.words);
+    } else {
+      return;
+    }
+    this.connectorWordsVersion = message.version ?? null;
+
+    await this.updateAutocompletionData(Array.from(this.connectorWords));
+  }
+
   public async updateAutocompletionData(words?: string[], force = false, useGit = true) {
     logger.debug('Updating autocompletion data', {
       baseDir: this.project.baseDir,
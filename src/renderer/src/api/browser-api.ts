@@ -4,6 +4,7 @@ import {
   AutocompletionData,
   ClearTaskData,
   CloudflareTunnelStatus,
+  CommitDiff,
   CommandOutputData,
   ContextFilesUpdatedData,
   ContextInfoData,
@@ -532,6 +533,9 @@ export class BrowserApi implements ApplicationAPI {
   getUpdatedFiles(baseDir: string, taskId: string): Promise<{ path: string; additions: number; deletions: number }[]> {
     return this.post('/get-updated-files', { projectDir: baseDir, taskId });
   }
+  requestCommitDiff(baseDir: string, taskId: string, commitHash: string, path?: string): Promise<CommitDiff> {
+    return this.post('/request-commit-diff', { projectDir: baseDir, taskId, commitHash, path });
+  }
   async generateCommitMessage(baseDir: string, taskId: string): Promise<string> {
     const res = await this.post<{ projectDir: string; taskId: string }, { message: string }>('/project/worktree/generate-commit-message', {
       projectDir: baseDir,
@@ -213,7 +213,9 @@ export const TokenUsageBar = ({ task, tokensInfo, maxInputTokens = 0, mode, upda
   const agentTokens = tokensInfo?.agent?.tokens ?? 0;
 
   const totalTokens = !AIDER_MODES.includes(mode) ? agentTokens : chatHistoryTokens + filesTotalTokens + repoMapTokens + systemMessagesTokens;
-  const tokensEstimated = !AIDER_MODES.includes(mode) ? tokensInfo?.agent?.tokensEstimated : false;
+  const tokensEstimated = !AIDER_MODES.includes(mode)
+    ? tokensInfo?.agent?.tokensEstimated
+    : Object.values(tokensInfo?.files ?? {}).some((file) => file.tokensEstimated);
   const progressPercentage = maxInputTokens > 0 ? Math.min((totalTokens / maxInputTokens) * 100, 100) : 0;
 
   return (
@@ -0,0 +1,108 @@
+import { useCallback, useMemo, useState } from 'react';
+import { HiChevronDown } from 'react-icons/hi';
+import { AnimatePresence, motion } from 'framer-motion';
+import { MdOutlineCommit } from 'react-icons/md';
+import { CommitDiff, CommitDiffFile, DiffViewMode } from '@common/types';
+import { useTranslation } from 'react-i18next';
+
+import { PierreDiffViewer } from '@/components/common/DiffViewer';
+import { useApi } from '@/contexts/ApiContext';
+import { showErrorNotification } from '@/utils/notifications';
+
+// splits the inline diff of a commit into the diffs of its files
+const splitDiff = (diff: string): Map<string, string> => {
+  const fileDiffs = new Map<string, string>();
+  for (const fileDiff of diff.split(/^(?=diff --git )/m)) {
+    const header = fileDiff.slice(0, fileDiff.indexOf('\n'));
+    const bIndex = header.lastIndexOf(' b/');
+    if (bIndex !== -1) {
+      fileDiffs.set(header.slice(bIndex + 3), fileDiff);
+    }
+  }
+  return fileDiffs;
+};
+
+type FileProps = {
+  file: CommitDiffFile;
+  commitHash: string;
+  inlineDiff?: string;
+  loadDiff: (path: string) => Promise<CommitDiff>;
+};
+
+const CommitDiffFileItem = ({ file, commitHash, inlineDiff, loadDiff }: FileProps) => {
+  const { t } = useTranslation();
+  const [isExpanded, setIsExpanded] = useState(false);
+  const [commitDiff, setCommitDiff] = useState<CommitDiff | null>(inlineDiff ? { diff: inlineDiff, truncated: false } : null);
+
+  const handleToggle = useCallback(async () => {
+    setIsExpanded((prev) => !prev);
+    if (commitDiff) {
+      return;
+    }
+    try {
+      setCommitDiff(await loadDiff(file.path));
+    } catch (error) {
+      // eslint-disable-next-line no-console
+      console.error('Failed to load commit diff:', error);
+      showErrorNotification(t('responseMessage.diffLoadFailed'));
+      setIsExpanded(false);
+    }
+  }, [commitDiff, loadDiff, file.path, t]);
+
+  return (
+    <div className="select-text bg-bg-code-block rounded-lg text-xs">
+      <button type="button" onClick={handleToggle} className="w-full flex items-center gap-2 px-3 py-2 hover:bg-bg-tertiary transition-colors">
+        <motion.div animate={{ rotate: isExpanded ? 0 : -90 }} transition={{ duration: 0.2 }}>
+          <HiChevronDown className="h-4 w-4 text-text-secondary" />
+        </motion.div>
+        <span className="text-xs font-medium text-text-primary truncate text-left flex-1">{file.path}</span>
+        {!!file.added && <span className="text-xs font-medium text-success shrink-0">+{file.added}</span>}
+        {!!file.removed && <span className="text-xs font-medium text-error shrink-0">-{file.removed}</span>}
+        <span className="text-xs text-text-secondary shrink-0 flex items-center gap-1">
+          <MdOutlineCommit className="h-3 w-3" />
+          {commitHash.substring(0, 7)}
+        </span>
+      </button>
+      <AnimatePresence initial={false}>
+        {isExpanded && commitDiff && (
+          <motion.div
+            initial={{ height: 0, opacity: 0 }}
+            animate={{ height: 'auto', opacity: 1 }}
+            exit={{ height: 0, opacity: 0 }}
+            transition={{ duration: 0.2, ease: 'easeInOut' }}
+            className="overflow-hidden"
+          >
+            <div className="px-3 pb-3 pt-0 border-t border-border-default">
+              <PierreDiffViewer udiff={commitDiff.diff} viewMode={DiffViewMode.Unified} showFilename={false} />
+              {commitDiff.truncated && <div className="pt-2 text-text-muted">{t('responseMessage.diffTruncated')}</div>}
+            </div>
+          </motion.div>
+        )}
+      </AnimatePresence>
+    </div>
+  );
+};
+
+type Props = {
+  baseDir: string;
+  taskId: string;
+  commitHash: string;
+  diffFiles: CommitDiffFile[];
+  diff?: string;
+};
+
+export const CommitDiffBlock = ({ baseDir, taskId, commitHash, diffFiles, diff }: Props) => {
+  const api = useApi();
+  const inlineDiffs = useMemo(() => (diff ? splitDiff(diff) : new Map<string, string>()), [diff]);
+
+  // diffs of large commits are not sent with the response, they are fetched per file when expanded
+  const loadDiff = useCallback((path: string) => api.requestCommitDiff(baseDir, taskId, commitHash, path), [api, baseDir, taskId, commitHash]);
+
+  return (
+    <div className="flex flex-col gap-1 mt-2">
+      {diffFiles.map((file) => (
+        <CommitDiffFileItem key={file.path} file={file} commitHash={commitHash} inlineDiff={inlineDiffs.get(file.path)} loadDiff={loadDiff} />
+      ))}
+    </div>
+  );
+};
@@ -2,12 +2,14 @@ import { clsx } from 'clsx';
 import { RiRobot2Line } from 'react-icons/ri';
 import { ResponseMessage } from '@common/types';
 
+import { CommitDiffBlock } from './CommitDiffBlock';
 import { MessageBar } from './MessageBar';
 
 import { useParsedContent } from '@/hooks/useParsedContent';
 
 type Props = {
   baseDir: string;
+  taskId: string;
   message: ResponseMessage;
   allFiles: string[];
   renderMarkdown: boolean;
@@ -21,6 +23,7 @@ type Props = {
 
 export const ResponseMessageBlock = ({
   baseDir,
+  taskId,
   message,
   allFiles,
   renderMarkdown,
@@ -52,7 +55,12 @@ export const ResponseMessageBlock = ({
         <div className="mt-[1px] relative">
           <RiRobot2Line className="text-text-muted w-4 h-4" />
         </div>
-        <div className="flex-grow-1 w-full overflow-hidden">{parsedContent}</div>
+        <div className="flex-grow-1 w-full overflow-hidden">
+          {parsedContent}
+          {message.commitHash && !!message.diffFiles?.length && (
+            <CommitDiffBlock baseDir={baseDir} taskId={taskId} commitHash={message.commitHash} diffFiles={message.diffFiles} diff={message.diff} />
+          )}
+        </div>
       </div>
       {!hideMessageBar && (
         <MessageBar
@@ -92,7 +92,19 @@ export const useTaskResponseHandlers = (baseDir: string, taskId: string) => {
   );
 
   const handleResponseCompleted = useCallback(
-    ({ messageId, usageReport, content, reasoning, reflectedMessage, promptContext, timestamp }: ResponseCompletedData) => {
+    ({
+      messageId,
+      usageReport,
+      content,
+      reasoning,
+      reflectedMessage,
+      promptContext,
+      timestamp,
+      commitHash,
+      commitMessage,
+      diff,
+      diffFiles,
+    }: ResponseCompletedData) => {
       touchTaskActivity(taskId);
       const processingMessage = processingResponseMessageMap.get(taskId);
 
@@ -110,6 +122,10 @@ export const useTaskResponseHandlers = (baseDir: string, taskId: string) => {
                     usageReport,
                     promptContext,
                     timestamp,
+                    commitHash,
+                    commitMessage,
+                    diff,
+                    diffFiles,
                   }
                 : message,
             );
@@ -135,6 +151,10 @@ export const useTaskResponseHandlers = (baseDir: string, taskId: string) => {
               promptContext,
               finished: true,
               timestamp,
+              commitHash,
+              commitMessage,
+              diff,
+              diffFiles,
             };
             messages.push(newResponseMessage);
 
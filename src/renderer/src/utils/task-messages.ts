@@ -43,6 +43,10 @@ const convertResponse = (data: ResponseCompletedData): Message[] => {
     usageReport: data.usageReport,
     promptContext: data.promptContext,
     finished: true,
+    commitHash: data.commitHash,
+    commitMessage: data.commitMessage,
+    diff: data.diff,
+    diffFiles: data.diffFiles,
     timestamp: data.timestamp,
   };
   messages.push(response);